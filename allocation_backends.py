@@ -0,0 +1,148 @@
+"""
+Compute backends for the contribution stage of the allocation.
+
+Each backend turns the eligible shops' month columns into historical
+totals, daily averages and contribution %. All backends round with NumPy
+(round-half-to-even, like pandas) and sum the month columns left to right,
+so they agree to the paisa.
+
+- pandas: Reference implementation (Series arithmetic)
+- numpy: Plain arrays, no intermediate Series
+- polars: Optional; only available when polars is installed
+"""
+
+import numpy as np
+
+# Default backend per eligible shop count: first matching upper bound wins.
+# From backend_benchmark.py (contribution stage, 7 months, best of N):
+#   shops      100    1k     10k    100k    300k     1M
+#   pandas   1.6ms  1.7ms  2.6ms  14.2ms  42.9ms  150ms
+#   numpy    1.3ms  1.3ms  1.8ms   9.6ms  31.7ms   97ms
+#   polars   1.5ms  1.5ms  2.0ms  11.1ms  32.2ms   94ms
+# NumPy wins up to a few hundred thousand shops; Polars' row fold only
+# overtakes the copy out of pandas around 1M shops (2-4%, within the
+# run-to-run spread near 300k). Without polars installed NumPy is used.
+AUTO_BACKEND_THRESHOLDS = (
+    (500_000, 'numpy'),
+    (None, 'polars'),
+)
+
+
+def pandas_contributions(shops_only, month_cols, day_divisor):
+    """
+    Contribution stage with pandas Series operations.
+
+    day_divisor: Scalar historical days, or array of days per shop (NaN
+    where a shop has no trading days).
+
+    Returns: Dict of numpy arrays (total_sales, daily_average, contribution)
+    plus company_daily_average
+    """
+    total_sales = shops_only[month_cols].sum(axis=1)
+    daily_average = (total_sales / day_divisor).fillna(0).round(2)
+    company_daily_average = daily_average.sum()
+    contribution = (daily_average / company_daily_average * 100).round(2)
+
+    return {
+        'total_sales': total_sales.to_numpy(dtype=float),
+        'daily_average': daily_average.to_numpy(dtype=float),
+        'contribution': contribution.to_numpy(dtype=float),
+        'company_daily_average': company_daily_average,
+    }
+
+
+def finish_contributions(total_sales, day_divisor):
+    """
+    Daily averages, company average and contribution % from row totals,
+    rounded exactly like the pandas reference.
+
+    Returns: Same dict as pandas_contributions
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        daily_average = np.round(np.nan_to_num(total_sales / day_divisor, nan=0.0), 2)
+        company_daily_average = daily_average.sum()
+        contribution = np.round(daily_average / company_daily_average * 100, 2)
+
+    return {
+        'total_sales': total_sales,
+        'daily_average': daily_average,
+        'contribution': contribution,
+        'company_daily_average': company_daily_average,
+    }
+
+
+def numpy_contributions(shops_only, month_cols, day_divisor):
+    """
+    Contribution stage on plain NumPy arrays.
+
+    Returns: Same dict as pandas_contributions
+    """
+    # Months × shops, reduced along axis 0: adds the months left to right,
+    # exactly like pandas' row sum (axis=1 would use pairwise summation)
+    sales = np.zeros((max(len(month_cols), 1), len(shops_only)))
+    for row, col in enumerate(month_cols):
+        sales[row] = shops_only[col].to_numpy(dtype=float)
+    return finish_contributions(sales.sum(axis=0), day_divisor)
+
+
+def polars_contributions(shops_only, month_cols, day_divisor):
+    """
+    Contribution stage with the row sums done in Polars.
+
+    Rounding and the company average stay in NumPy: Polars' rounding mode
+    differs between versions and would break paisa-level parity.
+
+    Returns: Same dict as pandas_contributions
+    """
+    import polars as pl
+
+    frame = pl.DataFrame({
+        str(row): shops_only[col].to_numpy(dtype=float) for row, col in enumerate(month_cols)
+    })
+    # fold adds the columns left to right, matching pandas
+    total_sales = frame.select(
+        pl.fold(pl.lit(0.0), lambda acc, col: acc + col, pl.all()).alias('total')
+    )['total'].to_numpy().astype(float) if month_cols else np.zeros(len(shops_only))
+
+    return finish_contributions(total_sales, day_divisor)
+
+
+BACKENDS = {
+    'pandas': pandas_contributions,
+    'numpy': numpy_contributions,
+    'polars': polars_contributions,
+}
+
+
+def available_backends():
+    """Backend names usable in this environment, in BACKENDS order."""
+    names = []
+    for name in BACKENDS:
+        if name == 'polars':
+            try:
+                import polars  # noqa: F401
+            except ImportError:
+                continue
+        names.append(name)
+    return names
+
+
+def select_backend(backend, shop_count):
+    """
+    Resolve a backend name ('auto' picks by eligible shop count).
+
+    Returns: (backend_name, contribution_function, error_message)
+    """
+    if backend in (None, 'auto'):
+        backend = next(
+            name for limit, name in AUTO_BACKEND_THRESHOLDS if limit is None or shop_count <= limit
+        )
+        if backend not in available_backends():
+            backend = 'numpy'
+
+    if backend not in BACKENDS:
+        return None, None, f"❌ Unknown compute backend: {backend}. Choose from: {', '.join(BACKENDS)}"
+    if backend not in available_backends():
+        return None, None, f"❌ Compute backend '{backend}' is not installed (pip install {backend})"
+
+    return backend, BACKENDS[backend], None
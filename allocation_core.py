@@ -0,0 +1,1367 @@
+"""
+Core calculation, validation and export logic for the target allocation app.
+
+This module has no Streamlit dependency so it can be imported by scripts,
+notebooks and batch jobs without starting the UI. Excel engines (openpyxl,
+xlsxwriter) are only imported by pandas when a workbook is read or written.
+"""
+
+import calendar
+import hashlib
+import logging
+import re
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from allocation_backends import select_backend
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================================
+# UTILITY FUNCTIONS
+# ============================================================================
+
+def extract_month_year(column_name):
+    """Extract month and year from column name."""
+    # Pattern: Month YYYY (e.g., "July 2025", "Jan 2026")
+    pattern = r'([A-Za-z]+)\s+(\d{4})'
+    match = re.search(pattern, column_name)
+    if match:
+        return True
+    return False
+
+
+def parse_month_year(month_str):
+    """
+    Parse month string to datetime object.
+    
+    Format: "July 2025" or "Jul 2025" → datetime(2025, 7, 1)
+    
+    Returns: (datetime_obj, is_valid, error_message)
+    """
+    try:
+        # Try full month name first (July)
+        dt = datetime.strptime(month_str.strip(), "%B %Y")
+        return dt, True, None
+    except ValueError:
+        try:
+            # Try abbreviated month name (Jul)
+            dt = datetime.strptime(month_str.strip(), "%b %Y")
+            return dt, True, None
+        except ValueError:
+            return None, False, f"Invalid date format: '{month_str}'. Use 'July 2025' or 'Jul 2025'"
+
+
+def get_days_in_month(year, month):
+    """
+    Get the actual number of days in a given month.
+    
+    Handles: 28, 29 (leap year), 30, 31 days
+    Returns: (days_count, is_leap_year)
+    """
+    days = calendar.monthrange(year, month)[1]
+    is_leap = calendar.isleap(year)
+    return days, is_leap
+
+
+def validate_target_month_format(target_col_name):
+    """
+    Extract and validate target month from column name.
+    
+    Example: "Mar 2026 Target" → (datetime(2026, 3, 1), True, None)
+    
+    Returns: (datetime_obj, is_valid, error_message)
+    """
+    if not target_col_name:
+        return None, False, "Target column not found"
+    
+    # Extract month and year (remove "Target" suffix)
+    month_year_str = target_col_name.replace("Target", "").strip()
+    
+    dt, is_valid, error = parse_month_year(month_year_str)
+    return dt, is_valid, error
+
+
+def calculate_total_historical_days(month_columns):
+    """
+    Calculate total days across all historical months.
+    
+    Example: ["July 2025", "Aug 2025", "Sep 2025"]
+    Returns: 31 + 31 + 30 = 92 days
+    
+    Returns: (total_days, month_details, is_valid, error_message)
+    """
+    total_days = 0
+    month_details = []
+    
+    for col in month_columns:
+        dt, is_valid, error = parse_month_year(col)
+        
+        if not is_valid:
+            return 0, [], False, error
+        
+        days, is_leap = get_days_in_month(dt.year, dt.month)
+        total_days += days
+        month_details.append({
+            'month': col,
+            'days': days,
+            'is_leap': is_leap,
+            'date': dt
+        })
+    
+    return total_days, month_details, True, None
+
+
+def validate_month_sequence(historical_months, target_month_dt):
+    """
+    Ensure target month is AFTER last historical month.
+    
+    Returns: (is_valid, error_message)
+    """
+    if not historical_months:
+        return False, "No historical months found"
+    
+    # Parse last historical month
+    last_col = historical_months[-1]
+    last_dt, is_valid, error = parse_month_year(last_col)
+    
+    if not is_valid:
+        return False, error
+    
+    # Check if target is after last historical month
+    if target_month_dt <= last_dt:
+        return False, f"Target month {target_month_dt.strftime('%b %Y')} must be AFTER last historical month {last_dt.strftime('%b %Y')}"
+    
+    return True, None
+
+
+def validate_no_duplicate_months(month_columns):
+    """
+    Ensure no duplicate month columns.
+    
+    Returns: (is_valid, error_message, duplicates)
+    """
+    seen = set()
+    duplicates = []
+    
+    for col in month_columns:
+        dt, is_valid, error = parse_month_year(col)
+        if is_valid:
+            key = dt.strftime("%b %Y")
+            if key in seen:
+                duplicates.append(col)
+            seen.add(key)
+    
+    if duplicates:
+        return False, f"Duplicate months found: {duplicates}", duplicates
+    
+    return True, None, []
+
+
+def classify_columns(df):
+    """
+    Classify columns with enhanced validation.
+    
+    Returns:
+    - outlet_col: First column (outlet names)
+    - month_cols: Columns with actual monthly data (no "Target")
+    - target_col: Column containing "Target"
+    - validation_errors: List of validation issues
+    """
+    columns = df.columns.tolist()
+    outlet_col = columns[0]
+    month_cols = []
+    target_col = None
+    validation_errors = []
+    
+    # Classify columns
+    for col in columns[1:]:
+        if 'target' in col.lower():
+            target_col = col
+        elif extract_month_year(col):
+            month_cols.append(col)
+    
+    # Validation checks
+    if not target_col:
+        validation_errors.append("⚠️ No target column found (column should contain 'Target')")
+    
+    if not month_cols:
+        validation_errors.append("❌ No historical months found (format: 'Month YYYY')")
+    
+    if month_cols:
+        # Check for duplicate months
+        is_valid, error, dups = validate_no_duplicate_months(month_cols)
+        if not is_valid:
+            validation_errors.append(f"❌ {error}")
+    
+    if month_cols and target_col:
+        # Check month sequence
+        target_dt, target_valid, target_error = validate_target_month_format(target_col)
+        if target_valid:
+            is_valid, seq_error = validate_month_sequence(month_cols, target_dt)
+            if not is_valid:
+                validation_errors.append(f"❌ {seq_error}")
+    
+    return outlet_col, month_cols, target_col, validation_errors
+
+
+def normalize_outlet_keys(values):
+    """
+    Normalize outlet names to comparison keys (stripped, upper case).
+    
+    Empty/missing names become '' so they never match a real outlet.
+    """
+    return values.where(values.notna(), '').astype(str).str.strip().str.upper()
+
+
+def build_outlet_index(df, outlet_col):
+    """
+    Build the normalized outlet-key column and hash index once per upload.
+    
+    Returns dict:
+    - keys: Series of normalized keys aligned with df.index
+    - rows: Dict key → list of row labels
+    - total_mask: Boolean Series marking TOTAL rows
+    - duplicates: Outlet keys that appear on more than one row
+    """
+    keys = normalize_outlet_keys(df[outlet_col])
+    rows = {key: list(labels) for key, labels in keys.groupby(keys, sort=False).groups.items()}
+    duplicates = [
+        key for key, labels in rows.items()
+        if len(labels) > 1 and key not in ('', 'TOTAL')
+    ]
+    
+    return {
+        'keys': keys,
+        'rows': rows,
+        'total_mask': keys == 'TOTAL',
+        'duplicates': duplicates,
+    }
+
+
+def validate_data(df, outlet_col, month_cols):
+    """Validate that data is numeric and properly formatted."""
+    errors = []
+    
+    # Check for empty outlet names
+    if df[outlet_col].isna().any():
+        errors.append("⚠️ Found empty outlet names")
+    
+    # Check if month columns contain numeric data
+    for col in month_cols:
+        if not pd.api.types.is_numeric_dtype(df[col]):
+            try:
+                pd.to_numeric(df[col], errors='coerce')
+            except:
+                errors.append(f"⚠️ Column '{col}' contains non-numeric values")
+    
+    return errors
+
+
+def validate_excel_structure(df, outlet_col_name="OUTLET NAME", outlet_index=None,
+                             excluded_outlets=None):
+    """
+    Comprehensive validation of Excel file structure BEFORE processing.
+    
+    Checks:
+    - OUTLET NAME column exists
+    - TOTAL row exists
+    - Excluded outlets exist (DIP PLANT by default)
+    - At least 1 eligible shop exists
+    - No empty outlet names
+    
+    outlet_index: Optional result of build_outlet_index() for this df.
+    excluded_outlets: Outlet names excluded from allocation.
+    
+    Returns: (is_valid, list_of_errors)
+    """
+    errors = []
+    
+    # Check 1: OUTLET NAME column exists
+    if outlet_col_name not in df.columns:
+        errors.append(f"❌ Column '{outlet_col_name}' not found. First column must be '{outlet_col_name}'")
+        return False, errors
+    
+    if outlet_index is None:
+        outlet_index = build_outlet_index(df, outlet_col_name)
+    outlet_rows = outlet_index['rows']
+    if excluded_outlets is None:
+        excluded_outlets = DEFAULT_EXCLUDED_OUTLETS
+    excluded = build_allocation_rules(excluded_outlets)['excluded']
+    
+    # Check 2: TOTAL row exists
+    if 'TOTAL' not in outlet_rows:
+        errors.append("❌ TOTAL row not found. Last row must contain 'TOTAL' in outlet column")
+    
+    # Check 3: Excluded outlets exist
+    for key, name in excluded.items():
+        if key not in outlet_rows:
+            errors.append(f"❌ {name} outlet not found. Must have outlet named '{name}'")
+    
+    # Check 4: At least 1 eligible outlet
+    total_rows = int((~outlet_index['total_mask']).sum())
+    excluded_rows = sum(len(outlet_rows.get(key, [])) for key in excluded)
+    eligible_outlets = total_rows - excluded_rows
+    if eligible_outlets <= 0:
+        errors.append(f"❌ No eligible outlets found. Need at least 1 shop (found {total_rows} total outlets)")
+    
+    # Check 5: No empty outlet names
+    if '' in outlet_rows:
+        errors.append("❌ Found empty outlet names. All outlets must have names.")
+    
+    return len(errors) == 0, errors
+
+
+# Outlets excluded from allocation unless the user overrides the list
+DEFAULT_EXCLUDED_OUTLETS = ('DIP PLANT',)
+
+# Rules file header → internal limit column
+RULE_COLUMNS = {
+    'MIN TARGET': 'min_target',
+    'MAX TARGET': 'max_target',
+    'MIN GROWTH %': 'min_growth_pct',
+    'MAX GROWTH %': 'max_growth_pct',
+}
+
+TRUTHY_VALUES = {'YES', 'Y', 'TRUE', '1', 'X'}
+
+
+def build_allocation_rules(excluded_outlets=DEFAULT_EXCLUDED_OUTLETS, limits=None):
+    """
+    Build the rules dict consumed by calculate_allocations.
+    
+    Returns dict:
+    - excluded: Dict normalized key → display name of excluded outlets
+    - limits: DataFrame indexed by outlet key with RULE_COLUMNS values (or None)
+    """
+    names = pd.Series([name for name in excluded_outlets if str(name).strip()], dtype=object)
+    excluded = dict(zip(normalize_outlet_keys(names), names.astype(str).str.strip()))
+    
+    if limits is not None and limits.empty:
+        limits = None
+    
+    return {'excluded': excluded, 'limits': limits}
+
+
+def parse_allocation_rules(rules_df, excluded_outlets=DEFAULT_EXCLUDED_OUTLETS):
+    """
+    Parse an uploaded rules sheet into allocation rules.
+    
+    Expected columns (all optional except the first):
+    OUTLET NAME | MIN TARGET | MAX TARGET | MIN GROWTH % | MAX GROWTH % | EXCLUDE
+    
+    Growth % is measured against the outlet's historical daily average
+    scaled to the days in the target month.
+    
+    Returns: (rules, list_of_errors)
+    """
+    errors = []
+    rules_df = rules_df.copy()
+    rules_df.columns = [str(col).strip().upper() for col in rules_df.columns]
+    outlet_col = rules_df.columns[0]
+    
+    keys = normalize_outlet_keys(rules_df[outlet_col])
+    rules_df = rules_df[keys != '']
+    keys = keys[keys != '']
+    
+    duplicates = keys[keys.duplicated()].unique().tolist()
+    if duplicates:
+        errors.append(f"❌ Duplicate outlets in rules file: {', '.join(duplicates[:10])}")
+    
+    excluded = list(excluded_outlets)
+    if 'EXCLUDE' in rules_df.columns:
+        flags = normalize_outlet_keys(rules_df['EXCLUDE']).isin(TRUTHY_VALUES)
+        excluded += rules_df.loc[flags, outlet_col].astype(str).str.strip().tolist()
+    
+    limit_cols = [col for col in RULE_COLUMNS if col in rules_df.columns]
+    limits = None
+    if limit_cols:
+        limits = rules_df[limit_cols].apply(pd.to_numeric, errors='coerce')
+        limits.columns = [RULE_COLUMNS[col] for col in limit_cols]
+        limits = limits.reindex(columns=list(RULE_COLUMNS.values()))
+        limits.index = keys
+        limits = limits[limits.notna().any(axis=1)]
+        limits = limits[~limits.index.duplicated()]
+        
+        if (limits[['min_target', 'max_target']] < 0).any().any():
+            errors.append("❌ MIN TARGET / MAX TARGET cannot be negative")
+        inverted = limits['min_target'] > limits['max_target']
+        if inverted.any():
+            errors.append(
+                f"❌ MIN TARGET exceeds MAX TARGET for: {', '.join(limits.index[inverted][:10])}"
+            )
+    
+    return build_allocation_rules(excluded, limits), errors
+
+
+def water_fill_allocation(weights, total, lower=None, upper=None):
+    """
+    Split a total proportionally to weights subject to per-item bounds.
+    
+    Finds the scale λ with Σ clip(λ·weight, lower, upper) = total. Items
+    pushed to a bound keep it and the remainder is shared proportionally by
+    the others. The sum is piecewise linear in λ with breakpoints at
+    lower/weight and upper/weight, so sorting the breakpoints once solves it
+    in O(N log N) without iterating.
+    
+    Returns: (allocations, is_valid, error_message)
+    """
+    weights = np.asarray(weights, dtype=float)
+    count = len(weights)
+    lower = np.zeros(count) if lower is None else np.nan_to_num(np.asarray(lower, dtype=float), nan=0.0)
+    upper = np.full(count, np.inf) if upper is None else np.nan_to_num(
+        np.asarray(upper, dtype=float), nan=np.inf, posinf=np.inf
+    )
+    
+    if np.any(lower > upper):
+        return None, False, "❌ Minimum target exceeds maximum target for at least one outlet"
+    if lower.sum() > total + 0.01:
+        return None, False, (
+            f"❌ Minimum targets add up to ₨ {lower.sum():,.2f}, more than the target ₨ {total:,.2f}"
+        )
+    if upper.sum() < total - 0.01:
+        return None, False, (
+            f"❌ Maximum targets add up to ₨ {upper.sum():,.2f}, less than the target ₨ {total:,.2f}"
+        )
+    
+    active = weights > 0
+    safe_weights = np.where(active, weights, 1.0)
+    # λ at which each item leaves its floor / reaches its cap (never for zero weights)
+    leave_floor = np.where(active, lower / safe_weights, np.inf)
+    reach_cap = np.where(active, upper / safe_weights, np.inf)
+    
+    order_floor = np.argsort(leave_floor, kind='stable')
+    floor_sorted = leave_floor[order_floor]
+    cum_lower = np.concatenate(([0.0], np.cumsum(lower[order_floor])))
+    cum_weight_floor = np.concatenate(([0.0], np.cumsum(weights[order_floor])))
+    
+    order_cap = np.argsort(reach_cap, kind='stable')
+    cap_sorted = reach_cap[order_cap]
+    finite_caps = np.isfinite(cap_sorted)
+    cum_upper = np.concatenate(([0.0], np.cumsum(np.where(finite_caps, upper[order_cap], 0.0))))
+    cum_weight_cap = np.concatenate(([0.0], np.cumsum(weights[order_cap])))
+    
+    def allocated_sum(scale):
+        above_floor = np.searchsorted(floor_sorted, scale, side='right')
+        at_cap = np.searchsorted(cap_sorted, scale, side='left')
+        slope = cum_weight_floor[above_floor] - cum_weight_cap[at_cap]
+        fixed = (lower.sum() - cum_lower[above_floor]) + cum_upper[at_cap]
+        return fixed + scale * slope, slope
+    
+    breakpoints = np.concatenate(([0.0], leave_floor, reach_cap))
+    breakpoints = np.unique(breakpoints[np.isfinite(breakpoints)])
+    sums, _ = allocated_sum(breakpoints)
+    
+    # First breakpoint where the allocated sum reaches the total
+    segment = int(np.searchsorted(sums, total, side='left'))
+    if segment == 0:
+        scale = 0.0
+    elif segment < len(breakpoints):
+        left, right = breakpoints[segment - 1], breakpoints[segment]
+        scale = left + (total - sums[segment - 1]) * (right - left) / (sums[segment] - sums[segment - 1])
+    else:
+        # Beyond the last breakpoint only uncapped items keep growing
+        last = breakpoints[-1]
+        _, slope = allocated_sum(np.array([last + 1.0]))
+        if slope[0] <= 0:
+            return None, False, "❌ No outlet can absorb the remaining target (all outlets capped)"
+        scale = last + (total - sums[-1]) / slope[0]
+    
+    allocations = np.where(active, np.clip(scale * weights, lower, upper), lower)
+    return allocations, True, None
+
+
+CONTRIBUTION_COLUMNS = ['Historical_Total_Sales', 'Historical_Daily_Average', 'Contribution_%']
+RESULT_COLUMNS = CONTRIBUTION_COLUMNS + ['Allocated_Monthly_Target', 'Allocated_Daily_Target']
+
+
+def prepare_allocation_base(df, outlet_col, month_cols, contributions=None, outlet_index=None,
+                            rules=None, outlet_days=None, backend='auto'):
+    """
+    Shared, target-independent part of the allocation (steps 2-9).
+    
+    Removes the TOTAL row, separates excluded outlets and computes the
+    historical totals, daily averages and contribution % of eligible shops.
+    
+    outlet_days: Optional Series (aligned to df.index) of days each outlet
+    actually traded. When given, daily averages divide by these instead of
+    the calendar days of the month columns.
+    
+    backend: Compute backend for steps 6-9 ('auto', 'pandas', 'numpy',
+    'polars'); see allocation_backends.
+    
+    Returns: (base_dict, error_message)
+    """
+    if rules is None:
+        rules = build_allocation_rules()
+    
+    # Calculate total historical days
+    total_hist_days, month_details, days_valid, days_error = calculate_total_historical_days(month_cols)
+    if not days_valid:
+        return None, days_error
+    
+    if outlet_index is None:
+        outlet_index = build_outlet_index(df, outlet_col)
+    
+    # ========== STEP 2: Filter - Remove TOTAL Row ==========
+    outlet_mask = ~outlet_index['total_mask']
+    data_only = df[outlet_mask].copy()
+    outlet_keys = outlet_index['keys'][outlet_mask]
+    
+    # ========== STEP 3: Excluded Outlet Detection & Validation ==========
+    excluded = rules['excluded']
+    missing = [name for key, name in excluded.items() if key not in outlet_index['rows']]
+    if missing:
+        return None, '❌ ' + ', '.join(f'{name} outlet not found in data' for name in missing)
+    
+    excluded_mask = outlet_keys.isin(list(excluded))
+    
+    # ========== STEP 4: Validate Eligible Shop Count (Dynamic) ==========
+    # Total outlets minus excluded outlets
+    total_outlets = len(data_only)
+    eligible_shops_count = total_outlets - int(excluded_mask.sum())
+    
+    if eligible_shops_count <= 0:
+        return None, f'❌ No eligible shops found. Total outlets: {total_outlets}'
+    
+    logger.debug(
+        "Allocation base: %d outlets, %d eligible shops, %d excluded (%s)",
+        total_outlets, eligible_shops_count, int(excluded_mask.sum()), ', '.join(excluded.values())
+    )
+    
+    # ========== STEP 5: Separate Excluded Outlets and Calculate for Others ==========
+    shops_only = data_only[~excluded_mask].copy()
+    
+    # Convert to numeric
+    for col in month_cols:
+        shops_only[col] = pd.to_numeric(shops_only[col], errors='coerce').fillna(0)
+    
+    backend_name, compute_contributions, backend_error = select_backend(backend, eligible_shops_count)
+    if backend_name is None:
+        return None, backend_error
+    
+    if contributions is not None:
+        # Reuse contribution vectors computed earlier for the same data
+        shops_only[CONTRIBUTION_COLUMNS] = contributions.loc[shops_only.index, CONTRIBUTION_COLUMNS]
+        company_daily_average = shops_only['Historical_Daily_Average'].sum()
+    else:
+        # Days behind each shop's daily average: calendar days of the month
+        # columns, or real trading days per outlet (transaction uploads;
+        # NaN where an outlet never traded, which gives a 0 average)
+        if outlet_days is not None:
+            shop_days = pd.to_numeric(outlet_days.reindex(shops_only.index), errors='coerce').fillna(0)
+            day_divisor = shop_days.where(shop_days > 0).to_numpy(dtype=float)
+        else:
+            day_divisor = total_hist_days
+        
+        # ========== STEPS 6-9: Historical Sales, Daily Averages, Company Average, Contribution % ==========
+        computed = compute_contributions(shops_only, month_cols, day_divisor)
+        company_daily_average = computed['company_daily_average']
+        
+        if company_daily_average <= 0:
+            return None, '❌ Company daily average is zero. Check your data.'
+        
+        shops_only['Historical_Total_Sales'] = computed['total_sales']
+        shops_only['Historical_Daily_Average'] = computed['daily_average']
+        shops_only['Contribution_%'] = computed['contribution']
+    
+    # Per-outlet limits joined on the normalized outlet key
+    shop_limits = None
+    if rules['limits'] is not None:
+        shop_limits = rules['limits'].reindex(outlet_keys[~excluded_mask].to_numpy())
+        if shop_limits.notna().to_numpy().any():
+            shop_limits.index = shops_only.index
+        else:
+            shop_limits = None
+    
+    return {
+        'data_only': data_only,
+        'shops_only': shops_only,
+        'shop_limits': shop_limits,
+        'excluded_names': list(excluded.values()),
+        'eligible_shops_count': eligible_shops_count,
+        'company_daily_average': company_daily_average,
+        'total_historical_days': total_hist_days,
+        'month_details': month_details,
+        'backend': backend_name,
+    }, None
+
+
+def round_to_total(allocations, total, adjustable=None):
+    """
+    Round allocations to the paisa so they add up exactly to total.
+    
+    Largest remainder: every amount is floored to the paisa and the missing
+    paisas go one each to the amounts with the largest remainders, preferring
+    adjustable items (not held at a cap). No amount moves by more than one
+    paisa, so none can go negative.
+    
+    Returns: Array of rounded allocations
+    """
+    paisas = np.asarray(allocations, dtype=float) * 100
+    floored = np.floor(paisas)
+    missing = int(round(total * 100 - floored.sum()))
+    if missing <= 0:
+        return floored / 100
+    
+    adjustable = np.ones(len(paisas), dtype=bool) if adjustable is None else np.asarray(adjustable)
+    # Adjustable items first, then largest remainder first
+    order = np.lexsort((floored - paisas, ~adjustable))
+    floored[order[:missing]] += 1
+    return floored / 100
+
+
+def allocate_target_matrix(shops_only, outlet_col, target_amounts, target_days, shop_limits=None):
+    """
+    Allocate one or more monthly targets in a single outlets × months pass.
+    
+    Outlets are weighted by their historical daily average. Without limits
+    every month is one broadcast of the weight shares; with limits each month
+    is solved by water_fill_allocation, since growth limits depend on the
+    days in that month. Amounts are rounded with round_to_total.
+    
+    Returns dict (arrays are outlets × months):
+    - monthly: Allocated monthly targets (sum to each target exactly)
+    - daily: Allocated daily targets
+    - constraints: Floor/Cap labels
+    - differences: Residual the rounding adjustment absorbed per month
+    Or (None, error_message) on failure.
+    """
+    amounts = np.asarray(target_amounts, dtype=float)
+    days = np.asarray(target_days, dtype=float)
+    shop_count, month_count = len(shops_only), len(amounts)
+    constraints = np.full((shop_count, month_count), '', dtype=object)
+    
+    # Both paths weight by the daily averages (rounded to the paisa by the
+    # backends), not by the 2 dp Contribution_%, so a rule that binds no
+    # outlet leaves the allocation unchanged
+    weights = shops_only['Historical_Daily_Average'].to_numpy(dtype=float)
+    allocations = np.zeros((shop_count, month_count))
+    
+    if shop_limits is None:
+        allocations[:] = weights[:, None] / weights.sum() * amounts[None, :]
+    else:
+        for month in range(month_count):
+            # Floors/caps in PKR; growth limits relative to the outlet's run rate
+            run_rate = weights * days[month]
+            lower = np.fmax(
+                shop_limits['min_target'].to_numpy(),
+                run_rate * (1 + shop_limits['min_growth_pct'].to_numpy() / 100)
+            ).clip(min=0)
+            upper = np.fmin(
+                shop_limits['max_target'].to_numpy(),
+                run_rate * (1 + shop_limits['max_growth_pct'].to_numpy() / 100)
+            )
+            
+            inverted = lower > upper
+            if inverted.any():
+                names = shops_only.loc[inverted, outlet_col].astype(str).tolist()
+                return None, f"❌ Minimum exceeds maximum target for: {', '.join(names[:10])}"
+            
+            month_allocations, fill_valid, fill_error = water_fill_allocation(
+                weights, amounts[month], lower, upper
+            )
+            if not fill_valid:
+                return None, fill_error
+            
+            allocations[:, month] = month_allocations
+            at_floor = ~np.isnan(lower) & (month_allocations <= lower + 0.005)
+            at_cap = ~np.isnan(upper) & (month_allocations >= upper - 0.005)
+            constraints[at_floor, month] = 'Floor'
+            constraints[at_cap, month] = 'Cap'
+    
+    # Rounding adjustment: what rounding each outlet on its own would miss
+    differences = amounts - np.round(allocations, 2).sum(axis=0)
+    monthly = np.column_stack([
+        round_to_total(allocations[:, month], amounts[month], constraints[:, month] != 'Cap')
+        for month in range(month_count)
+    ])
+    
+    daily = np.round(monthly / days[None, :], 2)
+    
+    return {
+        'monthly': monthly,
+        'daily': daily,
+        'constraints': constraints,
+        'differences': differences,
+    }, None
+
+
+def calculate_allocations(df, outlet_col, month_cols, target_col, new_target, contributions=None,
+                          outlet_index=None, rules=None, outlet_days=None, backend='auto'):
+    """
+    Calculate day-aware target allocations for eligible shops ONLY.
+    
+    BUSINESS RULE: Excluded outlets (DIP PLANT by default) get no allocation.
+    
+    Steps:
+    1. Validate excluded outlets exist
+    2. Validate at least one other shop exists
+    3. Remove TOTAL row
+    4. Temporarily remove excluded outlets for calculations
+    5. Calculate daily averages and contributions for eligible shops
+    6. Allocate full target ONLY among eligible shops, honouring any
+       per-outlet floors and caps
+    7. Reinsert excluded outlets with 0 allocation
+    
+    contributions: Optional DataFrame with CONTRIBUTION_COLUMNS from a
+    previous run on the same data and exclusions. Steps 6-9 are skipped
+    when provided.
+    
+    outlet_index: Optional result of build_outlet_index() for this df.
+    
+    rules: Optional result of build_allocation_rules()/parse_allocation_rules().
+    Defaults to excluding DIP PLANT with no per-outlet limits.
+    
+    outlet_days: Optional Series of trading days per outlet row (see
+    transaction_ingest.aggregate_transactions).
+    
+    backend: Compute backend name, or 'auto' to pick by shop count.
+    
+    Returns:
+    - result_df: DataFrame with all calculations
+    - metadata: Dict with calculation details
+    - validation: Dict with validation results
+    """
+    # ========== STEP 1: Parse Target Month ==========
+    target_dt, target_valid, target_error = validate_target_month_format(target_col)
+    if not target_valid:
+        return None, {}, {'success': False, 'error': target_error}
+    
+    target_days, target_is_leap = get_days_in_month(target_dt.year, target_dt.month)
+    
+    # ========== STEPS 2-9: Shared Contribution Base ==========
+    base, base_error = prepare_allocation_base(
+        df, outlet_col, month_cols, contributions, outlet_index, rules, outlet_days, backend
+    )
+    if base is None:
+        return None, {}, {'success': False, 'error': base_error}
+    
+    shops_only = base['shops_only']
+    
+    # ========== STEPS 10-12: Allocate, Daily Target & Rounding Adjustment ==========
+    allocation, allocation_error = allocate_target_matrix(
+        shops_only, outlet_col, [new_target], [target_days], base['shop_limits']
+    )
+    if allocation is None:
+        return None, {}, {'success': False, 'error': allocation_error}
+    
+    shops_only['Allocated_Monthly_Target'] = allocation['monthly'][:, 0]
+    shops_only['Allocated_Daily_Target'] = allocation['daily'][:, 0]
+    shops_only['Constraint_Applied'] = allocation['constraints'][:, 0]
+    allocation_difference = allocation['differences'][0]
+    
+    # Final validation
+    final_total_shops = shops_only['Allocated_Monthly_Target'].sum()
+    validation_passed = abs(final_total_shops - new_target) < 0.01
+    
+    # ========== STEP 13: Reconstruct Working DataFrame with Excluded Outlets ==========
+    # Create result with all data
+    working_df = base['data_only']
+    
+    # Convert to numeric for excluded rows as well (needed for output)
+    for col in month_cols:
+        working_df[col] = pd.to_numeric(working_df[col], errors='coerce').fillna(0)
+    
+    # Initialize calculation columns (excluded outlets stay at 0)
+    for col in RESULT_COLUMNS:
+        working_df[col] = 0.0
+    working_df['Constraint_Applied'] = 'Excluded'
+    
+    # Fill in values for eligible shops (dynamic count)
+    working_df.loc[shops_only.index, RESULT_COLUMNS + ['Constraint_Applied']] = (
+        shops_only[RESULT_COLUMNS + ['Constraint_Applied']]
+    )
+    
+    # ========== STEP 14: Prepare Metadata ==========
+    excluded_names = base['excluded_names']
+    metadata = {
+        'target_month': target_dt.strftime('%b %Y'),
+        'target_days': target_days,
+        'target_is_leap': target_is_leap,
+        'historical_months': [m['month'] for m in base['month_details']],
+        'total_historical_days': base['total_historical_days'],
+        'eligible_shops_count': base['eligible_shops_count'],
+        'company_total_sales': shops_only['Historical_Total_Sales'].sum(),
+        'company_daily_average': round(base['company_daily_average'], 2),
+        'entered_target': new_target,
+        'final_allocated': round(final_total_shops, 2),
+        'rounding_adjustment': round(allocation_difference, 2),
+        'excluded_outlets': excluded_names,
+        'constrained_shops_count': int((shops_only['Constraint_Applied'] != '').sum()),
+        'exclusion_note': f"{', '.join(excluded_names) or 'No outlets'} excluded per business rule (allocation = 0)",
+        'compute_backend': base['backend'],
+    }
+    
+    validation_result = {
+        'success': True,
+        'validation_passed': validation_passed,
+        'error': None,
+        'warning': f"Rounding adjustment: ₨ {abs(allocation_difference):.2f}" if abs(allocation_difference) > 0.01 else None
+    }
+    
+    return working_df, metadata, validation_result
+
+
+def classify_target_columns(df, month_cols):
+    """
+    Find every target column and order them chronologically.
+    
+    Example: ["Apr 2026 Target", "Mar 2026 Target"] → ["Mar 2026 Target", "Apr 2026 Target"]
+    
+    Returns: (target_cols, validation_errors)
+    """
+    targets = []
+    errors = []
+    
+    for col in df.columns.tolist()[1:]:
+        if 'target' not in str(col).lower():
+            continue
+        target_dt, target_valid, target_error = validate_target_month_format(col)
+        if not target_valid:
+            errors.append(f"❌ {target_error}")
+            continue
+        if month_cols:
+            is_valid, seq_error = validate_month_sequence(month_cols, target_dt)
+            if not is_valid:
+                errors.append(f"❌ {seq_error}")
+                continue
+        targets.append((target_dt, col))
+    
+    target_months = [dt for dt, _ in targets]
+    if len(set(target_months)) != len(target_months):
+        errors.append("❌ Duplicate target months found")
+    
+    return [col for _, col in sorted(targets)], errors
+
+
+def target_month_label(target_col):
+    """'Mar 2026 Target' → 'Mar 2026'."""
+    target_dt, _, _ = validate_target_month_format(target_col)
+    return target_dt.strftime('%b %Y')
+
+
+def calculate_multi_month_allocations(df, outlet_col, month_cols, target_amounts,
+                                      contributions=None, outlet_index=None, rules=None,
+                                      outlet_days=None, backend='auto'):
+    """
+    Allocate several forward months in one batched pass.
+    
+    target_amounts: Dict target column → amount, e.g.
+    {"Mar 2026 Target": 3200000, "Apr 2026 Target": 3400000}
+    
+    Contributions are computed once and shared by all months; allocations
+    are one outlets × months array with month-specific day counts.
+    Per month, working_df gets "Allocated_Monthly_Target (Mar 2026)" and
+    "Allocated_Daily_Target (Mar 2026)" columns.
+    
+    Returns: (working_df, metadata, validation) like calculate_allocations
+    """
+    target_cols = list(target_amounts)
+    if not target_cols:
+        return None, {}, {'success': False, 'error': 'No target columns selected'}
+    
+    # ========== STEP 1: Parse Target Months ==========
+    months = []
+    for col in target_cols:
+        target_dt, target_valid, target_error = validate_target_month_format(col)
+        if not target_valid:
+            return None, {}, {'success': False, 'error': target_error}
+        target_days, target_is_leap = get_days_in_month(target_dt.year, target_dt.month)
+        months.append({
+            'target_col': col,
+            'month': target_dt.strftime('%b %Y'),
+            'days': target_days,
+            'is_leap': target_is_leap,
+            'entered_target': float(target_amounts[col]),
+        })
+    
+    # ========== STEPS 2-9: Shared Contribution Base ==========
+    base, base_error = prepare_allocation_base(
+        df, outlet_col, month_cols, contributions, outlet_index, rules, outlet_days, backend
+    )
+    if base is None:
+        return None, {}, {'success': False, 'error': base_error}
+    
+    shops_only = base['shops_only']
+    
+    # ========== STEPS 10-12: Allocate All Months at Once ==========
+    allocation, allocation_error = allocate_target_matrix(
+        shops_only,
+        outlet_col,
+        [m['entered_target'] for m in months],
+        [m['days'] for m in months],
+        base['shop_limits']
+    )
+    if allocation is None:
+        return None, {}, {'success': False, 'error': allocation_error}
+    
+    final_totals = allocation['monthly'].sum(axis=0)
+    for month, final_total, difference in zip(months, final_totals, allocation['differences']):
+        month['final_allocated'] = round(final_total, 2)
+        month['rounding_adjustment'] = round(difference, 2)
+        month['validation_passed'] = abs(final_total - month['entered_target']) < 0.01
+    
+    # ========== STEP 13: Reconstruct Working DataFrame ==========
+    working_df = base['data_only']
+    for col in month_cols:
+        working_df[col] = pd.to_numeric(working_df[col], errors='coerce').fillna(0)
+    
+    month_columns = []
+    for m in months:
+        month_columns += [
+            f"Allocated_Monthly_Target ({m['month']})",
+            f"Allocated_Daily_Target ({m['month']})",
+        ]
+    
+    values = np.empty((len(shops_only), len(month_columns)))
+    values[:, 0::2] = allocation['monthly']
+    values[:, 1::2] = allocation['daily']
+    
+    for col in CONTRIBUTION_COLUMNS + month_columns:
+        working_df[col] = 0.0
+    working_df.loc[shops_only.index, CONTRIBUTION_COLUMNS] = shops_only[CONTRIBUTION_COLUMNS]
+    working_df.loc[shops_only.index, month_columns] = values
+    
+    # ========== STEP 14: Prepare Metadata ==========
+    metadata = {
+        'target_months': months,
+        'historical_months': [m['month'] for m in base['month_details']],
+        'total_historical_days': base['total_historical_days'],
+        'eligible_shops_count': base['eligible_shops_count'],
+        'company_total_sales': shops_only['Historical_Total_Sales'].sum(),
+        'company_daily_average': round(base['company_daily_average'], 2),
+        'excluded_outlets': base['excluded_names'],
+        'constrained_shops_count': int((allocation['constraints'] != '').any(axis=1).sum()),
+        'compute_backend': base['backend'],
+    }
+    
+    validation_result = {
+        'success': True,
+        'validation_passed': all(m['validation_passed'] for m in months),
+        'error': None,
+        'warning': None,
+    }
+    
+    return working_df, metadata, validation_result
+
+
+def create_output_dataframe(df, working_df, outlet_col, month_cols, target_col, metadata,
+                            outlet_index=None):
+    """
+    Create final output dataframe with enhanced columns.
+    
+    Output columns:
+    - Outlet Name
+    - Historical Total Sales
+    - Historical Daily Average
+    - Contribution %
+    - Allocated Monthly Target
+    - Allocated Daily Target
+    - All historical months
+    - Target column with allocations
+    
+    outlet_index: Optional result of build_outlet_index() for df.
+    """
+    if outlet_index is None:
+        outlet_index = build_outlet_index(df, outlet_col)
+    
+    output_df = df.copy()
+    
+    # Reorder columns: Outlet, Historical Sales/Daily/Contribution, then months, then allocations
+    outlet_col_idx = output_df.columns.tolist().index(outlet_col)
+    
+    # Build new column order
+    new_columns = [outlet_col]
+    
+    # Add calculation columns after outlet name
+    calc_cols = [
+        ('Historical_Total_Sales', 'Historical Total'),
+        ('Historical_Daily_Average', 'Daily Average'),
+        ('Contribution_%', 'Contribution %'),
+    ]
+    
+    # Insert calculation columns
+    for calc_col, display_name in calc_cols:
+        output_df.insert(len(new_columns), display_name, np.nan)
+        new_columns.append(display_name)
+    
+    # Add month columns
+    for col in month_cols:
+        if col not in new_columns:
+            new_columns.append(col)
+    
+    # Add target allocation columns
+    output_df.insert(len(new_columns), 'Allocated_Monthly_Target', np.nan)
+    output_df.insert(len(new_columns) + 1, 'Allocated_Daily_Target', np.nan)
+    
+    # Fill in the calculated values (working_df shares the row labels of df)
+    outlet_mask = ~outlet_index['total_mask']
+    
+    fill_map = [
+        ('Historical Total', 'Historical_Total_Sales'),
+        ('Daily Average', 'Historical_Daily_Average'),
+        ('Contribution %', 'Contribution_%'),
+        ('Allocated_Monthly_Target', 'Allocated_Monthly_Target'),
+        ('Allocated_Daily_Target', 'Allocated_Daily_Target'),
+    ]
+    for output_col, working_col in fill_map:
+        output_df.loc[working_df.index, output_col] = working_df[working_col]
+    
+    # Update target column with allocations
+    if target_col and target_col in output_df.columns:
+        output_df.loc[working_df.index, target_col] = working_df['Allocated_Monthly_Target']
+    
+    # Update TOTAL row
+    total_rows = outlet_index['rows'].get('TOTAL')
+    total_row_idx = total_rows[0] if total_rows else None
+    
+    if total_row_idx is not None:
+        for col in month_cols:
+            output_df.loc[total_row_idx, col] = output_df.loc[outlet_mask, col].sum()
+        # Add totals for allocations
+        output_df.loc[total_row_idx, 'Allocated_Monthly_Target'] = working_df['Allocated_Monthly_Target'].sum()
+        output_df.loc[total_row_idx, 'Allocated_Daily_Target'] = working_df['Allocated_Daily_Target'].sum()
+    
+    return output_df
+
+
+def create_multi_month_output_dataframe(df, working_df, outlet_col, month_cols, metadata,
+                                        outlet_index=None):
+    """
+    Create the export dataframe for a multi-month run.
+    
+    Each target column is filled with its monthly allocation and followed
+    by a "<Month> Daily Target" column, so all months sit side by side.
+    
+    outlet_index: Optional result of build_outlet_index() for df.
+    """
+    if outlet_index is None:
+        outlet_index = build_outlet_index(df, outlet_col)
+    
+    output_df = df.copy()
+    outlet_mask = ~outlet_index['total_mask']
+    
+    # Calculation columns after outlet name
+    calc_cols = [
+        ('Historical_Total_Sales', 'Historical Total'),
+        ('Historical_Daily_Average', 'Daily Average'),
+        ('Contribution_%', 'Contribution %'),
+    ]
+    for position, (calc_col, display_name) in enumerate(calc_cols, start=1):
+        output_df.insert(position, display_name, np.nan)
+        output_df.loc[working_df.index, display_name] = working_df[calc_col]
+    
+    # Target months side by side
+    allocation_cols = []
+    for month in metadata['target_months']:
+        target_col = month['target_col']
+        daily_col = f"{month['month']} Daily Target"
+        output_df[target_col] = np.nan
+        output_df.insert(output_df.columns.get_loc(target_col) + 1, daily_col, np.nan)
+        output_df.loc[working_df.index, target_col] = working_df[f"Allocated_Monthly_Target ({month['month']})"]
+        output_df.loc[working_df.index, daily_col] = working_df[f"Allocated_Daily_Target ({month['month']})"]
+        allocation_cols += [target_col, daily_col]
+    
+    # Update TOTAL row
+    total_rows = outlet_index['rows'].get('TOTAL')
+    if total_rows:
+        total_row_idx = total_rows[0]
+        for col in month_cols + allocation_cols:
+            output_df.loc[total_row_idx, col] = output_df.loc[outlet_mask, col].sum()
+    
+    return output_df
+
+
+def export_to_excel(df):
+    """Export dataframe to Excel bytes with error handling."""
+    try:
+        output = BytesIO()
+        # in_memory: xlsxwriter otherwise stages every part in temp files
+        with pd.ExcelWriter(output, engine='xlsxwriter',
+                            engine_kwargs={'options': {'in_memory': True}}) as writer:
+            df.to_excel(writer, sheet_name='Allocations', index=False)
+            
+            # Format the worksheet
+            workbook = writer.book
+            worksheet = writer.sheets['Allocations']
+            
+            # Format currency columns
+            currency_format = workbook.add_format({'num_format': '#,##0.00'})
+            percent_format = workbook.add_format({'num_format': '0.00"%"'})
+            
+            for col_num, col_name in enumerate(df.columns, 1):
+                if 'Contribution' in col_name or 'Allocated' in col_name or 'Target' in col_name:
+                    fmt = currency_format if 'Target' in col_name or 'Allocated' in col_name else percent_format
+                    worksheet.set_column(col_num - 1, col_num - 1, 15, fmt)
+                else:
+                    worksheet.set_column(col_num - 1, col_num - 1, 20)
+        
+        output.seek(0)
+        return output
+    
+    except Exception as e:
+        raise Exception(f"Failed to generate Excel file: {str(e)}")
+
+
+def hash_file_content(file_bytes):
+    """Return a stable content hash for an uploaded file."""
+    return hashlib.sha256(file_bytes).hexdigest()
+
+
+def estimate_size_bytes(value):
+    """Estimate the in-memory size of a cached value."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size_bytes(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size_bytes(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class SharedDatasetCache:
+    """
+    Thread-safe LRU cache with a total memory budget.
+    
+    Holds parsed datasets and contribution vectors keyed by content hash so
+    that sessions uploading the same file share one copy. Cached values are
+    shared between sessions and must be treated as read-only.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+    
+    def touch(self, key):
+        """
+        Return the cached value for key and mark it recently used, without
+        counting a hit or miss (for repeat reads of a lookup already counted).
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+    
+    def put(self, key, value):
+        """Store value, evicting least recently used entries to stay in budget."""
+        size = estimate_size_bytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            # Values larger than the whole budget are never cached
+            if size > self.max_bytes:
+                return False
+            while self._entries and self.current_bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            return True
+    
+    def clear(self):
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+    
+    def stats(self):
+        """Return a snapshot of cache counters for display."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'used_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0.0,
+            }
+
+
+def sortable_values(values):
+    """
+    Sort key for a column that may mix numbers and text (object dtype).
+
+    Mostly-numeric columns sort as numbers with the text entries treated as
+    missing; other mixed columns sort as text. Missing values stay NaN so
+    they can be placed last in either direction.
+
+    Returns: Series aligned with values
+    """
+    if values.dtype != object:
+        return values
+    present = values.notna()
+    numeric = pd.to_numeric(values, errors='coerce')
+    if numeric.notna().sum() * 2 >= present.sum() and numeric.notna().any():
+        return numeric
+    return values.astype(str).where(present)
+
+
+def paginate_dataframe(df, page, page_size, sort_col=None, ascending=True,
+                       search=None, search_col=None, search_keys=None):
+    """
+    Return a single page of a dataframe after optional search and sort.
+
+    Filtering and sorting happen on the server; only the requested slice
+    is returned, so only that slice is serialized to the browser.
+
+    search_keys: Optional pre-normalized outlet keys (see build_outlet_index)
+    covering df.index, used instead of normalizing search_col on every call.
+
+    Returns: (page_df, total_rows, total_pages)
+    """
+    view = df
+
+    # Case-insensitive substring search on one column
+    needle = search.strip().upper() if search else ''
+    if needle:
+        if search_keys is not None:
+            haystack = search_keys.loc[view.index]
+        elif search_col in view.columns:
+            haystack = normalize_outlet_keys(view[search_col])
+        else:
+            haystack = None
+        if haystack is not None:
+            view = view[haystack.str.contains(needle, regex=False).to_numpy()]
+
+    total_rows = len(view)
+    total_pages = max(1, -(-total_rows // page_size))
+    page = min(max(1, int(page)), total_pages)
+    start = (page - 1) * page_size
+    stop = start + page_size
+
+    # Sort positions only, then take the page rows (avoids reordering the full frame)
+    if sort_col in view.columns:
+        keys = sortable_values(view[sort_col]).reset_index(drop=True)
+        order = keys.sort_values(ascending=ascending, na_position='last', kind='stable').index.to_numpy()
+        page_df = view.iloc[order[start:stop]]
+    else:
+        page_df = view.iloc[start:stop]
+
+    return page_df, total_rows, total_pages
+
+
+def summarize_numeric_columns(df, columns):
+    """
+    Build a compact per-column summary (total, average, min, max).
+
+    Used as the default view instead of sending every row to the browser.
+    """
+    numeric = df[columns].apply(pd.to_numeric, errors='coerce')
+    summary = pd.DataFrame({
+        'Total': numeric.sum(),
+        'Average': numeric.mean(),
+        'Minimum': numeric.min(),
+        'Maximum': numeric.max(),
+    })
+    summary.index.name = 'Column'
+    return summary.reset_index()
+
+
+CHART_MAX_POINTS = 300
+CHART_BINS = 30
+CHART_TOP_N = 15
+
+
+def downsample_positions(length, max_points=CHART_MAX_POINTS):
+    """Evenly spaced positions into a sequence, always keeping the first and last."""
+    if length <= max_points:
+        return np.arange(length)
+    return np.unique(np.linspace(0, length - 1, max_points).round().astype(int))
+
+
+def build_allocation_charts(working_df, outlet_col, allocation_col='Allocated_Monthly_Target',
+                            max_points=CHART_MAX_POINTS, bins=CHART_BINS, top_n=CHART_TOP_N):
+    """
+    Aggregate a result into small chart-ready frames for the eligible shops.
+
+    All binning and downsampling happens here, so each chart sends at most
+    max_points rows to the browser regardless of the number of outlets.
+
+    Returns: Dict with
+    - pareto: Cumulative % of target and of contribution vs % of outlets
+      (outlets sorted by target, largest first)
+    - histogram: Outlet count per allocated-target bin
+    - top / bottom: The top_n largest and smallest targets
+    - outlets, outlets_for_80_pct: Shop count and how many of the largest
+      shops carry 80% of the target
+    """
+    shops = working_df
+    if 'Constraint_Applied' in working_df.columns:
+        shops = working_df[working_df['Constraint_Applied'] != 'Excluded']
+    
+    targets = shops[allocation_col].to_numpy(dtype=float)
+    contributions = shops['Contribution_%'].to_numpy(dtype=float)
+    names = shops[outlet_col].astype(str).to_numpy()
+    count = len(targets)
+    
+    # ========== Pareto Curve ==========
+    order = np.argsort(-targets, kind='stable')
+    target_total = targets.sum()
+    contribution_total = contributions.sum()
+    cumulative_target = np.cumsum(targets[order]) / target_total * 100 if target_total else np.zeros(count)
+    cumulative_contribution = (
+        np.cumsum(contributions[order]) / contribution_total * 100 if contribution_total else np.zeros(count)
+    )
+    positions = downsample_positions(count, max_points - 1)
+    pareto = pd.DataFrame({
+        'Outlets %': np.concatenate([[0.0], (positions + 1) / max(count, 1) * 100]).round(3),
+        'Cumulative Target %': np.concatenate([[0.0], cumulative_target[positions]]).round(2),
+        'Cumulative Contribution %': np.concatenate([[0.0], cumulative_contribution[positions]]).round(2),
+    }).set_index('Outlets %')
+    
+    # ========== Histogram ==========
+    counts, edges = np.histogram(targets, bins=max(1, min(bins, count)))
+    histogram = pd.DataFrame({
+        'Target From': edges[:-1].round(0),
+        'Outlets': counts,
+    }).set_index('Target From')
+    
+    # ========== Top / Bottom N ==========
+    def ranked(positions_):
+        width = len(str(len(positions_)))
+        return pd.DataFrame({
+            'Outlet': [f"{rank:0{width}d}. {names[i]}" for rank, i in enumerate(positions_, start=1)],
+            'Monthly Target': targets[positions_],
+        }).set_index('Outlet')
+    
+    top_n = min(top_n, count)
+    
+    return {
+        'pareto': pareto,
+        'histogram': histogram,
+        'top': ranked(order[:top_n]),
+        'bottom': ranked(order[::-1][:top_n]),
+        'outlets': count,
+        'outlets_for_80_pct': int(np.searchsorted(cumulative_target, 80 - 1e-9) + 1) if count else 0,
+    }
@@ -1,10 +1,10 @@
-import streamlit as st
-import pandas as pd
-import numpy as np
+import hmac
+import os
+import tempfile
+from datetime import datetime
 from io import BytesIO
-from datetime import datetime, timedelta
-import calendar
-import re
+
+import streamlit as st
 
 st.set_page_config(
     page_title="Target Allocation System",
@@ -15,558 +15,578 @@ st.set_page_config(
 
 st.title("📊 Rolling Monthly Target Allocation System")
 
+# Heavy imports (pandas/numpy via allocation_core) come after the first
+# render so the page header appears while they load.
+import pandas as pd
+
+from allocation_backends import available_backends
+from allocation_core import (
+    CHART_MAX_POINTS,
+    CONTRIBUTION_COLUMNS,
+    DEFAULT_EXCLUDED_OUTLETS,
+    SharedDatasetCache,
+    build_allocation_charts,
+    build_allocation_rules,
+    build_outlet_index,
+    calculate_allocations,
+    calculate_multi_month_allocations,
+    calculate_total_historical_days,
+    classify_columns,
+    classify_target_columns,
+    create_multi_month_output_dataframe,
+    create_output_dataframe,
+    export_to_excel,
+    hash_file_content,
+    normalize_outlet_keys,
+    paginate_dataframe,
+    parse_allocation_rules,
+    summarize_numeric_columns,
+    target_month_label,
+    validate_excel_structure,
+)
+from excel_patch import patch_multi_month_export, patch_single_month_export
+from run_archive import (
+    DEFAULT_ARCHIVE_DIR,
+    archive_run,
+    contribution_drift,
+    latest_run_ids,
+    list_archived_runs,
+    load_outlet_history,
+)
+from risk_simulation import DEFAULT_SIMULATIONS, simulate_attainment
+from transaction_ingest import (
+    DATE_FORMATS,
+    DEFAULT_MEMORY_BUDGET_MB,
+    aggregate_transactions,
+    guess_transaction_columns,
+    read_transaction_columns,
+)
+from upload_diff import (
+    allocation_changes,
+    diff_uploads,
+    fingerprint_upload,
+    update_historical_totals,
+)
+
 # ============================================================================
-# UTILITY FUNCTIONS
+# TABLE RENDERING
 # ============================================================================
 
-def extract_month_year(column_name):
-    """Extract month and year from column name."""
-    # Pattern: Month YYYY (e.g., "July 2025", "Jan 2026")
-    pattern = r'([A-Za-z]+)\s+(\d{4})'
-    match = re.search(pattern, column_name)
-    if match:
-        return True
-    return False
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
 
 
-def parse_month_year(month_str):
-    """
-    Parse month string to datetime object.
-    
-    Format: "July 2025" or "Jul 2025" → datetime(2025, 7, 1)
-    
-    Returns: (datetime_obj, is_valid, error_message)
-    """
-    try:
-        # Try full month name first (July)
-        dt = datetime.strptime(month_str.strip(), "%B %Y")
-        return dt, True, None
-    except ValueError:
-        try:
-            # Try abbreviated month name (Jul)
-            dt = datetime.strptime(month_str.strip(), "%b %Y")
-            return dt, True, None
-        except ValueError:
-            return None, False, f"Invalid date format: '{month_str}'. Use 'July 2025' or 'Jul 2025'"
+def render_paginated_table(df, key, search_col=None, column_config=None, search_keys=None):
+    """Render a dataframe one page at a time with search and sort controls."""
+    ctrl1, ctrl2, ctrl3, ctrl4 = st.columns([3, 2, 1, 1])
 
+    with ctrl1:
+        search = st.text_input(
+            "Search outlet",
+            key=f"{key}_search",
+            placeholder="Type part of an outlet name..."
+        ) if search_col else None
+    with ctrl2:
+        sort_options = ["(original order)"] + df.columns.tolist()
+        sort_col = st.selectbox("Sort by", sort_options, key=f"{key}_sort")
+    with ctrl3:
+        order = st.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order")
+    with ctrl4:
+        page_size = st.selectbox("Rows", TABLE_PAGE_SIZES, key=f"{key}_page_size")
 
-def get_days_in_month(year, month):
-    """
-    Get the actual number of days in a given month.
-    
-    Handles: 28, 29 (leap year), 30, 31 days
-    Returns: (days_count, is_leap_year)
-    """
-    days = calendar.monthrange(year, month)[1]
-    is_leap = calendar.isleap(year)
-    return days, is_leap
+    page = st.session_state.get(f"{key}_page", 1)
+    page_df, total_rows, total_pages = paginate_dataframe(
+        df,
+        page,
+        page_size,
+        sort_col=None if sort_col == "(original order)" else sort_col,
+        ascending=order == "Ascending",
+        search=search,
+        search_col=search_col,
+        search_keys=search_keys,
+    )
 
+    st.dataframe(page_df, use_container_width=True, column_config=column_config)
+
+    nav1, nav2 = st.columns([1, 3])
+    with nav1:
+        st.number_input(
+            "Page",
+            min_value=1,
+            max_value=total_pages,
+            step=1,
+            key=f"{key}_page"
+        )
+    with nav2:
+        st.caption(f"{total_rows:,} matching rows · {total_pages:,} pages")
+
+
+def render_allocation_charts(charts):
+    """Render the pre-aggregated frames from build_allocation_charts."""
+    st.caption(
+        f"{charts['outlets_for_80_pct']:,} of {charts['outlets']:,} shops carry 80% of the target "
+        f"· each chart shows at most {CHART_MAX_POINTS} points"
+    )
+    pareto_tab, histogram_tab, ranking_tab = st.tabs(["Pareto curve", "Target distribution", "Top / Bottom"])
+    
+    with pareto_tab:
+        st.line_chart(charts['pareto'])
+    with histogram_tab:
+        st.bar_chart(charts['histogram'])
+    with ranking_tab:
+        top_col, bottom_col = st.columns(2)
+        with top_col:
+            st.caption(f"Top {len(charts['top'])} monthly targets")
+            st.bar_chart(charts['top'])
+        with bottom_col:
+            st.caption(f"Bottom {len(charts['bottom'])} monthly targets")
+            st.bar_chart(charts['bottom'])
+
+
+# ============================================================================
+# SHARED DATASET CACHE
+# ============================================================================
+
+# Total memory budget for the process-wide cache (MB)
+SHARED_CACHE_MB = int(os.environ.get("TARGET_APP_CACHE_MB", "512"))
 
-def validate_target_month_format(target_col_name):
-    """
-    Extract and validate target month from column name.
-    
-    Example: "Mar 2026 Target" → (datetime(2026, 3, 1), True, None)
-    
-    Returns: (datetime_obj, is_valid, error_message)
-    """
-    if not target_col_name:
-        return None, False, "Target column not found"
-    
-    # Extract month and year (remove "Target" suffix)
-    month_year_str = target_col_name.replace("Target", "").strip()
-    
-    dt, is_valid, error = parse_month_year(month_year_str)
-    return dt, is_valid, error
 
+# Token that unlocks the admin actions (clearing the cache); unset = disabled
+ADMIN_TOKEN = os.environ.get("TARGET_APP_ADMIN_TOKEN", "")
 
-def calculate_total_historical_days(month_columns):
+
+@st.cache_resource
+def get_shared_cache():
+    """One cache instance per server process, shared by all sessions."""
+    return SharedDatasetCache(SHARED_CACHE_MB * 1024 * 1024)
+
+
+def session_lookup(cache, key):
     """
-    Calculate total days across all historical months.
+    Look up key in the shared cache, counting it once per session.
     
-    Example: ["July 2025", "Aug 2025", "Sep 2025"]
-    Returns: 31 + 31 + 30 = 92 days
+    Every widget interaction reruns the script with the same upload. A key
+    this session already looked up is read with cache.touch, which keeps
+    the entry recently used without counting a hit, so the hit and miss
+    counters only count lookups for new uploads.
     
-    Returns: (total_days, month_details, is_valid, error_message)
+    Returns: Cached value or None on a miss
     """
-    total_days = 0
-    month_details = []
-    
-    for col in month_columns:
-        dt, is_valid, error = parse_month_year(col)
-        
-        if not is_valid:
-            return 0, [], False, error
-        
-        days, is_leap = get_days_in_month(dt.year, dt.month)
-        total_days += days
-        month_details.append({
-            'month': col,
-            'days': days,
-            'is_leap': is_leap,
-            'date': dt
-        })
-    
-    return total_days, month_details, True, None
+    latest = st.session_state.get('cache_lookups', {}).get(key[0])
+    if latest is not None and latest[0] == key:
+        value = cache.touch(key)
+        if value is not None:
+            return value
+        if latest[1] is not None:
+            return latest[1]
+    return cache.get(key)
 
 
-def validate_month_sequence(historical_months, target_month_dt):
+def session_remember(cache, key, value):
     """
-    Ensure target month is AFTER last historical month.
+    Record the latest key per cache-key kind for session_lookup.
     
-    Returns: (is_valid, error_message)
+    Only the key is kept while the value is in the cache, so evicted values
+    are freed; a value too large for the cache is kept in the session.
     """
-    if not historical_months:
-        return False, "No historical months found"
-    
-    # Parse last historical month
-    last_col = historical_months[-1]
-    last_dt, is_valid, error = parse_month_year(last_col)
-    
-    if not is_valid:
-        return False, error
-    
-    # Check if target is after last historical month
-    if target_month_dt <= last_dt:
-        return False, f"Target month {target_month_dt.strftime('%b %Y')} must be AFTER last historical month {last_dt.strftime('%b %Y')}"
-    
-    return True, None
+    kept = value if cache.touch(key) is None else None
+    st.session_state.setdefault('cache_lookups', {})[key[0]] = (key, kept)
 
 
-def validate_no_duplicate_months(month_columns):
+def load_dataset(uploaded_file, cache):
     """
-    Ensure no duplicate month columns.
+    Parse an uploaded file, reusing a cached copy when the content matches.
     
-    Returns: (is_valid, error_message, duplicates)
+    Returns: (dataframe, content_hash)
     """
-    seen = set()
-    duplicates = []
-    
-    for col in month_columns:
-        dt, is_valid, error = parse_month_year(col)
-        if is_valid:
-            key = dt.strftime("%b %Y")
-            if key in seen:
-                duplicates.append(col)
-            seen.add(key)
-    
-    if duplicates:
-        return False, f"Duplicate months found: {duplicates}", duplicates
+    file_bytes = uploaded_file.getvalue()
+    file_hash = hash_file_content(file_bytes)
+    key = ('dataset', file_hash)
+    
+    df = session_lookup(cache, key)
+    if df is None:
+        if uploaded_file.name.endswith('.csv'):
+            df = pd.read_csv(BytesIO(file_bytes))
+        else:
+            df = pd.read_excel(BytesIO(file_bytes))
+        cache.put(key, df)
+    session_remember(cache, key, df)
     
-    return True, None, []
+    return df, file_hash
 
 
-def classify_columns(df):
-    """
-    Classify columns with enhanced validation.
-    
-    Returns:
-    - outlet_col: First column (outlet names)
-    - month_cols: Columns with actual monthly data (no "Target")
-    - target_col: Column containing "Target"
-    - validation_errors: List of validation issues
-    """
-    columns = df.columns.tolist()
-    outlet_col = columns[0]
-    month_cols = []
-    target_col = None
-    validation_errors = []
-    
-    # Classify columns
-    for col in columns[1:]:
-        if 'target' in col.lower():
-            target_col = col
-        elif extract_month_year(col):
-            month_cols.append(col)
-    
-    # Validation checks
-    if not target_col:
-        validation_errors.append("⚠️ No target column found (column should contain 'Target')")
-    
-    if not month_cols:
-        validation_errors.append("❌ No historical months found (format: 'Month YYYY')")
-    
-    if month_cols:
-        # Check for duplicate months
-        is_valid, error, dups = validate_no_duplicate_months(month_cols)
-        if not is_valid:
-            validation_errors.append(f"❌ {error}")
-    
-    if month_cols and target_col:
-        # Check month sequence
-        target_dt, target_valid, target_error = validate_target_month_format(target_col)
-        if target_valid:
-            is_valid, seq_error = validate_month_sequence(month_cols, target_dt)
-            if not is_valid:
-                validation_errors.append(f"❌ {seq_error}")
-    
-    return outlet_col, month_cols, target_col, validation_errors
+def get_outlet_index(df, outlet_col, file_hash, cache):
+    """Return the outlet-key index for a dataset, building it on first use."""
+    key = ('outlet_index', file_hash, outlet_col)
+    outlet_index = session_lookup(cache, key)
+    if outlet_index is None:
+        outlet_index = build_outlet_index(df, outlet_col)
+        cache.put(key, outlet_index)
+    session_remember(cache, key, outlet_index)
+    return outlet_index
 
 
-def is_total_row(value):
-    """Check if a value represents the total row."""
-    if pd.isna(value):
-        return False
-    value_str = str(value).strip().upper()
-    return value_str == 'TOTAL'
+# Memory budget for aggregating transaction uploads (MB)
+INGEST_BUDGET_MB = int(os.environ.get("TARGET_APP_INGEST_MB", str(DEFAULT_MEMORY_BUDGET_MB)))
 
+# Server folder with transaction files too large to upload (unset = uploads only)
+TRANSACTION_DIR = os.environ.get("TARGET_APP_TRANSACTION_DIR", "")
+TRANSACTION_EXTENSIONS = ('.csv', '.parquet')
 
-def validate_data(df, outlet_col, month_cols):
-    """Validate that data is numeric and properly formatted."""
-    errors = []
-    
-    # Check for empty outlet names
-    if df[outlet_col].isna().any():
-        errors.append("⚠️ Found empty outlet names")
-    
-    # Check if month columns contain numeric data
-    for col in month_cols:
-        if not pd.api.types.is_numeric_dtype(df[col]):
-            try:
-                pd.to_numeric(df[col], errors='coerce')
-            except:
-                errors.append(f"⚠️ Column '{col}' contains non-numeric values")
+
+class ServerTransactionFile:
+    """A transaction file in TRANSACTION_DIR, read in place instead of uploaded."""
     
-    return errors
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path)
 
 
-def validate_excel_structure(df, outlet_col_name="OUTLET NAME"):
+def list_transaction_files(folder):
+    """CSV/Parquet file names directly inside folder, sorted (empty if unreadable)."""
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    return sorted(
+        name for name in names
+        if name.lower().endswith(TRANSACTION_EXTENSIONS) and os.path.isfile(os.path.join(folder, name))
+    )
+
+
+def load_transactions(uploaded_file, column_map, cache):
     """
-    Comprehensive validation of Excel file structure BEFORE processing.
+    Aggregate a transaction file into the monthly sheet layout.
     
-    Checks:
-    - OUTLET NAME column exists
-    - TOTAL row exists
-    - DIP PLANT outlet exists
-    - At least 1 eligible shop exists
-    - No empty outlet names
+    Server files are streamed from disk in place. Uploads are already in
+    memory; they are written to a temporary file so ingestion can stream
+    them within INGEST_BUDGET_MB. Results are cached by content (size and
+    modification time for server files) and column mapping.
     
-    Returns: (is_valid, list_of_errors)
+    Returns: (ingest_result, dataset_hash, error_message)
     """
-    errors = []
-    
-    # Check 1: OUTLET NAME column exists
-    if outlet_col_name not in df.columns:
-        errors.append(f"❌ Column '{outlet_col_name}' not found. First column must be '{outlet_col_name}'")
-        return False, errors
-    
-    # Check 2: TOTAL row exists
-    outlet_col_data = df[outlet_col_name].apply(lambda x: str(x).strip().upper() if pd.notna(x) else "")
-    has_total = any(val == 'TOTAL' for val in outlet_col_data)
-    if not has_total:
-        errors.append("❌ TOTAL row not found. Last row must contain 'TOTAL' in outlet column")
-    
-    # Check 3: DIP PLANT exists
-    has_dip_plant = any(val == 'DIP PLANT' for val in outlet_col_data)
-    if not has_dip_plant:
-        errors.append("❌ DIP PLANT outlet not found. Must have outlet named 'DIP PLANT'")
-    
-    # Check 4: At least 1 eligible outlet
-    non_total_rows = df[~df[outlet_col_name].apply(is_total_row)]
-    total_rows = len(non_total_rows)
-    eligible_outlets = total_rows - 1  # Minus DIP PLANT if exists
-    if eligible_outlets <= 0:
-        errors.append(f"❌ No eligible outlets found. Need at least 1 shop (found {total_rows} total outlets)")
-    
-    # Check 5: No empty outlet names
-    if df[outlet_col_name].isna().any() or (df[outlet_col_name] == '').any():
-        errors.append("❌ Found empty outlet names. All outlets must have names.")
-    
-    return len(errors) == 0, errors
+    if isinstance(uploaded_file, ServerTransactionFile):
+        stat = os.stat(uploaded_file.path)
+        file_hash = hash_file_content(f"{uploaded_file.path}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    else:
+        file_hash = hash_file_content(uploaded_file.getbuffer())
+    mapping = '|'.join(str(column_map[role]) for role in ('outlet', 'date', 'amount', 'date_format'))
+    dataset_hash = hash_file_content(f"{file_hash}|{mapping}".encode())
+    key = ('transactions', dataset_hash)
+    
+    ingest = session_lookup(cache, key)
+    if ingest is None:
+        temporary_path = None
+        if isinstance(uploaded_file, ServerTransactionFile):
+            source_path = uploaded_file.path
+        else:
+            suffix = os.path.splitext(uploaded_file.name)[1].lower()
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                tmp.write(uploaded_file.getbuffer())
+            source_path = temporary_path = tmp.name
+        try:
+            ingest, error = aggregate_transactions(
+                source_path, column_map['outlet'], column_map['date'], column_map['amount'],
+                memory_budget_mb=INGEST_BUDGET_MB,
+                date_format=column_map['date_format']
+            )
+        finally:
+            if temporary_path is not None:
+                os.remove(temporary_path)
+        if ingest is None:
+            return None, None, error
+        cache.put(key, ingest)
+    session_remember(cache, key, ingest)
+    
+    return ingest, dataset_hash, None
+
+
+# ============================================================================
+# UPLOAD CHANGE DETECTION
+# ============================================================================
+
+def render_upload_diff(upload_diff):
+    """Compact summary of what changed since the previous upload."""
+    changes = upload_diff['changes']
+    parts = [f"{len(changes):,} outlets edited"]
+    if upload_diff['added']:
+        parts.append(f"{len(upload_diff['added']):,} added")
+    if upload_diff['removed']:
+        parts.append(f"{len(upload_diff['removed']):,} removed")
+    
+    with st.expander(f"🔍 Changes Since Previous Upload ({', '.join(parts)})", expanded=True):
+        if upload_diff['months_added'] or upload_diff['months_removed']:
+            st.info(
+                f"📅 Months added: {', '.join(upload_diff['months_added']) or 'none'} · "
+                f"removed: {', '.join(upload_diff['months_removed']) or 'none'}"
+            )
+        st.caption(f"{upload_diff['unchanged']:,} outlets unchanged")
+        if upload_diff['added']:
+            st.write(f"**Added:** {', '.join(upload_diff['added'][:20])}")
+        if upload_diff['removed']:
+            st.write(f"**Removed:** {', '.join(upload_diff['removed'][:20])}")
+        if not changes.empty:
+            render_paginated_table(
+                changes,
+                key="upload_changes_table",
+                search_col='Outlet Name',
+                column_config={
+                    col: st.column_config.NumberColumn(format="₨ %,.2f")
+                    for col in ['Previous Total', 'New Total', 'Change']
+                }
+            )
+
+
+def remember_historical_totals(working_df, outlet_col, month_cols, rules, file_hash):
+    """Keep this run's historical totals per outlet for the next upload."""
+    shops = working_df[working_df['Constraint_Applied'] != 'Excluded']
+    keys = normalize_outlet_keys(shops[outlet_col])
+    if keys.duplicated().any():
+        st.session_state.pop('historical_totals', None)
+        return
+    st.session_state.historical_totals = {
+        'file_hash': file_hash,
+        'month_cols': list(month_cols),
+        'excluded': tuple(sorted(rules['excluded'])),
+        'totals': pd.Series(shops['Historical_Total_Sales'].to_numpy(dtype=float), index=keys.to_numpy()),
+    }
 
 
-def calculate_allocations(df, outlet_col, month_cols, target_col, new_target):
+def incremental_contributions(df, month_cols, outlet_index, rules, file_hash):
     """
-    Calculate day-aware target allocations for 27 shops ONLY.
-    
-    BUSINESS RULE: DIP PLANT excluded from allocation.
-    
-    Steps:
-    1. Validate DIP PLANT exists
-    2. Validate exactly 27 other shops exist
-    3. Remove TOTAL row
-    4. Temporarily remove DIP PLANT for calculations
-    5. Calculate daily averages and contributions for 27 shops
-    6. Allocate full target ONLY among 27 shops
-    7. Reinsert DIP PLANT with 0 allocation
-    
-    Returns:
-    - result_df: DataFrame with all calculations
-    - metadata: Dict with calculation details
-    - validation: Dict with validation results
+    Contribution columns for a re-upload, recomputing only changed outlets.
+
+    Returns: (contributions_df, recomputed_count), or (None, None) when the
+    previous run cannot be reused (different months, exclusions or file)
     """
-    result_df = df.copy()
-    
-    # ========== STEP 1: Parse Target Month ==========
-    target_dt, target_valid, target_error = validate_target_month_format(target_col)
-    if not target_valid:
-        return None, {}, {'success': False, 'error': target_error}
-    
-    target_days, target_is_leap = get_days_in_month(target_dt.year, target_dt.month)
-    
-    # Calculate total historical days
-    total_hist_days, month_details, days_valid, days_error = calculate_total_historical_days(month_cols)
+    upload_diff = st.session_state.get('upload_diff')
+    previous = st.session_state.get('historical_totals')
+    if (
+        upload_diff is None or previous is None
+        or not upload_diff['same_layout']
+        or upload_diff['previous_file_hash'] != previous['file_hash']
+        or previous['month_cols'] != list(month_cols)
+        or previous['excluded'] != tuple(sorted(rules['excluded']))
+    ):
+        return None, None
+    
+    total_hist_days, _, days_valid, _ = calculate_total_historical_days(month_cols)
     if not days_valid:
-        return None, {}, {'success': False, 'error': days_error}
-    
-    # ========== STEP 2: Filter - Remove TOTAL Row ==========
-    outlet_mask = ~result_df[outlet_col].apply(is_total_row)
-    data_only = result_df[outlet_mask].copy()
-    
-    # ========== STEP 3: DIP PLANT Detection & Validation ==========
-    dip_plant_mask = data_only[outlet_col].str.strip().str.upper() == 'DIP PLANT'
-    dip_plant_detected = dip_plant_mask.any()
-    
-    if not dip_plant_detected:
-        return None, {}, {'success': False, 'error': '❌ DIP PLANT outlet not found in data'}
-    
-    dip_plant_idx = dip_plant_mask.idxmax()
-    
-    # ========== STEP 4: Validate Eligible Shop Count (Dynamic) ==========
-    # Total outlets minus DIP PLANT
-    total_outlets = len(data_only)
-    eligible_shops_count = total_outlets - 1  # All except DIP PLANT
-    
-    if eligible_shops_count <= 0:
-        return None, {}, {
-            'success': False,
-            'error': f'❌ No eligible shops found. Total outlets: {total_outlets}'
-        }
-    
-    # Debug output
-    print(f"📊 ALLOCATION DEBUG INFO:")
-    print(f"   Total Outlets: {total_outlets}")
-    print(f"   Eligible Shops (excl. DIP PLANT): {eligible_shops_count}")
-    print(f"   DIP PLANT Detected: {dip_plant_detected}")
-    
-    # ========== STEP 5: Separate DIP PLANT and Calculate for Others ==========
-    # Create working dataframe with only 27 shops (excludes DIP PLANT)
-    shops_only = data_only[~dip_plant_mask].copy()
-    
-    # Convert to numeric
-    for col in month_cols:
-        shops_only[col] = pd.to_numeric(shops_only[col], errors='coerce').fillna(0)
-    
-    # ========== STEP 6: Calculate Historical Sales ==========
-    shops_only['Historical_Total_Sales'] = shops_only[month_cols].sum(axis=1)
-    
-    # ========== STEP 7: Calculate Daily Averages for 27 Shops ==========
-    shops_only['Historical_Daily_Average'] = (
-        shops_only['Historical_Total_Sales'] / total_hist_days
-    ).round(2)
-    
-    # ========== STEP 8: Calculate Company Daily Average (27 shops only) ==========
-    company_daily_average = shops_only['Historical_Daily_Average'].sum()
-    
-    if company_daily_average <= 0:
-        return None, {}, {'success': False, 'error': '❌ Company daily average is zero. Check your data.'}
-    
-    # ========== STEP 9: Calculate Contribution % for 27 Shops ==========
-    shops_only['Contribution_%'] = (
-        (shops_only['Historical_Daily_Average'] / company_daily_average * 100)
-    ).round(2)
-    
-    # ========== STEP 10: Allocate Full Target Among 27 Shops ==========
-    shops_only['Allocated_Monthly_Target'] = (
-        shops_only['Contribution_%'] / 100 * new_target
-    ).round(2)
-    
-    # ========== STEP 11: Calculate Daily Target ==========
-    shops_only['Allocated_Daily_Target'] = (
-        shops_only['Allocated_Monthly_Target'] / target_days
-    ).round(2)
-    
-    # ========== STEP 12: Validation & Rounding Adjustment ==========
-    total_allocated_shops = shops_only['Allocated_Monthly_Target'].sum()
-    allocation_difference = new_target - total_allocated_shops
-    
-    # If rounding causes discrepancy, adjust largest allocation
-    if abs(allocation_difference) > 0.01:
-        max_idx = shops_only['Allocated_Monthly_Target'].idxmax()
-        shops_only.loc[max_idx, 'Allocated_Monthly_Target'] += allocation_difference
-        # Recalculate daily target for adjusted outlet
-        shops_only.loc[max_idx, 'Allocated_Daily_Target'] = (
-            shops_only.loc[max_idx, 'Allocated_Monthly_Target'] / target_days
-        ).round(2)
-    
-    # Final validation
-    final_total_shops = shops_only['Allocated_Monthly_Target'].sum()
-    validation_passed = abs(final_total_shops - new_target) < 0.01
-    
-    # ========== STEP 13: Reconstruct Working DataFrame with DIP PLANT ==========
-    # Create result with all data
-    working_df = data_only.copy()
-    
-    # Convert to numeric for DIP PLANT row as well (needed for output)
-    for col in month_cols:
-        working_df[col] = pd.to_numeric(working_df[col], errors='coerce').fillna(0)
-    
-    # Initialize calculation columns
-    working_df['Historical_Total_Sales'] = 0.0
-    working_df['Historical_Daily_Average'] = 0.0
-    working_df['Contribution_%'] = 0.0
-    working_df['Allocated_Monthly_Target'] = 0.0
-    working_df['Allocated_Daily_Target'] = 0.0
-    
-    # Fill in values for eligible shops (dynamic count)
-    for idx in shops_only.index:
-        working_df.loc[idx, 'Historical_Total_Sales'] = shops_only.loc[idx, 'Historical_Total_Sales']
-        working_df.loc[idx, 'Historical_Daily_Average'] = shops_only.loc[idx, 'Historical_Daily_Average']
-        working_df.loc[idx, 'Contribution_%'] = shops_only.loc[idx, 'Contribution_%']
-        working_df.loc[idx, 'Allocated_Monthly_Target'] = shops_only.loc[idx, 'Allocated_Monthly_Target']
-        working_df.loc[idx, 'Allocated_Daily_Target'] = shops_only.loc[idx, 'Allocated_Daily_Target']
-    
-    # ========== STEP 14: Set DIP PLANT to 0 ==========
-    working_df.loc[dip_plant_idx, 'Historical_Total_Sales'] = 0.0
-    working_df.loc[dip_plant_idx, 'Historical_Daily_Average'] = 0.0
-    working_df.loc[dip_plant_idx, 'Contribution_%'] = 0.0
-    working_df.loc[dip_plant_idx, 'Allocated_Monthly_Target'] = 0.0
-    working_df.loc[dip_plant_idx, 'Allocated_Daily_Target'] = 0.0
-    
-    # ========== STEP 15: Prepare Metadata ==========
-    metadata = {
-        'target_month': target_dt.strftime('%b %Y'),
-        'target_days': target_days,
-        'target_is_leap': target_is_leap,
-        'historical_months': [m['month'] for m in month_details],
-        'total_historical_days': total_hist_days,
-        'eligible_shops_count': eligible_shops_count,
-        'company_total_sales': shops_only['Historical_Total_Sales'].sum(),
-        'company_daily_average': round(company_daily_average, 2),
-        'entered_target': new_target,
-        'final_allocated': round(final_total_shops, 2),
-        'rounding_adjustment': round(allocation_difference, 2),
-        'dip_plant_note': 'DIP PLANT allocation = 0 (excluded per business rule)'
-    }
-    
-    validation_result = {
-        'success': True,
-        'validation_passed': validation_passed,
-        'error': None,
-        'warning': f"Rounding adjustment: ₨ {abs(allocation_difference):.2f}" if abs(allocation_difference) > 0.01 else None
-    }
-    
-    return working_df, metadata, validation_result
+        return None, None
+    return update_historical_totals(
+        previous['totals'], df, month_cols, outlet_index, upload_diff['changed_keys'],
+        rules['excluded'], total_hist_days
+    )
+
+
+# ============================================================================
+# RUN ARCHIVE & HISTORY
+# ============================================================================
+
+# Every successful calculation is saved here as partitioned Parquet
+ARCHIVE_DIR = os.environ.get("TARGET_APP_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+
 
+def render_history_view(archive_dir):
+    """Chart archived targets and contribution drift, reading only what is shown."""
+    runs = list_archived_runs(archive_dir)
+    if runs.empty:
+        st.info("No archived runs yet. Every calculation is archived automatically.")
+        return
+    
+    latest = latest_run_ids(runs)
+    st.caption(
+        f"{len(runs)} runs across {len(latest)} target months in `{archive_dir}` "
+        f"(charts use the latest run of each month)"
+    )
+    with st.expander("Archived runs"):
+        st.dataframe(
+            runs[['target_month', 'run_timestamp', 'source_name', 'entered_target',
+                  'final_allocated', 'eligible_shops_count']],
+            use_container_width=True,
+            hide_index=True
+        )
+    
+    # Outlet list and default selection from the newest month's partition only
+    newest_month = latest.index.max()
+    newest = load_outlet_history(
+        archive_dir, target_months=[newest_month], run_ids=[latest[newest_month]],
+        columns=['Allocated_Monthly_Target']
+    )
+    name_to_key = dict(zip(newest['outlet_name'], newest['outlet_key']))
+    selected = st.multiselect(
+        "Outlets",
+        sorted(name_to_key),
+        default=newest.nlargest(5, 'Allocated_Monthly_Target')['outlet_name'].tolist(),
+        key="history_outlets"
+    )
+    
+    if selected:
+        history = load_outlet_history(
+            archive_dir, outlet_keys=[name_to_key[name] for name in selected], run_ids=latest.tolist()
+        )
+        chart_col1, chart_col2 = st.columns(2)
+        with chart_col1:
+            st.write("**Monthly Target (PKR)**")
+            st.line_chart(history.pivot_table(
+                index='target_month', columns='outlet_name', values='Allocated_Monthly_Target'
+            ))
+        with chart_col2:
+            st.write("**Contribution %**")
+            st.line_chart(history.pivot_table(
+                index='target_month', columns='outlet_name', values='Contribution_%'
+            ))
+    
+    if len(latest) > 1:
+        months = latest.index.tolist()
+        drift_col1, drift_col2 = st.columns(2)
+        with drift_col1:
+            first_month = st.selectbox("Drift from", months, index=0, key="history_drift_from")
+        with drift_col2:
+            last_month = st.selectbox("Drift to", months, index=len(months) - 1, key="history_drift_to")
+        drift_history = load_outlet_history(
+            archive_dir, target_months=[first_month, last_month],
+            run_ids=[latest[first_month], latest[last_month]], columns=['Contribution_%']
+        )
+        st.write("**Largest contribution drift (percentage points)**")
+        st.dataframe(
+            contribution_drift(drift_history, first_month, last_month).head(20),
+            use_container_width=True,
+            hide_index=True
+        )
 
-def create_output_dataframe(df, working_df, outlet_col, month_cols, target_col, metadata):
+
+def render_cache_admin_panel(cache):
     """
-    Create final output dataframe with enhanced columns.
+    Show shared cache counters in the sidebar.
     
-    Output columns:
-    - Outlet Name
-    - Historical Total Sales
-    - Historical Daily Average
-    - Contribution %
-    - Allocated Monthly Target
-    - Allocated Daily Target
-    - All historical months
-    - Target column with allocations
+    Clearing the cache affects every session, so the button only appears
+    after entering TARGET_APP_ADMIN_TOKEN.
     """
-    output_df = df.copy()
-    
-    # Reorder columns: Outlet, Historical Sales/Daily/Contribution, then months, then allocations
-    outlet_col_idx = output_df.columns.tolist().index(outlet_col)
-    
-    # Build new column order
-    new_columns = [outlet_col]
-    
-    # Add calculation columns after outlet name
-    calc_cols = [
-        ('Historical_Total_Sales', 'Historical Total'),
-        ('Historical_Daily_Average', 'Daily Average'),
-        ('Contribution_%', 'Contribution %'),
-    ]
-    
-    # Insert calculation columns
-    for calc_col, display_name in calc_cols:
-        output_df.insert(len(new_columns), display_name, np.nan)
-        new_columns.append(display_name)
-    
-    # Add month columns
-    for col in month_cols:
-        if col not in new_columns:
-            new_columns.append(col)
-    
-    # Add target allocation columns
-    output_df.insert(len(new_columns), 'Allocated_Monthly_Target', np.nan)
-    output_df.insert(len(new_columns) + 1, 'Allocated_Daily_Target', np.nan)
-    
-    # Fill in the calculated values
-    outlet_mask = ~output_df[outlet_col].apply(is_total_row)
-    
-    for idx, wdf_idx in enumerate(working_df.index):
-        output_idx = wdf_idx
-        
-        # Fill calculation columns
-        output_df.loc[output_idx, 'Historical Total'] = working_df.loc[wdf_idx, 'Historical_Total_Sales']
-        output_df.loc[output_idx, 'Daily Average'] = working_df.loc[wdf_idx, 'Historical_Daily_Average']
-        output_df.loc[output_idx, 'Contribution %'] = working_df.loc[wdf_idx, 'Contribution_%']
-        output_df.loc[output_idx, 'Allocated_Monthly_Target'] = working_df.loc[wdf_idx, 'Allocated_Monthly_Target']
-        output_df.loc[output_idx, 'Allocated_Daily_Target'] = working_df.loc[wdf_idx, 'Allocated_Daily_Target']
-    
-    # Update target column with allocations
-    if target_col and target_col in output_df.columns:
-        for idx, wdf_idx in enumerate(working_df.index):
-            output_df.loc[wdf_idx, target_col] = working_df.loc[wdf_idx, 'Allocated_Monthly_Target']
-    
-    # Update TOTAL row
-    total_row_idx = None
-    for idx, val in enumerate(output_df[outlet_col]):
-        if is_total_row(val):
-            total_row_idx = idx
-            break
-    
-    if total_row_idx is not None:
-        for col in month_cols:
-            output_df.loc[total_row_idx, col] = output_df.loc[outlet_mask, col].sum()
-        # Add totals for allocations
-        output_df.loc[total_row_idx, 'Allocated_Monthly_Target'] = working_df['Allocated_Monthly_Target'].sum()
-        output_df.loc[total_row_idx, 'Allocated_Daily_Target'] = working_df['Allocated_Daily_Target'].sum()
-    
-    return output_df
-
-
-def export_to_excel(df):
-    """Export dataframe to Excel bytes with error handling."""
-    try:
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, sheet_name='Allocations', index=False)
-            
-            # Format the worksheet
-            workbook = writer.book
-            worksheet = writer.sheets['Allocations']
-            
-            # Format currency columns
-            currency_format = workbook.add_format({'num_format': '#,##0.00'})
-            percent_format = workbook.add_format({'num_format': '0.00"%"'})
-            
-            for col_num, col_name in enumerate(df.columns, 1):
-                if 'Contribution' in col_name or 'Allocated' in col_name or 'Target' in col_name:
-                    fmt = currency_format if 'Target' in col_name or 'Allocated' in col_name else percent_format
-                    worksheet.set_column(col_num - 1, col_num - 1, 15, fmt)
-                else:
-                    worksheet.set_column(col_num - 1, col_num - 1, 20)
+    with st.sidebar.expander("🛠️ Admin: Shared Cache"):
+        # Counters are filled in after the admin controls so a clear shows up
+        # in the same run
+        summary = st.container()
+        if not ADMIN_TOKEN:
+            st.caption("Set TARGET_APP_ADMIN_TOKEN on the server to enable clearing the cache")
+        else:
+            token = st.text_input("Admin token", type="password", key="admin_token")
+            if token and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+                if st.button("Clear cache", key="clear_shared_cache"):
+                    cache.clear()
         
-        output.seek(0)
-        return output
-    
-    except Exception as e:
-        raise Exception(f"Failed to generate Excel file: {str(e)}")
+        stats = cache.stats()
+        summary.write(f"**Entries:** {stats['entries']}")
+        summary.write(
+            f"**Memory:** {stats['used_bytes'] / 1024 / 1024:,.1f} MB "
+            f"/ {stats['max_bytes'] / 1024 / 1024:,.0f} MB"
+        )
+        summary.write(f"**Hits:** {stats['hits']} | **Misses:** {stats['misses']} ({stats['hit_rate']:.0f}% hit rate)")
+        summary.write(f"**Evictions:** {stats['evictions']}")
 
 
 # ============================================================================
 # STREAMLIT APP INTERFACE
 # ============================================================================
 
+shared_cache = get_shared_cache()
+
 # Sidebar for file upload
 st.sidebar.header("📁 Data Upload")
-uploaded_file = st.sidebar.file_uploader(
-    "Upload Excel file with sales data",
-    type=['xlsx', 'xls', 'csv'],
-    help="File should have outlet names in first column and monthly sales data"
+input_format = st.sidebar.radio(
+    "Input format",
+    ["Monthly sheet", "Transaction rows"],
+    key="input_format",
+    help="Transaction rows: one row per sale (or per outlet per day) with outlet, date and amount columns"
 )
+if input_format == "Transaction rows":
+    transaction_source = "Upload"
+    if TRANSACTION_DIR:
+        transaction_source = st.sidebar.radio(
+            "Transaction source",
+            ["Upload", "Server folder"],
+            horizontal=True,
+            key="transaction_source",
+            help="Server folder reads large files in place, without the upload size limit"
+        )
+    if transaction_source == "Server folder":
+        server_file = st.sidebar.selectbox(
+            "Transaction file",
+            [None] + list_transaction_files(TRANSACTION_DIR),
+            format_func=lambda name: "Choose a file..." if name is None else name,
+            key="transaction_server_file"
+        )
+        uploaded_file = (
+            ServerTransactionFile(os.path.join(TRANSACTION_DIR, server_file)) if server_file else None
+        )
+    else:
+        uploaded_file = st.sidebar.file_uploader(
+            "Upload transaction file (CSV or Parquet)",
+            type=['csv', 'parquet'],
+            key="transaction_file",
+            help=(
+                "Aggregated to monthly sales per outlet. Uploads are held in memory and "
+                "limited by server.maxUploadSize (50 MB)"
+            )
+        )
+else:
+    uploaded_file = st.sidebar.file_uploader(
+        "Upload Excel file with sales data",
+        type=['xlsx', 'xls', 'csv'],
+        help="File should have outlet names in first column and monthly sales data"
+    )
+
+transaction_map = None
+if uploaded_file is not None and input_format == "Transaction rows":
+    st.sidebar.header("🧾 Transaction Columns")
+    try:
+        transaction_file_type = 'parquet' if uploaded_file.name.lower().endswith('.parquet') else 'csv'
+        if isinstance(uploaded_file, ServerTransactionFile):
+            transaction_columns = read_transaction_columns(uploaded_file.path, transaction_file_type)
+        else:
+            transaction_columns = read_transaction_columns(uploaded_file, transaction_file_type)
+            uploaded_file.seek(0)
+    except Exception as e:
+        st.error(f"❌ Failed to read transaction file header: {str(e)}")
+        st.stop()
+    
+    guesses = guess_transaction_columns(transaction_columns)
+    transaction_map = {}
+    for role, label in (('outlet', 'Outlet column'), ('date', 'Date column'), ('amount', 'Amount column')):
+        default = guesses[role] if guesses[role] is not None else transaction_columns[0]
+        transaction_map[role] = st.sidebar.selectbox(
+            label,
+            transaction_columns,
+            index=transaction_columns.index(default),
+            key=f"transaction_{role}_col"
+        )
+    date_format_label = st.sidebar.selectbox(
+        "Date format",
+        ["Auto-detect"] + list(DATE_FORMATS),
+        key="transaction_date_format",
+        help="Auto-detect checks the first rows; pick a format if day and month are ambiguous"
+    )
+    transaction_map['date_format'] = 'auto' if date_format_label == "Auto-detect" else date_format_label
+
+if uploaded_file is not None:
+    # Sidebar for allocation rules
+    st.sidebar.header("⚙️ Allocation Rules")
+    excluded_text = st.sidebar.text_area(
+        "Excluded outlets (one per line)",
+        value="\n".join(DEFAULT_EXCLUDED_OUTLETS),
+        help="These outlets receive 0 allocation and must exist in the file"
+    )
+    rules_file = st.sidebar.file_uploader(
+        "Optional rules file (floors, caps, growth limits)",
+        type=['xlsx', 'csv'],
+        key="rules_file",
+        help="Columns: OUTLET NAME | MIN TARGET | MAX TARGET | MIN GROWTH % | MAX GROWTH % | EXCLUDE"
+    )
+    compute_backend = st.sidebar.selectbox(
+        "Compute backend",
+        ['auto'] + available_backends(),
+        key="compute_backend",
+        help="auto picks the fastest measured backend for the number of shops; all give identical results"
+    )
 
 if uploaded_file is not None:
     try:
@@ -574,11 +594,31 @@ if uploaded_file is not None:
         # STEP 1: FILE LOAD WITH ERROR HANDLING
         # ====================================================================
         
+        outlet_days = None
+        
         try:
-            if uploaded_file.name.endswith('.csv'):
-                df = pd.read_csv(uploaded_file)
-            elif uploaded_file.name.endswith(('.xlsx', '.xls')):
-                df = pd.read_excel(uploaded_file)
+            if transaction_map is not None:
+                with st.spinner("Aggregating transactions..."):
+                    ingest, file_hash, ingest_error = load_transactions(
+                        uploaded_file, transaction_map, shared_cache
+                    )
+                if ingest is None:
+                    st.error(ingest_error)
+                    st.stop()
+                df = ingest['monthly']
+                outlet_days = ingest['outlet_days']
+                st.sidebar.info(
+                    f"🧾 {ingest['rows_read']:,} transaction rows → {len(ingest['coverage'])} outlets "
+                    f"× {len(ingest['coverage'].columns) - 1} months ({ingest['engine']})"
+                )
+                if ingest['date_format']:
+                    st.sidebar.caption(f"Dates read as {ingest['date_format']}")
+                if ingest['invalid_dates']:
+                    st.sidebar.warning(
+                        f"⚠️ {ingest['invalid_dates']:,} rows skipped: missing or unreadable date"
+                    )
+            elif uploaded_file.name.endswith(('.csv', '.xlsx', '.xls')):
+                df, file_hash = load_dataset(uploaded_file, shared_cache)
             else:
                 st.error(f"❌ Unsupported file type: {uploaded_file.name}")
                 st.stop()
@@ -594,6 +634,10 @@ if uploaded_file is not None:
                 st.stop()
             
             st.sidebar.success("✅ File loaded successfully!")
+            
+            # Patch export keeps the customer's own formatting, formulas and
+            # other sheets; only possible for an uploaded .xlsx workbook
+            can_patch = transaction_map is None and uploaded_file.name.lower().endswith('.xlsx')
         
         except pd.errors.EmptyDataError:
             st.error("❌ File appears corrupted or empty. Please check the file and try again.")
@@ -610,12 +654,63 @@ if uploaded_file is not None:
         # ====================================================================
         
         outlet_col, month_cols, target_col, validation_errors = classify_columns(df)
+        target_cols, target_errors = classify_target_columns(df, month_cols)
+        if len(target_cols) > 1:
+            # classify_columns keeps the last target column; the single-month
+            # section allocates the nearest one, and every column is checked
+            target_col = target_cols[0]
+            validation_errors = [e for e in validation_errors if e not in target_errors] + target_errors
+        
+        # Allocation rules: excluded outlets plus optional per-outlet limits
+        excluded_outlets = [line.strip() for line in excluded_text.splitlines() if line.strip()]
+        if rules_file is not None:
+            try:
+                if rules_file.name.endswith('.csv'):
+                    rules_df = pd.read_csv(rules_file)
+                else:
+                    rules_df = pd.read_excel(rules_file)
+                rules, rule_errors = parse_allocation_rules(rules_df, excluded_outlets)
+            except Exception as e:
+                rules, rule_errors = None, [f"❌ Failed to read rules file: {str(e)}"]
+            
+            if rule_errors:
+                st.error("❌ Allocation rules file is invalid:")
+                for error in rule_errors:
+                    st.write(f"  {error}")
+                st.stop()
+        else:
+            rules = build_allocation_rules(excluded_outlets)
+        excluded_label = ', '.join(rules['excluded'].values()) or 'none'
+        
+        # Normalized outlet keys + hash index, built once per uploaded file
+        outlet_index = get_outlet_index(df, outlet_col, file_hash, shared_cache)
+        outlet_count = int((~outlet_index['total_mask']).sum())
+        
+        if outlet_index['duplicates']:
+            validation_errors.append(
+                f"⚠️ Duplicate outlet names: {', '.join(outlet_index['duplicates'][:10])}"
+            )
+        
+        # Compare with the previous upload in this session (row hashes per outlet)
+        upload_snapshot = st.session_state.get('upload_snapshot')
+        if upload_snapshot is None or upload_snapshot['file_hash'] != file_hash:
+            current_snapshot = fingerprint_upload(df, outlet_col, month_cols, outlet_index, file_hash)
+            st.session_state.pop('upload_diff', None)
+            if upload_snapshot is not None and upload_snapshot['outlet_col'] == outlet_col:
+                # Without a diff the next calculation simply recomputes everything
+                try:
+                    st.session_state.upload_diff = diff_uploads(upload_snapshot, current_snapshot)
+                except Exception as e:
+                    st.sidebar.warning(f"⚠️ Could not compare with the previous upload: {str(e)}")
+            st.session_state.upload_snapshot = current_snapshot
         
         # ====================================================================
         # STEP 3: PRIMARY EXCEL STRUCTURE VALIDATION
         # ====================================================================
         
-        is_valid_structure, structure_errors = validate_excel_structure(df, outlet_col)
+        is_valid_structure, structure_errors = validate_excel_structure(
+            df, outlet_col, outlet_index, excluded_outlets=list(rules['excluded'].values())
+        )
         if not is_valid_structure:
             st.error("❌ File structure is invalid:")
             for error in structure_errors:
@@ -627,10 +722,12 @@ if uploaded_file is not None:
         # Display file info
         st.sidebar.markdown("---")
         st.sidebar.subheader("📋 File Information")
-        st.sidebar.write(f"**Outlets:** {len(df[df[outlet_col].apply(lambda x: not is_total_row(x))])}")
+        st.sidebar.write(f"**Outlets:** {outlet_count}")
         st.sidebar.write(f"**Historical Months:** {len(month_cols)}")
         st.sidebar.write(f"**Outlet Column:** {outlet_col}")
-        if target_col:
+        if len(target_cols) > 1:
+            st.sidebar.write(f"**Target Columns:** {', '.join(target_cols)}")
+        elif target_col:
             st.sidebar.write(f"**Target Column:** {target_col}")
         
         # Display validation errors (if any non-critical issues)
@@ -643,14 +740,37 @@ if uploaded_file is not None:
         st.header("📊 Current Data")
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Total Outlets", len(df[df[outlet_col].apply(lambda x: not is_total_row(x))]))
+            st.metric("Total Outlets", outlet_count)
         with col2:
             st.metric("Historical Months", len(month_cols))
         with col3:
             company_total_all = df[month_cols].sum().sum()
             st.metric("Company Total Sales", f"₨ {company_total_all:,.0f}")
         
-        st.dataframe(df, use_container_width=True, height=300)
+        raw_view = st.radio(
+            "Raw data view",
+            ["Summary", "Browse rows"],
+            horizontal=True,
+            key="raw_view",
+            help="Summary is fastest for large files; Browse rows shows one page at a time"
+        )
+        if raw_view == "Summary":
+            st.dataframe(
+                summarize_numeric_columns(df, month_cols),
+                use_container_width=True,
+                hide_index=True
+            )
+        else:
+            render_paginated_table(
+                df,
+                key="raw_table",
+                search_col=outlet_col,
+                search_keys=outlet_index['keys']
+            )
+        
+        upload_diff = st.session_state.get('upload_diff')
+        if upload_diff is not None:
+            render_upload_diff(upload_diff)
         
         # Display months and target info
         with st.expander("ℹ️ Column Analysis"):
@@ -665,6 +785,18 @@ if uploaded_file is not None:
                 else:
                     st.write("**Target Column:** Not found (will create new one)")
         
+        if outlet_days is not None:
+            with st.expander("📅 Trading Day Coverage"):
+                st.caption(
+                    "Days with at least one transaction per outlet and month. "
+                    "Daily averages use these days instead of full calendar months."
+                )
+                render_paginated_table(
+                    ingest['coverage'],
+                    key="coverage_table",
+                    search_col=outlet_col
+                )
+        
         # ====================================================================
         # TARGET ALLOCATION SECTION
         # ====================================================================
@@ -687,8 +819,7 @@ if uploaded_file is not None:
             st.write(f"**Target Amount:** ₨ {new_target:,.2f}")
         
         with col3:
-            current_outlet_count = len(df[df[outlet_col].apply(lambda x: not is_total_row(x))])
-            st.write(f"**Number of Outlets:** {current_outlet_count}")
+            st.write(f"**Number of Outlets:** {outlet_count}")
         
         # Validate target before allowing calculation
         if new_target <= 0:
@@ -700,23 +831,67 @@ if uploaded_file is not None:
             if st.button("🔄 Calculate Allocations", key="allocate", type="primary"):
                 try:
                     with st.spinner("Calculating allocations..."):
+                        contributions_key = (
+                            'contributions', file_hash, tuple(month_cols), tuple(sorted(rules['excluded']))
+                        )
+                        cached_contributions = shared_cache.get(contributions_key)
+                        contributions, recomputed_count = cached_contributions, None
+                        if contributions is None and outlet_days is None:
+                            contributions, recomputed_count = incremental_contributions(
+                                df, month_cols, outlet_index, rules, file_hash
+                            )
                         working_df, metadata, validation = calculate_allocations(
-                            df, outlet_col, month_cols, target_col, new_target
+                            df, outlet_col, month_cols, target_col, new_target,
+                            contributions=contributions,
+                            outlet_index=outlet_index,
+                            rules=rules,
+                            outlet_days=outlet_days,
+                            backend=compute_backend
                         )
+                        if cached_contributions is None and validation['success']:
+                            shared_cache.put(contributions_key, working_df[CONTRIBUTION_COLUMNS])
                     
                     if validation['success']:
+                        # Diff against the previous run before it is replaced
+                        previous_df = st.session_state.get('working_df')
+                        if previous_df is not None and outlet_col in previous_df.columns:
+                            st.session_state.allocation_changes = allocation_changes(
+                                previous_df, working_df, outlet_col
+                            )
+                        else:
+                            st.session_state.pop('allocation_changes', None)
+                        remember_historical_totals(working_df, outlet_col, month_cols, rules, file_hash)
+                        
                         # Store in session state
                         st.session_state.working_df = working_df
+                        # Search keys belong to this run, not to whatever file is uploaded later
+                        st.session_state.working_search_keys = normalize_outlet_keys(working_df[outlet_col])
                         st.session_state.metadata = metadata
                         st.session_state.validation = validation
                         st.session_state.new_target = new_target
+                        st.session_state.charts = build_allocation_charts(working_df, outlet_col)
+                        st.session_state.pop('risk', None)
                         
                         # Show success message
                         st.success(
                             f"✅ Calculation successful!\n\n"
                             f"Target allocated to {metadata['eligible_shops_count']} shops "
-                            f"(excluding DIP PLANT)"
+                            f"(excluding {excluded_label})"
                         )
+                        
+                        if recomputed_count is not None:
+                            st.caption(
+                                f"♻️ Reused historical totals from the previous upload; "
+                                f"recomputed {recomputed_count:,} changed outlets"
+                            )
+                        
+                        run_id, archive_error = archive_run(
+                            ARCHIVE_DIR, working_df, outlet_col, metadata, uploaded_file.name
+                        )
+                        if archive_error:
+                            st.warning(archive_error)
+                        else:
+                            st.caption(f"🗄️ Archived as run {run_id}")
                     else:
                         st.error(f"❌ Calculation failed: {validation['error']}")
                 
@@ -746,13 +921,20 @@ if uploaded_file is not None:
                 else:
                     st.success(f"✅ Allocation validated!")
             
-            # Display DIP PLANT exclusion status
+            # Display exclusion status
+            excluded_label = ', '.join(metadata['excluded_outlets']) or 'none'
             st.info(
-                f"🚫 **DIP PLANT EXCLUDED**\n\n"
-                f"Allocation calculated for **{metadata['eligible_shops_count']} shops only** (excluding DIP PLANT)\n"
-                f"DIP PLANT allocation = ₨ 0.00"
+                f"🚫 **{excluded_label.upper()} EXCLUDED**\n\n"
+                f"Allocation calculated for **{metadata['eligible_shops_count']} shops only** (excluding {excluded_label})\n"
+                f"{excluded_label} allocation = ₨ 0.00"
             )
             
+            if metadata['constrained_shops_count']:
+                st.info(
+                    f"📏 **{metadata['constrained_shops_count']} shops held at a floor or cap** "
+                    f"— the remainder was redistributed proportionally to the other shops"
+                )
+            
             # ====================================================================
             # SUMMARY METRICS SECTION
             # ====================================================================
@@ -780,7 +962,7 @@ if uploaded_file is not None:
                 st.metric(
                     "Eligible Shops",
                     metadata['eligible_shops_count'],
-                    delta="(excl. DIP PLANT)"
+                    delta=f"(excl. {excluded_label})"
                 )
             
             with summary_col4:
@@ -817,6 +999,30 @@ if uploaded_file is not None:
             with col4:
                 st.metric("Company Daily Avg", f"₨ {metadata['company_daily_average']:,.0f}")
             
+            changes_df = st.session_state.get('allocation_changes')
+            if changes_df is not None:
+                with st.expander(f"🔁 Changes vs Previous Run ({len(changes_df):,} outlets)"):
+                    if changes_df.empty:
+                        st.caption("No outlet's monthly target changed.")
+                    else:
+                        st.caption(
+                            f"Targets moved by ₨ {changes_df['Change'].abs().sum():,.2f} in total. "
+                            "Largest changes first."
+                        )
+                        render_paginated_table(
+                            changes_df,
+                            key="allocation_changes_table",
+                            search_col='Outlet Name',
+                            column_config={
+                                col: st.column_config.NumberColumn(format="₨ %,.2f")
+                                for col in ['Previous Target', 'New Target', 'Change']
+                            }
+                        )
+            
+            # Charts are aggregated once per calculation, not on every rerun
+            st.subheader("📉 Allocation Charts")
+            render_allocation_charts(st.session_state.charts)
+            
             # Display detailed results table
             st.subheader("📈 Outlet-wise Allocation (Day-Aware)")
             
@@ -838,30 +1044,130 @@ if uploaded_file is not None:
                 'Daily Target'
             ]
             
+            if metadata['constrained_shops_count']:
+                display_df['Rule'] = working_df['Constraint_Applied']
+            
             # Format for display
-            st.dataframe(
-                display_df,
-                use_container_width=True,
-                column_config={
-                    "Historical Total": st.column_config.NumberColumn(format="₨ %,.2f"),
-                    "Daily Average": st.column_config.NumberColumn(format="₨ %,.2f"),
-                    "Monthly Target": st.column_config.NumberColumn(format="₨ %,.2f"),
-                    "Daily Target": st.column_config.NumberColumn(format="₨ %,.2f"),
-                    "Contribution %": st.column_config.NumberColumn(format="%.2f%%"),
-                }
+            result_column_config = {
+                "Historical Total": st.column_config.NumberColumn(format="₨ %,.2f"),
+                "Daily Average": st.column_config.NumberColumn(format="₨ %,.2f"),
+                "Monthly Target": st.column_config.NumberColumn(format="₨ %,.2f"),
+                "Daily Target": st.column_config.NumberColumn(format="₨ %,.2f"),
+                "Contribution %": st.column_config.NumberColumn(format="%.2f%%"),
+            }
+            
+            # Attainment risk (Monte Carlo), shown as extra table columns once run
+            with st.expander("🎲 Attainment Risk (Monte Carlo)", expanded='risk' in st.session_state):
+                st.caption(
+                    "Simulates next-month sales from each outlet's historical month-to-month "
+                    "variability, with a shared company-wide swing, and counts how often each "
+                    "outlet reaches its target."
+                )
+                risk_col1, risk_col2 = st.columns([1, 1])
+                with risk_col1:
+                    simulations = st.number_input(
+                        "Simulations",
+                        min_value=1000,
+                        max_value=100000,
+                        value=DEFAULT_SIMULATIONS,
+                        step=5000,
+                        key="risk_simulations"
+                    )
+                with risk_col2:
+                    st.write("")
+                    run_risk = st.button("🎲 Run risk simulation", key="run_risk")
+                
+                if run_risk:
+                    with st.spinner("Simulating..."):
+                        # Months of the stored run, which may predate the current upload
+                        risk_df, risk_summary, risk_error = simulate_attainment(
+                            working_df, metadata['historical_months'], metadata, simulations=simulations
+                        )
+                    if risk_df is None:
+                        st.error(risk_error)
+                    else:
+                        st.session_state.risk = {'df': risk_df, 'summary': risk_summary}
+                
+                if 'risk' in st.session_state:
+                    risk_summary = st.session_state.risk['summary']
+                    risk_m1, risk_m2, risk_m3 = st.columns(3)
+                    with risk_m1:
+                        st.metric("Company Hits Target", f"{risk_summary['company_probability']:.1f}%")
+                    with risk_m2:
+                        st.metric(
+                            "Company Sales P10 – P90",
+                            f"₨ {risk_summary['company_p10'] / 1e6:,.1f}M – {risk_summary['company_p90'] / 1e6:,.1f}M"
+                        )
+                    with risk_m3:
+                        st.metric("Outlets Below 50%", risk_summary['outlets_below_half'])
+                    st.caption(
+                        f"{risk_summary['simulations']:,} simulations × {risk_summary['outlets']:,} outlets "
+                        f"in {risk_summary['seconds']:.1f}s"
+                    )
+            
+            if 'risk' in st.session_state:
+                risk_df = st.session_state.risk['df']
+                display_df['Hit Probability %'] = risk_df['Attainment_Probability_%']
+                display_df['P10 Sales'] = risk_df['Simulated_P10']
+                display_df['P90 Sales'] = risk_df['Simulated_P90']
+                result_column_config.update({
+                    "Hit Probability %": st.column_config.ProgressColumn(format="%.1f%%", min_value=0, max_value=100),
+                    "P10 Sales": st.column_config.NumberColumn(format="₨ %,.0f"),
+                    "P90 Sales": st.column_config.NumberColumn(format="₨ %,.0f"),
+                })
+            
+            result_view = st.radio(
+                "Result view",
+                ["Summary", "Browse all outlets"],
+                horizontal=True,
+                key="result_view"
             )
+            if result_view == "Summary":
+                st.caption("Top 10 outlets by monthly target")
+                st.dataframe(
+                    display_df.nlargest(10, 'Monthly Target'),
+                    use_container_width=True,
+                    column_config=result_column_config
+                )
+            else:
+                render_paginated_table(
+                    display_df,
+                    key="result_table",
+                    search_col='Outlet Name',
+                    column_config=result_column_config,
+                    search_keys=st.session_state.get('working_search_keys')
+                )
             
             # Export section
             st.markdown("---")
             st.subheader("💾 Export Updated File")
             
-            try:
-                output_df = create_output_dataframe(
-                    df, working_df, outlet_col, month_cols, target_col, metadata
+            export_mode = "New workbook"
+            if can_patch:
+                export_mode = st.radio(
+                    "Export format",
+                    ["New workbook", "Patch original workbook"],
+                    horizontal=True,
+                    key="export_mode",
+                    help="Patch original workbook writes the allocations into your uploaded file "
+                         "and leaves everything else untouched"
                 )
-                
-                # Prepare download
-                excel_bytes = export_to_excel(output_df)
+            
+            try:
+                if export_mode == "Patch original workbook":
+                    excel_bytes, patch_error = patch_single_month_export(
+                        uploaded_file.getvalue(), working_df, outlet_col, target_col
+                    )
+                    if patch_error:
+                        raise Exception(patch_error)
+                else:
+                    output_df = create_output_dataframe(
+                        df, working_df, outlet_col, month_cols, target_col, metadata,
+                        outlet_index=outlet_index
+                    )
+                    
+                    # Prepare download
+                    excel_bytes = export_to_excel(output_df)
                 
                 timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                 filename = f"Target_Allocation_{timestamp}.xlsx"
@@ -885,6 +1191,133 @@ if uploaded_file is not None:
                 "3. Add a new column for the next month's target\n"
                 "4. Upload the file again - the system will automatically detect the new structure!"
             )
+        
+        # ====================================================================
+        # MULTI-MONTH ALLOCATION SECTION
+        # ====================================================================
+        
+        if len(target_cols) > 1:
+            st.markdown("---")
+            st.header("📅 Multi-Month Allocation")
+            st.write(
+                f"**{len(target_cols)} target months detected.** "
+                f"All months are allocated together from the same contribution %."
+            )
+            
+            target_amounts = {}
+            input_cols = st.columns(min(len(target_cols), 6))
+            for i, col in enumerate(target_cols):
+                with input_cols[i % len(input_cols)]:
+                    target_amounts[col] = st.number_input(
+                        f"{target_month_label(col)} Target (PKR)",
+                        value=3200000.0,
+                        min_value=1.0,
+                        step=100000.0,
+                        key=f"multi_target_{col}"
+                    )
+            
+            if st.button("🔄 Calculate All Months", key="allocate_multi", type="primary"):
+                try:
+                    with st.spinner("Calculating allocations for all months..."):
+                        contributions_key = (
+                            'contributions', file_hash, tuple(month_cols), tuple(sorted(rules['excluded']))
+                        )
+                        contributions = shared_cache.get(contributions_key)
+                        multi_working_df, multi_metadata, multi_validation = calculate_multi_month_allocations(
+                            df, outlet_col, month_cols, target_amounts,
+                            contributions=contributions,
+                            outlet_index=outlet_index,
+                            rules=rules,
+                            outlet_days=outlet_days,
+                            backend=compute_backend
+                        )
+                        if contributions is None and multi_validation['success']:
+                            shared_cache.put(contributions_key, multi_working_df[CONTRIBUTION_COLUMNS])
+                    
+                    if multi_validation['success']:
+                        st.session_state.multi_working_df = multi_working_df
+                        st.session_state.multi_search_keys = normalize_outlet_keys(multi_working_df[outlet_col])
+                        st.session_state.multi_metadata = multi_metadata
+                        
+                        for month in multi_metadata['target_months']:
+                            _, archive_error = archive_run(
+                                ARCHIVE_DIR, multi_working_df, outlet_col, multi_metadata, uploaded_file.name,
+                                month_label=month['month'], allocation_suffix=f" ({month['month']})"
+                            )
+                            if archive_error:
+                                st.warning(f"{month['month']}: {archive_error}")
+                    else:
+                        st.error(f"❌ Calculation failed: {multi_validation['error']}")
+                
+                except Exception as e:
+                    st.error(
+                        f"❌ Unexpected error during calculation:\n"
+                        f"{str(e)}\n\n"
+                        f"Please check your data and try again."
+                    )
+            
+            if 'multi_working_df' in st.session_state:
+                multi_working_df = st.session_state.multi_working_df
+                multi_metadata = st.session_state.multi_metadata
+                
+                metric_cols = st.columns(min(len(multi_metadata['target_months']), 6))
+                for i, month in enumerate(multi_metadata['target_months']):
+                    with metric_cols[i % len(metric_cols)]:
+                        st.metric(
+                            f"{month['month']} ({month['days']} days)",
+                            f"₨ {month['final_allocated']:,.0f}",
+                            delta="✓ Match" if month['validation_passed'] else "⚠️ Mismatch"
+                        )
+                
+                multi_display_df = multi_working_df[[outlet_col, 'Contribution_%']].rename(
+                    columns={outlet_col: 'Outlet Name', 'Contribution_%': 'Contribution %'}
+                )
+                multi_column_config = {"Contribution %": st.column_config.NumberColumn(format="%.2f%%")}
+                for month in multi_metadata['target_months']:
+                    label = f"{month['month']} Target"
+                    multi_display_df[label] = multi_working_df[f"Allocated_Monthly_Target ({month['month']})"]
+                    multi_column_config[label] = st.column_config.NumberColumn(format="₨ %,.2f")
+                
+                render_paginated_table(
+                    multi_display_df,
+                    key="multi_result_table",
+                    search_col='Outlet Name',
+                    column_config=multi_column_config,
+                    search_keys=st.session_state.get('multi_search_keys')
+                )
+                
+                multi_export_mode = "New workbook"
+                if can_patch:
+                    multi_export_mode = st.radio(
+                        "Export format",
+                        ["New workbook", "Patch original workbook"],
+                        horizontal=True,
+                        key="multi_export_mode"
+                    )
+                
+                try:
+                    if multi_export_mode == "Patch original workbook":
+                        multi_excel_bytes, patch_error = patch_multi_month_export(
+                            uploaded_file.getvalue(), multi_working_df, outlet_col, multi_metadata
+                        )
+                        if patch_error:
+                            raise Exception(patch_error)
+                    else:
+                        multi_output_df = create_multi_month_output_dataframe(
+                            df, multi_working_df, outlet_col, month_cols, multi_metadata,
+                            outlet_index=outlet_index
+                        )
+                        multi_excel_bytes = export_to_excel(multi_output_df)
+                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    st.download_button(
+                        label="📥 Download Multi-Month Excel",
+                        data=multi_excel_bytes,
+                        file_name=f"Target_Allocation_MultiMonth_{timestamp}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        key="download_excel_multi"
+                    )
+                except Exception as e:
+                    st.error(f"❌ Failed to generate download file: {str(e)}")
     
     except Exception as e:
         st.error(f"❌ Unexpected error: {str(e)}")
@@ -932,9 +1365,9 @@ else:
         1. **Calculate Historical Total:** Sum of all actual sales for each outlet across all months
         2. **Company Total:** Sum of all outlet historical totals
         3. **Contribution %:** (Outlet Historical Total / Company Total) × 100
-        4. **Allocated Target:** (Contribution % / 100) × New Target
+        4. **Allocated Target:** (Outlet Daily Average / Company Daily Average) × New Target. The daily averages are rounded to the paisa; the share is not rounded (the displayed Contribution % is)
         5. **Validation:** Sum of all allocated targets ≈ New target (within 0.01 tolerance)
-        6. **Rounding Adjustment:** If discrepancy exists, distributed proportionally
+        6. **Rounding Adjustment:** Targets are rounded to the paisa by largest remainder: the missing paisas go one each to the outlets with the largest rounded-off fractions, so the total matches exactly and no target can go negative
         
         ### Ignored Elements:
         - ✗ TOTAL row
@@ -943,6 +1376,20 @@ else:
         """)
 
 
+# ============================================================================
+# ALLOCATION HISTORY SECTION
+# ============================================================================
+
+st.markdown("---")
+st.header("📚 Allocation History")
+if st.checkbox("Show archived allocations", key="show_history"):
+    try:
+        render_history_view(ARCHIVE_DIR)
+    except Exception as e:
+        st.error(f"❌ Failed to read allocation archive: {str(e)}")
+
+render_cache_admin_panel(shared_cache)
+
 # Footer
 st.markdown("---")
 st.markdown(
@@ -0,0 +1,155 @@
+"""
+Parity check and benchmark for the compute backends in allocation_backends.
+
+Usage:
+    python backend_benchmark.py                 # synthetic sheets, 100 to 1,000,000 shops
+    python backend_benchmark.py sales.xlsx      # also check parity on a real workbook
+
+Parity: every available backend must give exactly the same contributions
+and allocations (to the paisa) as the pandas reference, with calendar days,
+with per-outlet trading days and with floors/caps. The benchmark times the
+contribution stage per backend; AUTO_BACKEND_THRESHOLDS is set from it.
+The quick parity check on every test run is tests/test_backend_parity.py.
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from allocation_backends import AUTO_BACKEND_THRESHOLDS, available_backends
+from allocation_core import (
+    CONTRIBUTION_COLUMNS,
+    RESULT_COLUMNS,
+    build_allocation_rules,
+    build_outlet_index,
+    calculate_allocations,
+    classify_columns,
+    parse_allocation_rules,
+    prepare_allocation_base,
+)
+
+BENCHMARK_SIZES = (100, 1_000, 10_000, 100_000, 300_000, 1_000_000)
+PARITY_SIZES = (100, 10_000, 200_000)
+MONTHS = ['Jul 2025', 'Aug 2025', 'Sep 2025', 'Oct 2025', 'Nov 2025', 'Dec 2025', 'Jan 2026']
+
+
+def make_sheet(shop_count, seed=0):
+    """Synthetic monthly sheet: DIP PLANT + shops + TOTAL, sales with paisa."""
+    rng = np.random.default_rng(seed)
+    sales = np.round(rng.lognormal(13, 1, (shop_count + 1, len(MONTHS))), 2)
+    sales[rng.random(sales.shape) < 0.02] = 0
+    df = pd.DataFrame(sales, columns=MONTHS)
+    df.insert(0, 'OUTLET NAME', ['DIP PLANT'] + [f'Shop {i}' for i in range(shop_count)])
+    df['Feb 2026 Target'] = np.nan
+    total_row = {'OUTLET NAME': 'TOTAL', **df[MONTHS].sum().to_dict()}
+    return pd.concat([df, pd.DataFrame([total_row])], ignore_index=True)
+
+
+def make_limits(df, outlet_col, month_cols, outlet_index, seed=0):
+    """Caps on a few large shops and floors on a few small ones."""
+    rng = np.random.default_rng(seed)
+    shop_mask = ~outlet_index['total_mask'] & (outlet_index['keys'] != 'DIP PLANT')
+    shops = df.loc[shop_mask, outlet_col]
+    run_rates = df.loc[shop_mask, month_cols].apply(pd.to_numeric, errors='coerce').sum(axis=1) / 212 * 28
+    picked = rng.choice(len(shops), size=max(2, len(shops) // 50), replace=False)
+    limits = pd.DataFrame({
+        outlet_col: shops.iloc[picked].to_numpy(),
+        'MAX TARGET': np.where(picked % 2 == 0, run_rates.iloc[picked] * 0.8, np.nan),
+        'MIN TARGET': np.where(picked % 2 == 1, run_rates.iloc[picked] * 1.2, np.nan),
+    })
+    rules, errors = parse_allocation_rules(limits, ['DIP PLANT'])
+    return rules if not errors else build_allocation_rules()
+
+
+def compare_results(reference, candidate):
+    """Columns whose values differ between two working DataFrames."""
+    return [
+        col for col in CONTRIBUTION_COLUMNS + RESULT_COLUMNS
+        if not np.array_equal(reference[col].to_numpy(dtype=float), candidate[col].to_numpy(dtype=float))
+    ]
+
+
+def check_parity(df, target_amount=3_200_000_000, label='sheet'):
+    """
+    Run calculate_allocations with every backend and compare to pandas.
+
+    Returns: List of failure descriptions (empty when all backends agree)
+    """
+    outlet_col, month_cols, target_col, _ = classify_columns(df)
+    outlet_index = build_outlet_index(df, outlet_col)
+    rng = np.random.default_rng(1)
+    scenarios = {
+        'calendar days': {},
+        'trading days': {'outlet_days': pd.Series(rng.integers(0, 213, len(df)), index=df.index, dtype=float)},
+        'floors/caps': {'rules': make_limits(df, outlet_col, month_cols, outlet_index)},
+    }
+
+    failures = []
+    for scenario, kwargs in scenarios.items():
+        results = {}
+        for backend in available_backends():
+            working_df, _, validation = calculate_allocations(
+                df, outlet_col, month_cols, target_col, target_amount,
+                outlet_index=outlet_index, backend=backend, **kwargs
+            )
+            if not validation['success']:
+                failures.append(f"{label} / {scenario} / {backend}: {validation['error']}")
+                continue
+            results[backend] = working_df
+        for backend, working_df in results.items():
+            if backend == 'pandas' or 'pandas' not in results:
+                continue
+            differing = compare_results(results['pandas'], working_df)
+            if differing:
+                failures.append(f"{label} / {scenario} / {backend}: differs in {', '.join(differing)}")
+    return failures
+
+
+def time_contribution_stage(df, backend, repeats=5):
+    """Best-of-N seconds for steps 2-9 (prepare_allocation_base)."""
+    outlet_col, month_cols, _, _ = classify_columns(df)
+    outlet_index = build_outlet_index(df, outlet_col)
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        prepare_allocation_base(df, outlet_col, month_cols, outlet_index=outlet_index, backend=backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    backends = available_backends()
+    print(f"Backends available: {', '.join(backends)}")
+
+    # ========== PARITY ==========
+    failures = []
+    for shop_count in PARITY_SIZES:
+        failures += check_parity(make_sheet(shop_count, seed=shop_count), label=f"{shop_count:,} shops")
+    for path in sys.argv[1:]:
+        sheet = pd.read_csv(path) if path.endswith('.csv') else pd.read_excel(path)
+        failures += check_parity(sheet, target_amount=3_200_000, label=path)
+
+    if failures:
+        print("❌ Parity check failed:")
+        for failure in failures:
+            print(f"  - {failure}")
+    else:
+        print("✅ Parity check passed: all backends match pandas to the paisa")
+
+    # ========== BENCHMARK ==========
+    print(f"\n{'Shops':>10} " + ' '.join(f"{name:>10}" for name in backends) + '   fastest')
+    for shop_count in BENCHMARK_SIZES:
+        df = make_sheet(shop_count)
+        timings = {name: time_contribution_stage(df, name, repeats=3 if shop_count >= 100_000 else 7)
+                   for name in backends}
+        fastest = min(timings, key=timings.get)
+        print(f"{shop_count:>10,} " + ' '.join(f"{timings[n] * 1000:>8.2f}ms" for n in backends) + f"   {fastest}")
+
+    print(f"\nCurrent auto thresholds: {AUTO_BACKEND_THRESHOLDS}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,478 @@
+"""
+In-place patch export of the uploaded .xlsx workbook.
+
+Instead of rewriting the file from a DataFrame, the original package is
+copied part by part and only the first worksheet's XML (the sheet pandas
+read) is changed:
+
+- the target column(s) get the allocations
+- allocation columns are appended to the right of the used range (or
+  overwritten when a previous patch already added them)
+- the TOTAL row gets the new totals
+
+Styles, formulas, other sheets, charts, defined names, etc. pass through
+byte for byte. Rows are matched by normalized outlet name, not position.
+"""
+
+import re
+import zipfile
+from functools import lru_cache
+import xml.etree.ElementTree as ET
+from io import BytesIO
+from xml.sax.saxutils import escape, unescape
+
+import numpy as np
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def tag(name):
+    return f'{{{MAIN_NS}}}{name}'
+
+
+# ============================================================================
+# CELL REFERENCES
+# ============================================================================
+
+@lru_cache(maxsize=None)
+def column_index(letters):
+    """'A' → 1, 'AB' → 28."""
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+
+def column_letters(index):
+    """1 → 'A', 28 → 'AB'."""
+    letters = ''
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+# ============================================================================
+# PACKAGE PARTS
+# ============================================================================
+
+def first_sheet_path(package):
+    """Zip path of the first worksheet in workbook order (the one pandas reads)."""
+    workbook = ET.fromstring(package.read('xl/workbook.xml'))
+    first_sheet = workbook.find(f'{tag("sheets")}/{tag("sheet")}')
+    rel_id = first_sheet.get(f'{{{REL_NS}}}id')
+
+    rels = ET.fromstring(package.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.findall(f'{{{PKG_REL_NS}}}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    raise ValueError("First worksheet not found in workbook relationships")
+
+
+def read_shared_strings(package):
+    """List of shared strings (rich text runs joined)."""
+    if 'xl/sharedStrings.xml' not in package.namelist():
+        return []
+    strings = []
+    for _, element in ET.iterparse(BytesIO(package.read('xl/sharedStrings.xml'))):
+        if element.tag == tag('si'):
+            # Plain text or rich text runs; phonetic (rPh) runs are not displayed
+            runs = element.findall(tag('t')) + element.findall(f"{tag('r')}/{tag('t')}")
+            strings.append(''.join(t.text or '' for t in runs))
+            element.clear()
+    return strings
+
+
+# ============================================================================
+# SHEET XML
+# ============================================================================
+
+# The worksheet is edited as bytes: rows are found with these patterns and
+# only rows that change are rebuilt, so untouched rows keep their exact XML
+ROW_PATTERN = re.compile(rb'<((?:\w+:)?)row\b([^>]*?)(/>|>(.*?)</(?:\w+:)?row>)', re.S)
+CELL_PATTERN = re.compile(rb'<(?:\w+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?c>)', re.S)
+ATTRIBUTE_PATTERN = re.compile(rb'([\w:]+)="([^"]*)"')
+VALUE_PATTERN = re.compile(rb'<(?:\w+:)?v>(.*?)</(?:\w+:)?v>', re.S)
+INLINE_TEXT_PATTERN = re.compile(rb'<(?:\w+:)?t\b[^>]*>(.*?)</(?:\w+:)?t>', re.S)
+FORMULA_PATTERN = re.compile(rb'<(?:\w+:)?f\b([^>]*?)(?:/>|>(.*?)</(?:\w+:)?f>)', re.S)
+
+
+def parse_cells(row_body):
+    """
+    Locate the cells of one row without building a tree.
+
+    Returns: Dict column → (start, end, attributes, inner_xml), positions
+    relative to row_body
+    """
+    cells = {}
+    column = 0
+    for match in CELL_PATTERN.finditer(row_body):
+        attributes = dict(ATTRIBUTE_PATTERN.findall(match.group(1)))
+        reference = attributes.get(b'r')
+        # r is optional; a cell without it follows the previous one
+        column = column_index(reference.rstrip(b'0123456789').decode()) if reference else column + 1
+        cells[column] = (match.start(), match.end(), attributes, match.group(2) or b'')
+    return cells
+
+
+def cell_text(cell, shared_strings):
+    """Displayed text of a parsed cell (None when empty)."""
+    _, _, attributes, inner = cell
+    cell_type = attributes.get(b't')
+    if cell_type == b'inlineStr':
+        return unescape(b''.join(INLINE_TEXT_PATTERN.findall(inner)).decode('utf-8'))
+    value = VALUE_PATTERN.search(inner)
+    if value is None:
+        return None
+    if cell_type == b's':
+        return shared_strings[int(value.group(1))]
+    return unescape(value.group(1).decode('utf-8'))
+
+
+def normalize_key(text):
+    """
+    Outlet comparison key for a sheet cell or a working_df value.
+
+    Like allocation_core.normalize_outlet_keys, plus numeric outlet codes
+    match whether they were read as 101 or 101.0.
+    """
+    if text is None or (isinstance(text, float) and np.isnan(text)):
+        return ''
+    text = str(text).strip()
+    if re.fullmatch(r'-?\d+\.0+', text):
+        text = text.split('.')[0]
+    return text.upper()
+
+
+# ============================================================================
+# SHEET PATCHING
+# ============================================================================
+
+def build_cell(prefix, reference, value, style=None, is_text=False, formula=None):
+    """XML for one cell holding a number, an inline string or a cached formula."""
+    attributes = f' r="{reference}"' + (f' s="{style}"' if style is not None else '')
+    if is_text:
+        return (f'<{prefix}c{attributes} t="inlineStr"><{prefix}is><{prefix}t>'
+                f'{escape(str(value))}</{prefix}t></{prefix}is></{prefix}c>').encode('utf-8')
+    if value is None or np.isnan(value):
+        return f'<{prefix}c{attributes}/>'.encode('utf-8')
+    return (f'<{prefix}c{attributes}>{formula.decode("utf-8") if formula else ""}'
+            f'<{prefix}v>{float(value)!r}</{prefix}v></{prefix}c>').encode('utf-8')
+
+
+def patch_row(row_match, cells, writes, last_column):
+    """
+    Rebuild one <row> with new cell XML, keeping all other cells as they are.
+
+    writes: Dict column → cell XML (replaces an existing cell or is
+    inserted in column order)
+
+    Returns: Row XML
+    """
+    prefix, row_attributes = row_match.group(1), row_match.group(2)
+    body = row_match.group(4) or b''
+
+    pieces, position = [], 0
+    pending = sorted(column for column in writes if column not in cells)
+    for column in sorted(cells):
+        start, end, _, _ = cells[column]
+        while pending and pending[0] < column:
+            pieces += [body[position:start], writes[pending.pop(0)]]
+            position = start
+        if column in writes:
+            pieces += [body[position:start], writes[column]]
+            position = end
+    pieces.append(body[position:])
+    pieces += [writes[column] for column in pending]
+
+    # Widen the optional spans="1:8" hint to cover new cells
+    spans = re.search(rb'spans="(\d+):(\d+)"', row_attributes)
+    if spans and int(spans.group(2)) < last_column:
+        row_attributes = (row_attributes[:spans.start()]
+                          + f'spans="{spans.group(1).decode()}:{last_column}"'.encode()
+                          + row_attributes[spans.end():])
+
+    return b''.join([b'<', prefix, b'row', row_attributes, b'>'] + pieces + [b'</', prefix, b'row>'])
+
+
+def patch_sheet(sheet_xml, shared_strings, outlet_col, updates, totals, total_label='TOTAL'):
+    """
+    Apply updates to one worksheet XML.
+
+    Rows are located with regular expressions and only rows that change are
+    rebuilt; everything else is copied byte for byte. A formula in an
+    overwritten cell is removed, except SUM formulas in the TOTAL row, which
+    are kept with an updated cached value.
+
+    updates: Dict normalized outlet key → list of dicts {header: value},
+    one dict per occurrence of the outlet (in sheet order).
+    totals: Dict header → value for the TOTAL row.
+
+    Returns: (patched_xml, formulas_removed, error_message)
+    """
+    data_start = re.search(rb'<(?:\w+:)?sheetData\b[^>]*?(/?)>', sheet_xml)
+    if data_start is None or data_start.group(1):
+        return None, False, "❌ First worksheet has no data"
+    data_end = re.search(rb'</(?:\w+:)?sheetData>', sheet_xml).start()
+    sheet_data = sheet_xml[data_start.end():data_end]
+
+    rows, row_number = [], 0
+    for match in ROW_PATTERN.finditer(sheet_data):
+        number = re.search(rb'\br="(\d+)"', match.group(2))
+        row_number = int(number.group(1)) if number else row_number + 1
+        rows.append((row_number, match))
+
+    # ========== Locate Header Row and Columns ==========
+    header_position, headers, header_cells = None, {}, {}
+    for position, (row_number, match) in enumerate(rows[:50]):
+        cells = parse_cells(match.group(4) or b'')
+        texts = {column: cell_text(cell, shared_strings) for column, cell in cells.items()}
+        if any(text is not None and text.strip() == outlet_col for text in texts.values()):
+            header_position, header_cells = position, cells
+            headers = {text.strip(): column for column, text in texts.items() if text is not None}
+            break
+    if header_position is None:
+        return None, False, f"❌ Header row with '{outlet_col}' not found in the first worksheet"
+
+    outlet_column = headers[outlet_col]
+    last_used = max(header_cells)
+    all_headers = list(dict.fromkeys(
+        [header for values in updates.values() for entry in values for header in entry] + list(totals)
+    ))
+    template_column = next((headers[h] for h in all_headers if h in headers), None)
+
+    def style_of(cells, column):
+        if column not in cells:
+            return None
+        return cells[column][2].get(b's', b'').decode() or None
+
+    header_row_number, header_match = rows[header_position]
+    prefix = header_match.group(1).decode()
+    header_writes = {}
+    for header in all_headers:
+        if header not in headers:
+            last_used += 1
+            headers[header] = last_used
+            header_writes[last_used] = build_cell(
+                prefix, f"{column_letters(last_used)}{header_row_number}", header,
+                style=style_of(header_cells, template_column), is_text=True
+            )
+
+    patched_rows = {}
+    if header_writes:
+        patched_rows[header_position] = patch_row(header_match, header_cells, header_writes, last_used)
+
+    # ========== Patch Outlet Rows and TOTAL Row ==========
+    seen = {}
+    matched = 0
+    formulas_removed = False
+    for position in range(header_position + 1, len(rows)):
+        row_number, match = rows[position]
+        cells = parse_cells(match.group(4) or b'')
+        if outlet_column not in cells:
+            continue
+        key = normalize_key(cell_text(cells[outlet_column], shared_strings))
+
+        is_total = key == total_label
+        if is_total:
+            values = totals
+        elif key in updates:
+            occurrence = seen.get(key, 0)
+            seen[key] = occurrence + 1
+            if occurrence >= len(updates[key]):
+                continue
+            values = updates[key][occurrence]
+            matched += 1
+        else:
+            continue
+
+        template_style = style_of(cells, template_column)
+        writes = {}
+        for header, value in values.items():
+            column = headers[header]
+            reference = f"{column_letters(column)}{row_number}"
+            existing = cells.get(column)
+            style = style_of(cells, column) if existing is not None else template_style
+            formula = FORMULA_PATTERN.search(existing[3]) if existing is not None else None
+
+            if formula is not None:
+                formula_attributes = dict(ATTRIBUTE_PATTERN.findall(formula.group(1)))
+                if b'ref' in formula_attributes and formula_attributes.get(b't') == b'shared':
+                    return None, False, (
+                        f"❌ Cell {reference} holds a shared formula used by other cells; "
+                        "use the standard export instead"
+                    )
+                if is_total and (formula.group(2) or b'').strip().upper().startswith(b'SUM('):
+                    writes[column] = build_cell(prefix, reference, value, style, formula=formula.group(0))
+                    continue
+                formulas_removed = True
+            writes[column] = build_cell(prefix, reference, value, style)
+
+        patched_rows[position] = patch_row(match, cells, writes, last_used)
+
+    if matched == 0:
+        return None, False, "❌ No outlet rows of the allocation were found in the original workbook"
+
+    # ========== Reassemble ==========
+    pieces, offset = [sheet_xml[:data_start.end()]], 0
+    for position, row_xml in sorted(patched_rows.items()):
+        match = rows[position][1]
+        pieces += [sheet_data[offset:match.start()], row_xml]
+        offset = match.end()
+    pieces += [sheet_data[offset:], sheet_xml[data_end:]]
+    patched = b''.join(pieces)
+
+    # Used range
+    dimension = re.search(rb'(<(?:\w+:)?dimension\b[^>]*?\bref=")([^"]*)(")', patched)
+    if dimension is not None:
+        first_ref = dimension.group(2).split(b':')[0].decode()
+        last_row = max(row_number for row_number, _ in rows)
+        patched = (patched[:dimension.start(2)]
+                   + f"{first_ref}:{column_letters(last_used)}{last_row}".encode()
+                   + patched[dimension.end(2):])
+
+    return patched, formulas_removed, None
+
+
+def force_recalculation(workbook_xml):
+    """Set fullCalcOnLoad so formulas that depend on patched cells refresh on open."""
+    text = workbook_xml.decode('utf-8')
+    if re.search(r'<(\w+:)?calcPr\b', text):
+        if 'fullCalcOnLoad=' not in text:
+            text = re.sub(r'<((\w+:)?calcPr)\b', r'<\1 fullCalcOnLoad="1"', text, count=1)
+        else:
+            text = re.sub(r'fullCalcOnLoad="[^"]*"', 'fullCalcOnLoad="1"', text, count=1)
+        return text.encode('utf-8')
+
+    prefix = re.match(r'.*?<(\w+:)?workbook\b', text, re.S).group(1) or ''
+    # calcPr must come before these elements in the schema order
+    following = re.search(
+        rf'<{prefix}(oleSize|customWorkbookViews|pivotCaches|smartTagPr|smartTagTypes|'
+        rf'webPublishing|fileRecoveryPr|webPublishObjects|extLst)\b', text
+    )
+    insert_at = following.start() if following else text.rindex(f'</{prefix}workbook>')
+    return (text[:insert_at] + f'<{prefix}calcPr fullCalcOnLoad="1"/>' + text[insert_at:]).encode('utf-8')
+
+
+def drop_calc_chain(parts):
+    """Remove calcChain.xml and its references; Excel rebuilds it on open."""
+    parts['xl/calcChain.xml'] = None
+    for name, pattern in (
+        ('xl/_rels/workbook.xml.rels', rb'<Relationship [^>]*Target="[^"]*calcChain\.xml"[^>]*/>'),
+        ('[Content_Types].xml', rb'<Override [^>]*PartName="/xl/calcChain\.xml"[^>]*/>'),
+    ):
+        if name in parts:
+            parts[name] = re.sub(pattern, b'', parts[name])
+
+
+def patch_workbook(file_bytes, outlet_col, updates, totals):
+    """
+    Copy an .xlsx package, patching only the first worksheet.
+
+    Returns: (BytesIO, error_message)
+    """
+    try:
+        source = zipfile.ZipFile(BytesIO(file_bytes))
+        sheet_path = first_sheet_path(source)
+        patched_sheet, formulas_removed, error = patch_sheet(
+            source.read(sheet_path), read_shared_strings(source), outlet_col, updates, totals
+        )
+        if error:
+            return None, error
+
+        replaced = {
+            sheet_path: patched_sheet,
+            'xl/workbook.xml': force_recalculation(source.read('xl/workbook.xml')),
+        }
+        if formulas_removed and 'xl/calcChain.xml' in source.namelist():
+            for name in ('xl/_rels/workbook.xml.rels', '[Content_Types].xml'):
+                replaced[name] = source.read(name)
+            drop_calc_chain(replaced)
+
+        output = BytesIO()
+        with zipfile.ZipFile(output, 'w') as target:
+            for info in source.infolist():
+                if info.filename in replaced:
+                    data = replaced[info.filename]
+                    if data is None:
+                        continue
+                    target.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED)
+                else:
+                    # Untouched parts: same bytes, same compression
+                    target.writestr(info, source.read(info.filename))
+        output.seek(0)
+        return output, None
+
+    except zipfile.BadZipFile:
+        return None, "❌ Original file is not an .xlsx workbook; use the standard export instead"
+    except Exception as e:
+        return None, f"❌ Failed to patch workbook: {str(e)}"
+
+
+# ============================================================================
+# ALLOCATION → PATCH VALUES
+# ============================================================================
+
+def build_patch_values(working_df, outlet_col, target_columns, appended_columns):
+    """
+    Turn a working_df into per-outlet cell updates and TOTAL row values.
+
+    target_columns: Dict sheet header → working_df column (written in place)
+    appended_columns: Dict new header → working_df column
+
+    Returns: (updates, totals)
+    """
+    outlet_keys = [normalize_key(value) for value in working_df[outlet_col]]
+    columns = {**target_columns, **appended_columns}
+    values = {header: working_df[col].to_numpy(dtype=float) for header, col in columns.items()}
+
+    updates = {}
+    for position, key in enumerate(outlet_keys):
+        updates.setdefault(key, []).append({header: values[header][position] for header in columns})
+
+    totals = {
+        header: round(float(np.nansum(values[header])), 2)
+        for header, col in columns.items() if col != 'Contribution_%'
+    }
+    return updates, totals
+
+
+def patch_single_month_export(file_bytes, working_df, outlet_col, target_col):
+    """
+    Patch export for calculate_allocations results.
+
+    Returns: (BytesIO, error_message)
+    """
+    updates, totals = build_patch_values(
+        working_df, outlet_col,
+        {target_col: 'Allocated_Monthly_Target'} if target_col else {},
+        {
+            'Contribution %': 'Contribution_%',
+            'Allocated_Monthly_Target': 'Allocated_Monthly_Target',
+            'Allocated_Daily_Target': 'Allocated_Daily_Target',
+        },
+    )
+    return patch_workbook(file_bytes, outlet_col, updates, totals)
+
+
+def patch_multi_month_export(file_bytes, working_df, outlet_col, metadata):
+    """
+    Patch export for calculate_multi_month_allocations results: every
+    target column is filled and a "<Mon YYYY> Daily Target" column appended
+    per month.
+
+    Returns: (BytesIO, error_message)
+    """
+    target_columns = {}
+    appended_columns = {'Contribution %': 'Contribution_%'}
+    for month in metadata['target_months']:
+        target_columns[month['target_col']] = f"Allocated_Monthly_Target ({month['month']})"
+        appended_columns[f"{month['month']} Daily Target"] = f"Allocated_Daily_Target ({month['month']})"
+
+    updates, totals = build_patch_values(
+        working_df, outlet_col, target_columns, appended_columns
+    )
+    return patch_workbook(file_bytes, outlet_col, updates, totals)
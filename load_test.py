@@ -0,0 +1,447 @@
+"""
+Concurrent-session load test for app.py.
+
+Starts a headless Streamlit server on localhost and drives N sessions at
+once over Streamlit's own websocket protocol (no browser, no network
+access needed). Each session works like a planner:
+
+    open app → upload workbook → calculate → download export
+
+For each session count the harness records rerun latency percentiles per
+step, plus server CPU time and resident memory sampled from /proc
+(Linux only). The server archives its runs into a temporary directory
+that is deleted afterwards, so the real run archive stays untouched.
+
+Usage:
+    python load_test.py                              # 1, 2, 4, 8 sessions, 300 shops
+    python load_test.py --sessions 1 4 16 --shops 2000 --rounds 3
+    python load_test.py --same-file --output load_results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+STEPS = ['open', 'upload', 'calculate', 'download']
+SAMPLE_INTERVAL_SECONDS = 0.1
+
+
+# ============================================================================
+# WORKBOOK GENERATION
+# ============================================================================
+
+def generate_workbook(shop_count, month_count=7, seed=0):
+    """
+    Build an .xlsx sales sheet (DIP PLANT + shops + TOTAL) in memory.
+
+    Returns: (file_name, file_bytes)
+    """
+    rng = np.random.default_rng(seed)
+    months = pd.period_range(end='2026-01', periods=month_count, freq='M').strftime('%b %Y').tolist()
+    sales = np.round(rng.lognormal(14, 0.6, (shop_count + 1, month_count)), 0)
+    df = pd.DataFrame(sales, columns=months)
+    df.insert(0, 'OUTLET NAME', ['DIP PLANT'] + [f'Shop {i + 1}' for i in range(shop_count)])
+    df['Feb 2026 Target'] = np.nan
+    df = pd.concat([df, pd.DataFrame([{'OUTLET NAME': 'TOTAL', **df[months].sum().to_dict()}])],
+                   ignore_index=True)
+
+    buffer = BytesIO()
+    df.to_excel(buffer, index=False, sheet_name='Sales')
+    return f'load_test_{seed}.xlsx', buffer.getvalue()
+
+
+# ============================================================================
+# SERVER PROCESS
+# ============================================================================
+
+def free_port():
+    """An unused localhost TCP port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, archive_dir, timeout=60):
+    """
+    Launch `streamlit run app.py` headless on 127.0.0.1.
+
+    XSRF protection is switched off so the harness can upload files without
+    a browser cookie; the server only listens on localhost. Runs are
+    archived into archive_dir (TARGET_APP_ARCHIVE_DIR) instead of the
+    planners' archive.
+
+    Returns: subprocess.Popen
+    """
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'streamlit', 'run', APP_PATH,
+            '--server.headless', 'true',
+            '--server.address', '127.0.0.1',
+            '--server.port', str(port),
+            '--server.enableXsrfProtection', 'false',
+            '--server.fileWatcherType', 'none',
+            '--browser.gatherUsageStats', 'false',
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, 'TARGET_APP_ARCHIVE_DIR': archive_dir},
+    )
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"❌ Streamlit exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"❌ Streamlit did not start within {timeout}s")
+
+
+class ProcessSampler:
+    """Sample CPU time and RSS of one process from /proc in a background thread."""
+
+    def __init__(self, pid, interval=SAMPLE_INTERVAL_SECONDS):
+        self.pid = pid
+        self.interval = interval
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def cpu_seconds(self):
+        """utime + stime of the process so far."""
+        with open(f'/proc/{self.pid}/stat') as f:
+            # Field 2 (comm) may contain spaces; count from after its ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+
+    def rss_mb(self):
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+        return 0.0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.rss_samples.append(self.rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.rss_samples = [self.rss_mb()]
+        self.cpu_start = self.cpu_seconds()
+        self.wall_start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.wall_seconds = time.perf_counter() - self.wall_start
+        self.cpu_used = self.cpu_seconds() - self.cpu_start
+        self.rss_samples.append(self.rss_mb())
+
+
+# ============================================================================
+# HEADLESS SESSION DRIVER
+# ============================================================================
+
+class HeadlessSession:
+    """
+    One browser-less app session over the /_stcore/stream websocket.
+
+    Sends rerun requests with widget states the way the frontend does and
+    waits for script_finished, timing each rerun.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.ws = None
+        self.session_id = None
+        self.elements = []
+        self.errors = []
+        self._cache = {}
+
+    async def connect(self):
+        from tornado.websocket import websocket_connect
+        self.ws = await websocket_connect(
+            f'ws://127.0.0.1:{self.port}/_stcore/stream', max_message_size=512 * 1024 * 1024
+        )
+
+    async def rerun(self, widget_states=()):
+        """
+        Request a script run and collect its elements.
+
+        Returns: Seconds from request to script_finished
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        message = BackMsg()
+        message.rerun_script.query_string = ''
+        message.rerun_script.widget_states.widgets.extend(widget_states)
+
+        start = time.perf_counter()
+        await self.ws.write_message(message.SerializeToString(), binary=True)
+
+        self.elements = []
+        while True:
+            raw = await self.ws.read_message()
+            if raw is None:
+                raise RuntimeError("❌ Server closed the websocket")
+            msg = ForwardMsg()
+            msg.ParseFromString(raw)
+            kind = msg.WhichOneof('type')
+
+            if kind == 'ref_hash':
+                # Large messages already sent to this session come back as references
+                msg = self._cache.get(msg.ref_hash, msg)
+                kind = msg.WhichOneof('type')
+            elif msg.metadata.cacheable:
+                self._cache[msg.hash] = msg
+
+            if kind == 'new_session':
+                self.session_id = msg.new_session.initialize.session_id
+            elif kind == 'delta' and msg.delta.WhichOneof('type') == 'new_element':
+                element = msg.delta.new_element
+                self.elements.append(element)
+                element_type = element.WhichOneof('type')
+                if element_type == 'exception':
+                    self.errors.append(element.exception.message)
+                elif element_type == 'alert' and element.alert.body.startswith('❌'):
+                    self.errors.append(element.alert.body)
+            elif kind == 'script_finished':
+                return time.perf_counter() - start
+
+    def find(self, element_type, label_prefix=''):
+        """First widget proto of a type whose label starts with label_prefix."""
+        for element in self.elements:
+            if element.WhichOneof('type') == element_type:
+                widget = getattr(element, element_type)
+                if widget.label.startswith(label_prefix):
+                    return widget
+        raise LookupError(f"No {element_type} '{label_prefix}' in the last rerun")
+
+    async def upload(self, uploader, file_name, file_bytes):
+        """PUT the file to the upload endpoint; returns the uploader widget state."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+        file_id = str(uuid.uuid4())
+        boundary = uuid.uuid4().hex
+        body = (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode() + file_bytes + f'\r\n--{boundary}--\r\n'.encode()
+        await AsyncHTTPClient().fetch(HTTPRequest(
+            f'{self.base_url}/_stcore/upload_file/{self.session_id}/{file_id}',
+            method='PUT',
+            body=body,
+            headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        ))
+
+        state = WidgetState(id=uploader.id)
+        state.file_uploader_state_value.max_file_id = 1
+        info = state.file_uploader_state_value.uploaded_file_info.add()
+        info.file_id = file_id
+        info.name = file_name
+        info.size = len(file_bytes)
+        return state
+
+    async def download(self, url):
+        """GET a media file; returns its size in bytes."""
+        from tornado.httpclient import AsyncHTTPClient
+        response = await AsyncHTTPClient().fetch(f'{self.base_url}{url}')
+        return len(response.body)
+
+    def close(self):
+        if self.ws is not None:
+            self.ws.close()
+
+
+async def run_planner(port, workbook, rounds):
+    """
+    One session: open → upload → (calculate → download) × rounds.
+
+    Returns: Dict step → list of rerun seconds, plus errors
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+    timings = {step: [] for step in STEPS}
+    session = HeadlessSession(port)
+    try:
+        await session.connect()
+        timings['open'].append(await session.rerun())
+
+        upload_state = await session.upload(session.find('file_uploader'), *workbook)
+        timings['upload'].append(await session.rerun([upload_state]))
+
+        for _ in range(rounds):
+            calculate = WidgetState(id=session.find('button', '🔄').id, trigger_value=True)
+            timings['calculate'].append(await session.rerun([upload_state, calculate]))
+
+            # Download = fetch the export and the rerun the button click triggers
+            download_button = session.find('download_button', '📥')
+            start = time.perf_counter()
+            await session.download(download_button.url)
+            click = WidgetState(id=download_button.id, trigger_value=True)
+            await session.rerun([upload_state, click])
+            timings['download'].append(time.perf_counter() - start)
+    except Exception as e:
+        session.errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        session.close()
+
+    return {'timings': timings, 'errors': session.errors}
+
+
+# ============================================================================
+# LOAD TEST
+# ============================================================================
+
+def latency_summary(values):
+    """p50/p90/p95/p99/max in milliseconds (None when there are no values)."""
+    if not values:
+        return None
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        'count': len(values),
+        'p50_ms': round(p50 * 1000, 1),
+        'p90_ms': round(p90 * 1000, 1),
+        'p95_ms': round(p95 * 1000, 1),
+        'p99_ms': round(p99 * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1),
+    }
+
+
+def run_level(port, pid, session_count, workbooks, rounds):
+    """
+    Run session_count planners at once against the server.
+
+    Returns: Dict with latency percentiles per step and overall, CPU and RSS
+    """
+    async def run_all():
+        return await asyncio.gather(*[
+            run_planner(port, workbooks[i % len(workbooks)], rounds) for i in range(session_count)
+        ])
+
+    with ProcessSampler(pid) as sampler:
+        results = asyncio.run(run_all())
+
+    all_reruns = []
+    steps = {}
+    for step in STEPS:
+        values = [t for r in results for t in r['timings'][step]]
+        all_reruns += values
+        steps[step] = latency_summary(values)
+
+    errors = [e for r in results for e in r['errors']]
+    return {
+        'sessions': session_count,
+        'wall_seconds': round(sampler.wall_seconds, 2),
+        'server_cpu_seconds': round(sampler.cpu_used, 2),
+        'server_cpu_percent': round(sampler.cpu_used / sampler.wall_seconds * 100, 1),
+        'rss_start_mb': round(sampler.rss_samples[0], 1),
+        'rss_peak_mb': round(max(sampler.rss_samples), 1),
+        'rss_end_mb': round(sampler.rss_samples[-1], 1),
+        'latency': latency_summary(all_reruns),
+        'steps': steps,
+        'errors': len(errors),
+        'error_samples': errors[:5],
+    }
+
+
+def print_report(levels):
+    """Print one row per session count."""
+    print(f"\n{'Sessions':>8} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'calc p95':>9} "
+          f"{'CPU s':>7} {'CPU %':>6} {'RSS peak':>9} {'Errors':>7}")
+    for level in levels:
+        latency = level['latency'] or {}
+        calculate = level['steps']['calculate'] or {}
+        print(
+            f"{level['sessions']:>8} "
+            f"{latency.get('p50_ms', 0):>6.0f}ms {latency.get('p90_ms', 0):>6.0f}ms "
+            f"{latency.get('p95_ms', 0):>6.0f}ms {latency.get('p99_ms', 0):>6.0f}ms "
+            f"{calculate.get('p95_ms', 0):>7.0f}ms "
+            f"{level['server_cpu_seconds']:>7.1f} {level['server_cpu_percent']:>5.0f}% "
+            f"{level['rss_peak_mb']:>7.0f}MB {level['errors']:>7}"
+        )
+        for error in level['error_samples']:
+            print(f"         ⚠️ {error[:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Concurrent session counts to test (default: 1 2 4 8)')
+    parser.add_argument('--shops', type=int, default=300, help='Shops per generated workbook')
+    parser.add_argument('--months', type=int, default=7, help='Historical months per workbook')
+    parser.add_argument('--rounds', type=int, default=2, help='Calculate → download cycles per session')
+    parser.add_argument('--same-file', action='store_true',
+                        help='All sessions upload the same workbook (shared-cache hits)')
+    parser.add_argument('--port', type=int, default=None, help='Server port (default: a free port)')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    args = parser.parse_args()
+
+    if not os.path.exists('/proc/self/stat'):
+        print("❌ load_test.py reads CPU and memory from /proc and needs Linux")
+        return 1
+
+    workbook_count = 1 if args.same_file else max(args.sessions)
+    print(f"Generating {workbook_count} workbook(s) with {args.shops} shops × {args.months} months...")
+    workbooks = [generate_workbook(args.shops, args.months, seed=i) for i in range(workbook_count)]
+
+    port = args.port or free_port()
+    archive_dir = tempfile.mkdtemp(prefix='load_test_archive_')
+    server = None
+    levels = []
+    try:
+        server = start_server(port, archive_dir)
+        # Warm-up: imports and first script compile are not part of any level
+        asyncio.run(run_planner(port, workbooks[0], 1))
+        for session_count in args.sessions:
+            print(f"Running {session_count} concurrent session(s)...")
+            levels.append(run_level(port, server.pid, session_count, workbooks, args.rounds))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(archive_dir, ignore_errors=True)
+
+    print_report(levels)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'shops': args.shops,
+                'months': args.months,
+                'rounds': args.rounds,
+                'same_file': args.same_file,
+                'cpu_count': os.cpu_count(),
+                'levels': levels,
+            }, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+    return 1 if any(level['errors'] for level in levels) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
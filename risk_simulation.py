@@ -0,0 +1,178 @@
+"""
+Monte Carlo target-attainment risk for allocated targets.
+
+Each outlet's month-to-month variability is fitted from the historical
+month columns. Log growth of the daily sales rate is split into a
+company-wide part (shared by every outlet in a simulation, so outlets move
+together in a good or bad month) and an outlet-specific residual. Target
+month sales are then drawn for all outlets at once with NumPy, one block of
+outlets at a time so memory stays bounded.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from allocation_core import calculate_total_historical_days, parse_month_year
+
+DEFAULT_SIMULATIONS = 20_000
+
+# float32 draws held in memory at once (4M ≈ 16 MB)
+MAX_DRAWS_PER_BLOCK = 4_000_000
+
+# Pooled volatility counts as this many extra observations when an
+# outlet's own volatility is estimated from only a few months
+PRIOR_OBSERVATIONS = 2
+
+RISK_COLUMNS = ['Attainment_Probability_%', 'Simulated_P10', 'Simulated_P50', 'Simulated_P90']
+
+
+def log_growth(values):
+    """Month-over-month log growth along the last axis (NaN where a month is 0)."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.where(values > 0, np.log(np.where(values > 0, values, 1)), np.nan)
+    return np.diff(logs, axis=-1)
+
+
+def fit_outlet_variability(sales, month_days):
+    """
+    Fit per-outlet variability of the daily sales rate.
+
+    sales: outlets × months array in chronological order
+    month_days: Days in each month
+
+    Drift comes from the company-wide growth only; with 6-12 months per
+    outlet, outlet-specific drift is mostly noise.
+
+    Returns: Dict with base_rate (last non-zero daily rate per outlet),
+    drift, market_sigma, outlet_sigma (per outlet) and observations
+    """
+    rates = sales / np.asarray(month_days, dtype=float)[None, :]
+
+    company_growth = log_growth(rates.sum(axis=0))
+    market_valid = ~np.isnan(company_growth)
+    drift = float(company_growth[market_valid].mean()) if market_valid.any() else 0.0
+    market_sigma = float(company_growth[market_valid].std(ddof=1)) if market_valid.sum() >= 2 else 0.0
+
+    residuals = log_growth(rates) - company_growth[None, :]
+    observations = (~np.isnan(residuals)).sum(axis=1)
+    enough = observations >= 2
+
+    own_variance = np.full(len(rates), np.nan)
+    if enough.any():
+        own_variance[enough] = np.nanvar(residuals[enough], axis=1, ddof=1)
+    pooled_variance = float(np.nanmedian(own_variance)) if enough.any() else market_sigma ** 2
+
+    # Shrink thin histories toward the pooled volatility
+    outlet_variance = np.where(
+        enough,
+        ((observations - 1) * np.nan_to_num(own_variance) + PRIOR_OBSERVATIONS * pooled_variance)
+        / np.maximum(observations - 1 + PRIOR_OBSERVATIONS, 1),
+        pooled_variance,
+    )
+
+    # Last month with sales per outlet (0 when the outlet never sold)
+    positive = rates > 0
+    last_positive = rates.shape[1] - 1 - np.argmax(positive[:, ::-1], axis=1)
+    base_rate = np.where(positive.any(axis=1), rates[np.arange(len(rates)), last_positive], 0.0)
+
+    return {
+        'base_rate': base_rate,
+        'drift': drift,
+        'market_sigma': market_sigma,
+        'outlet_sigma': np.sqrt(outlet_variance),
+        'observations': observations,
+    }
+
+
+def simulate_attainment(working_df, month_cols, metadata, simulations=DEFAULT_SIMULATIONS, seed=None):
+    """
+    Simulate target-month sales and the chance each outlet hits its target.
+
+    working_df/metadata: Output of calculate_allocations. Excluded outlets
+    are skipped.
+
+    Returns: (risk_df, summary, error_message)
+    - risk_df: RISK_COLUMNS indexed like the simulated working_df rows
+    - summary: Company-level attainment probability and P10/P50/P90 of
+      total sales, outlets below 50%, simulations, seconds
+    """
+    start_time = time.perf_counter()
+    simulations = int(simulations)
+    if simulations < 100:
+        return None, {}, "❌ Run at least 100 simulations"
+
+    _, month_details, days_valid, days_error = calculate_total_historical_days(month_cols)
+    if not days_valid:
+        return None, {}, days_error
+    month_details = sorted(month_details, key=lambda m: m['date'])
+    if len(month_details) < 3:
+        return None, {}, "❌ Need at least 3 historical months to estimate variability"
+
+    target_dt, target_valid, target_error = parse_month_year(metadata['target_month'])
+    if not target_valid:
+        return None, {}, target_error
+    last_dt = month_details[-1]['date']
+    horizon = max((target_dt.year - last_dt.year) * 12 + target_dt.month - last_dt.month, 1)
+
+    # ========== STEP 1: Fit Variability ==========
+    shops = working_df[working_df['Constraint_Applied'] != 'Excluded']
+    sales = np.column_stack([
+        pd.to_numeric(shops[m['month']], errors='coerce').fillna(0).to_numpy(dtype=float)
+        for m in month_details
+    ])
+    fit = fit_outlet_variability(sales, [m['days'] for m in month_details])
+
+    targets = shops['Allocated_Monthly_Target'].to_numpy(dtype=float)
+    expected_base = fit['base_rate'] * metadata['target_days']
+    outlet_scale = (fit['outlet_sigma'] * np.sqrt(horizon)).astype(np.float32)
+
+    # ========== STEP 2: Draw Target-Month Sales ==========
+    rng = np.random.default_rng(seed)
+    market = rng.standard_normal(simulations, dtype=np.float32)
+    market *= fit['market_sigma'] * np.sqrt(horizon)
+    market += fit['drift'] * horizon
+
+    shop_count = len(shops)
+    probability = np.empty(shop_count)
+    quantiles = np.empty((3, shop_count))
+    company_totals = np.zeros(simulations)
+    block = max(1, MAX_DRAWS_PER_BLOCK // simulations)
+
+    for first in range(0, shop_count, block):
+        last = min(first + block, shop_count)
+        draws = rng.standard_normal((last - first, simulations), dtype=np.float32)
+        draws *= outlet_scale[first:last, None]
+        draws += market[None, :]
+        np.exp(draws, out=draws)
+        draws *= expected_base[first:last, None].astype(np.float32)
+
+        probability[first:last] = (draws >= targets[first:last, None]).mean(axis=1)
+        quantiles[:, first:last] = np.percentile(draws, [10, 50, 90], axis=1)
+        company_totals += draws.sum(axis=0, dtype=np.float64)
+
+    # ========== STEP 3: Summarize ==========
+    risk_df = pd.DataFrame({
+        'Attainment_Probability_%': np.round(probability * 100, 1),
+        'Simulated_P10': np.round(quantiles[0], 2),
+        'Simulated_P50': np.round(quantiles[1], 2),
+        'Simulated_P90': np.round(quantiles[2], 2),
+    }, index=shops.index)
+
+    company_target = float(targets.sum())
+    company_p10, company_p50, company_p90 = np.percentile(company_totals, [10, 50, 90])
+    summary = {
+        'company_probability': round(float((company_totals >= company_target - 0.005).mean()) * 100, 1),
+        'company_target': company_target,
+        'company_p10': round(float(company_p10), 2),
+        'company_p50': round(float(company_p50), 2),
+        'company_p90': round(float(company_p90), 2),
+        'outlets_below_half': int((probability < 0.5).sum()),
+        'outlets': shop_count,
+        'simulations': simulations,
+        'horizon_months': horizon,
+        'seconds': round(time.perf_counter() - start_time, 2),
+    }
+
+    return risk_df, summary, None
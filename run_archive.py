@@ -0,0 +1,220 @@
+"""
+Parquet archive of allocation runs, partitioned by target month.
+
+Layout (hive partitioning, one file per run and target month):
+
+    <archive>/allocations/target_month=2026-02/run-<run_id>.parquet
+    <archive>/runs/target_month=2026-02/run-<run_id>.parquet
+
+allocations holds the run's working_df (one row per outlet) and runs holds
+one row of metadata per run. Readers go through pyarrow.dataset with a
+fixed schema, so a history query only opens the partitions it filters on
+and only reads the columns it asks for.
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from allocation_core import CONTRIBUTION_COLUMNS, normalize_outlet_keys, parse_month_year
+
+DEFAULT_ARCHIVE_DIR = 'allocation_archive'
+
+RUN_COLUMNS = [
+    'run_id', 'run_timestamp', 'source_name', 'entered_target', 'final_allocated',
+    'eligible_shops_count', 'metadata_json',
+]
+
+
+def allocation_schema():
+    """Fixed Arrow schema for the allocations dataset (extra columns are ignored)."""
+    import pyarrow as pa
+    return pa.schema(
+        [('run_id', pa.string()), ('run_timestamp', pa.timestamp('us')),
+         ('outlet_key', pa.string()), ('outlet_name', pa.string())]
+        + [(col, pa.float64()) for col in CONTRIBUTION_COLUMNS]
+        + [('Allocated_Monthly_Target', pa.float64()), ('Allocated_Daily_Target', pa.float64()),
+           ('Constraint_Applied', pa.string()), ('target_month', pa.string())]
+    )
+
+
+def run_schema():
+    """Fixed Arrow schema for the runs dataset."""
+    import pyarrow as pa
+    return pa.schema([
+        ('run_id', pa.string()), ('run_timestamp', pa.timestamp('us')), ('source_name', pa.string()),
+        ('entered_target', pa.float64()), ('final_allocated', pa.float64()),
+        ('eligible_shops_count', pa.int64()), ('metadata_json', pa.string()),
+        ('target_month', pa.string()),
+    ])
+
+
+def partition_label(target_month):
+    """'Feb 2026' → '2026-02' (sorts chronologically as a string)."""
+    target_dt, is_valid, error = parse_month_year(target_month)
+    if not is_valid:
+        raise ValueError(error)
+    return target_dt.strftime('%Y-%m')
+
+
+def write_parquet_atomic(df, path):
+    """Write a DataFrame to Parquet via a temp file so readers never see half a file."""
+    directory, file_name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    # Dot-prefixed names are skipped by dataset readers
+    temp_path = os.path.join(directory, f".{file_name}.{uuid.uuid4().hex[:8]}.tmp")
+    df.to_parquet(temp_path, index=False, engine='pyarrow')
+    os.replace(temp_path, path)
+
+
+def archive_run(archive_dir, working_df, outlet_col, metadata, source_name='', month_label=None,
+                allocation_suffix=''):
+    """
+    Save one run (one target month) to the archive.
+
+    month_label/allocation_suffix select one month of a multi-month run,
+    e.g. month_label='Mar 2026', allocation_suffix=' (Mar 2026)'.
+
+    Returns: (run_id, error_message)
+    """
+    try:
+        target_month = month_label or metadata['target_month']
+        partition = f"target_month={partition_label(target_month)}"
+        run_timestamp = datetime.now()
+        run_id = f"{run_timestamp:%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:6]}"
+
+        rows = pd.DataFrame({
+            'run_id': run_id,
+            'run_timestamp': pd.Timestamp(run_timestamp),
+            'outlet_key': normalize_outlet_keys(working_df[outlet_col]).to_numpy(),
+            'outlet_name': working_df[outlet_col].astype(str).to_numpy(),
+        })
+        for col in CONTRIBUTION_COLUMNS:
+            rows[col] = working_df[col].to_numpy(dtype=float)
+        rows['Allocated_Monthly_Target'] = working_df[f'Allocated_Monthly_Target{allocation_suffix}'].to_numpy(dtype=float)
+        rows['Allocated_Daily_Target'] = working_df[f'Allocated_Daily_Target{allocation_suffix}'].to_numpy(dtype=float)
+        if 'Constraint_Applied' in working_df.columns:
+            rows['Constraint_Applied'] = working_df['Constraint_Applied'].astype(str).to_numpy()
+        else:
+            rows['Constraint_Applied'] = ''
+
+        # Historical month columns are kept too; they vary by run and are
+        # simply not part of the fixed read schema
+        month_cols = metadata.get('historical_months', [])
+        for col in month_cols:
+            if col in working_df.columns:
+                rows[col] = pd.to_numeric(working_df[col], errors='coerce').to_numpy(dtype=float)
+
+        final_allocated = float(rows['Allocated_Monthly_Target'].sum())
+        entered_target = next(
+            (m['entered_target'] for m in metadata.get('target_months', []) if m['month'] == target_month),
+            metadata.get('entered_target', final_allocated)
+        )
+        run_row = pd.DataFrame([{
+            'run_id': run_id,
+            'run_timestamp': pd.Timestamp(run_timestamp),
+            'source_name': str(source_name),
+            'entered_target': float(entered_target),
+            'final_allocated': round(final_allocated, 2),
+            'eligible_shops_count': int(metadata.get('eligible_shops_count', 0)),
+            'metadata_json': json.dumps(metadata, default=str),
+        }])
+
+        write_parquet_atomic(rows, os.path.join(archive_dir, 'allocations', partition, f'run-{run_id}.parquet'))
+        write_parquet_atomic(run_row, os.path.join(archive_dir, 'runs', partition, f'run-{run_id}.parquet'))
+    except Exception as e:
+        return None, f"❌ Failed to archive run: {str(e)}"
+
+    return run_id, None
+
+
+def open_dataset(archive_dir, name, schema):
+    """pyarrow dataset over one archive table (None when nothing is archived yet)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    path = os.path.join(archive_dir, name)
+    if not os.path.isdir(path):
+        return None
+    partitioning = ds.partitioning(pa.schema([('target_month', pa.string())]), flavor='hive')
+    return ds.dataset(path, format='parquet', partitioning=partitioning, schema=schema)
+
+
+def list_archived_runs(archive_dir):
+    """
+    One row per archived run (newest first), without touching allocation rows.
+
+    Returns: DataFrame with target_month, run_id, run_timestamp, source_name,
+    entered_target, final_allocated, eligible_shops_count
+    """
+    dataset = open_dataset(archive_dir, 'runs', run_schema())
+    if dataset is None:
+        return pd.DataFrame(columns=['target_month'] + RUN_COLUMNS[:-1])
+    runs = dataset.to_table(columns=['target_month'] + RUN_COLUMNS[:-1]).to_pandas()
+    return runs.sort_values('run_timestamp', ascending=False, ignore_index=True)
+
+
+def latest_run_ids(runs):
+    """run_id of the most recent run for every target month."""
+    return runs.sort_values('run_timestamp').groupby('target_month')['run_id'].last()
+
+
+def load_outlet_history(archive_dir, outlet_keys=None, target_months=None, run_ids=None,
+                        columns=('Allocated_Monthly_Target', 'Contribution_%')):
+    """
+    Lazily read archived allocations.
+
+    Only partitions in target_months ('2026-02' labels) are opened and only
+    the requested columns are read; outlet_keys and run_ids are pushed down
+    as row filters.
+
+    Returns: DataFrame with target_month, run_id, outlet_key, outlet_name + columns
+    """
+    import pyarrow.dataset as ds
+
+    dataset = open_dataset(archive_dir, 'allocations', allocation_schema())
+    read_columns = ['target_month', 'run_id', 'outlet_key', 'outlet_name'] + list(columns)
+    if dataset is None:
+        return pd.DataFrame(columns=read_columns)
+
+    filters = []
+    if target_months is not None:
+        filters.append(ds.field('target_month').isin(list(target_months)))
+    if run_ids is not None:
+        filters.append(ds.field('run_id').isin(list(run_ids)))
+    if outlet_keys is not None:
+        filters.append(ds.field('outlet_key').isin(list(outlet_keys)))
+
+    row_filter = None
+    for condition in filters:
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    return dataset.to_table(columns=read_columns, filter=row_filter).to_pandas()
+
+
+def contribution_drift(history, first_month, last_month):
+    """
+    Change in Contribution_% per outlet between two target months.
+
+    history: load_outlet_history output for (at least) both months, one
+    run per month.
+
+    Returns: DataFrame outlet_name, contribution at both months, drift_pct_points
+    """
+    pivot = history.pivot_table(
+        index='outlet_key', columns='target_month', values='Contribution_%', aggfunc='last'
+    )
+    names = history.groupby('outlet_key')['outlet_name'].last()
+    start = pivot.get(first_month, pd.Series(np.nan, index=pivot.index))
+    end = pivot.get(last_month, pd.Series(np.nan, index=pivot.index))
+
+    drift = pd.DataFrame({
+        'Outlet Name': names.reindex(pivot.index),
+        f'Contribution % ({first_month})': start,
+        f'Contribution % ({last_month})': end,
+        'Drift (pp)': (end.fillna(0) - start.fillna(0)).round(2),
+    })
+    return drift.reindex(drift['Drift (pp)'].abs().sort_values(ascending=False).index).reset_index(drop=True)
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# Modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_sheet(shops, months, seed=0, target_col='Feb 2026 Target'):
+    """Monthly-sheet DataFrame: DIP PLANT, shops, TOTAL row."""
+    rng = np.random.default_rng(seed)
+    sales = rng.integers(10_000, 900_000, size=(shops + 1, len(months))).astype(float)
+    df = pd.DataFrame(sales, columns=months)
+    df.insert(0, 'OUTLET NAME', ['DIP PLANT'] + [f'Shop {i}' for i in range(shops)])
+    total = pd.DataFrame([['TOTAL'] + df[months].sum().tolist()], columns=['OUTLET NAME'] + months)
+    df = pd.concat([df, total], ignore_index=True)
+    if target_col:
+        df[target_col] = np.nan
+    return df
+
+
+@pytest.fixture
+def sheet_factory():
+    return make_sheet
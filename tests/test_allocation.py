@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation_core import (
+    build_allocation_rules,
+    calculate_allocations,
+    calculate_multi_month_allocations,
+    round_to_total,
+    water_fill_allocation,
+)
+
+OUTLET = 'OUTLET NAME'
+MONTHS = ['Nov 2025', 'Dec 2025', 'Jan 2026']
+TARGET_COL = 'Feb 2026 Target'
+
+
+def shop_targets(working_df):
+    shops = working_df[working_df['Constraint_Applied'] != 'Excluded']
+    return shops.set_index(OUTLET)['Allocated_Monthly_Target']
+
+
+@pytest.mark.parametrize('target', [5_000_000.0, 12_345_678.91])
+def test_large_sheet_allocations_add_up_without_negatives(sheet_factory, target):
+    df = sheet_factory(20_000, MONTHS)
+
+    working_df, metadata, result = calculate_allocations(df, OUTLET, MONTHS, TARGET_COL, target)
+
+    assert result['success'] and result['validation_passed']
+    targets = shop_targets(working_df)
+    assert (targets >= 0).all()
+    assert round(targets.sum() * 100) == round(target * 100)
+
+    # Each outlet stays within a paisa of its exact share
+    shops = working_df[working_df['Constraint_Applied'] != 'Excluded']
+    weights = shops['Historical_Daily_Average'].to_numpy()
+    exact = weights / weights.sum() * target
+    assert np.abs(targets.to_numpy() - exact).max() <= 0.01 + 1e-6
+
+
+def test_non_binding_rule_leaves_allocations_unchanged(sheet_factory):
+    df = sheet_factory(20_000, MONTHS)
+    limits = pd.DataFrame(
+        {'min_target': [np.nan], 'max_target': [1e9], 'min_growth_pct': [np.nan], 'max_growth_pct': [np.nan]},
+        index=['SHOP 7'],
+    )
+
+    plain, _, _ = calculate_allocations(df, OUTLET, MONTHS, TARGET_COL, 5_000_000.0)
+    ruled, _, result = calculate_allocations(
+        df, OUTLET, MONTHS, TARGET_COL, 5_000_000.0, rules=build_allocation_rules(limits=limits)
+    )
+
+    assert result['success']
+    difference = (shop_targets(plain) - shop_targets(ruled)).abs()
+    assert difference.max() <= 0.01 + 1e-6
+
+
+def test_round_to_total_skips_capped_items():
+    rounded = round_to_total(np.array([1.004, 2.004, 3.002]), 6.02, adjustable=np.array([False, True, True]))
+
+    assert rounded.tolist() == [1.0, 2.01, 3.01]
+
+
+def test_multi_month_allocations_use_each_months_days(sheet_factory):
+    df = sheet_factory(500, MONTHS, target_col='Mar 2026 Target')
+    df['Feb 2026 Target'] = np.nan
+    amounts = {'Feb 2026 Target': 2_800_000.0, 'Mar 2026 Target': 3_100_000.55}
+
+    working_df, metadata, result = calculate_multi_month_allocations(df, OUTLET, MONTHS, amounts)
+
+    assert result['success']
+    shops = working_df[working_df[OUTLET] != 'DIP PLANT']
+    assert [(m['month'], m['days']) for m in metadata['target_months']] == [('Feb 2026', 28), ('Mar 2026', 31)]
+    for month in metadata['target_months']:
+        monthly = shops[f"Allocated_Monthly_Target ({month['month']})"]
+        daily = shops[f"Allocated_Daily_Target ({month['month']})"]
+        assert round(monthly.sum() * 100) == round(amounts[month['target_col']] * 100)
+        assert month['validation_passed']
+        np.testing.assert_allclose(daily, np.round(monthly / month['days'], 2))
+    # Same weights every month, so targets scale with the amounts
+    ratio = shops['Allocated_Monthly_Target (Mar 2026)'] / shops['Allocated_Monthly_Target (Feb 2026)']
+    assert np.abs(ratio - 3_100_000.55 / 2_800_000.0).max() < 1e-4
+
+
+def test_water_fill_binding_floor():
+    allocations, valid, error = water_fill_allocation([1.0, 1.0, 2.0], 100.0, lower=[40.0, 0.0, 0.0])
+
+    assert valid and error is None
+    np.testing.assert_allclose(allocations, [40.0, 20.0, 40.0])
+
+
+def test_water_fill_binding_cap():
+    allocations, valid, _ = water_fill_allocation([1.0, 1.0, 2.0], 100.0, upper=[np.inf, np.nan, 30.0])
+
+    assert valid
+    np.testing.assert_allclose(allocations, [35.0, 35.0, 30.0])
+
+
+@pytest.mark.parametrize('lower, upper, message', [
+    ([60.0, 50.0, 0.0], None, 'Minimum targets add up'),
+    (None, [10.0, 10.0, 10.0], 'Maximum targets add up'),
+    ([20.0, 0.0, 0.0], [10.0, np.inf, np.inf], 'Minimum target exceeds maximum'),
+])
+def test_water_fill_infeasible(lower, upper, message):
+    allocations, valid, error = water_fill_allocation([1.0, 1.0, 2.0], 100.0, lower=lower, upper=upper)
+
+    assert allocations is None and not valid
+    assert message in error
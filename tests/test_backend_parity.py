@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation_backends import BACKENDS, available_backends, select_backend
+from allocation_core import CONTRIBUTION_COLUMNS, RESULT_COLUMNS, build_allocation_rules, calculate_allocations
+from conftest import make_sheet
+
+OUTLET = 'OUTLET NAME'
+MONTHS = ['Jul 2025', 'Aug 2025', 'Sep 2025', 'Oct 2025', 'Nov 2025', 'Dec 2025', 'Jan 2026']
+TARGET_COL = 'Feb 2026 Target'
+OTHER_BACKENDS = [name for name in BACKENDS if name != 'pandas']
+
+
+def backend_param(name):
+    # Optional backends still run wherever they are installed
+    installed = name in available_backends()
+    return pytest.param(name, marks=pytest.mark.skipif(not installed, reason=f'{name} not installed'))
+
+
+@pytest.fixture(scope='module')
+def sheet():
+    df = make_sheet(2_000, MONTHS, seed=3)
+    # Paisa values so the row sums depend on the summation order
+    rng = np.random.default_rng(4)
+    df.loc[:len(df) - 2, MONTHS] += rng.integers(0, 100, size=(len(df) - 1, len(MONTHS))) / 100
+    return df
+
+
+def scenarios(df):
+    rng = np.random.default_rng(1)
+    limits = pd.DataFrame({
+        'min_target': [2_000_000.0, np.nan],
+        'max_target': [np.nan, 5_000.0],
+        'min_growth_pct': [np.nan, np.nan],
+        'max_growth_pct': [np.nan, np.nan],
+    }, index=['SHOP 10', 'SHOP 20'])
+    return {
+        'calendar days': {},
+        'trading days': {'outlet_days': pd.Series(rng.integers(0, 213, len(df)), index=df.index, dtype=float)},
+        'floors/caps': {'rules': build_allocation_rules(limits=limits)},
+    }
+
+
+@pytest.mark.parametrize('backend', [backend_param(name) for name in OTHER_BACKENDS])
+@pytest.mark.parametrize('scenario', ['calendar days', 'trading days', 'floors/caps'])
+def test_backend_matches_pandas(sheet, backend, scenario):
+    kwargs = scenarios(sheet)[scenario]
+
+    reference, _, reference_result = calculate_allocations(
+        sheet, OUTLET, MONTHS, TARGET_COL, 3_200_000_000.0, backend='pandas', **kwargs
+    )
+    candidate, metadata, result = calculate_allocations(
+        sheet, OUTLET, MONTHS, TARGET_COL, 3_200_000_000.0, backend=backend, **kwargs
+    )
+
+    assert reference_result['success'] and result['success']
+    assert metadata['compute_backend'] == backend
+    for col in CONTRIBUTION_COLUMNS + RESULT_COLUMNS:
+        np.testing.assert_array_equal(candidate[col].to_numpy(dtype=float), reference[col].to_numpy(dtype=float))
+
+
+def test_auto_backend_follows_thresholds(monkeypatch):
+    import allocation_backends
+
+    assert select_backend('auto', 1_000)[0] == 'numpy'
+    large = 'polars' if 'polars' in available_backends() else 'numpy'
+    assert select_backend('auto', 1_000_000)[0] == large
+
+    monkeypatch.setattr(allocation_backends, 'available_backends', lambda: ['pandas', 'numpy'])
+    assert select_backend('auto', 1_000_000)[0] == 'numpy'
@@ -0,0 +1,149 @@
+import re
+import zipfile
+from io import BytesIO
+
+import openpyxl
+import pytest
+import xlsxwriter
+from openpyxl.styles import Font
+
+from excel_patch import patch_workbook
+
+OUTLET = 'OUTLET NAME'
+TARGET = 'Feb 2026 Target'
+HEADERS = [OUTLET, 'Dec 2025', 'Jan 2026', TARGET]
+ROWS = [
+    ['DIP PLANT', 500, 600, 0],
+    ['Shop A', 100, 200, 0],
+    ['Shop B', 300, 400, 0],
+    ['shop a ', 50, 60, 0],
+]
+TOTAL_ROW = len(ROWS) + 2
+
+
+def openpyxl_workbook():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = 'Sales'
+    sheet.append(HEADERS)
+    for row in ROWS:
+        sheet.append(row)
+    sheet.append(['TOTAL'] + [f'=SUM({col}2:{col}{TOTAL_ROW - 1})' for col in 'BCD'])
+    for cell in sheet[1]:
+        cell.font = Font(bold=True)
+    notes = workbook.create_sheet('Notes')
+    notes['A1'] = 'Prepared by planning'
+    output = BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+
+def xlsxwriter_workbook():
+    output = BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'in_memory': True})
+    bold = workbook.add_format({'bold': True})
+    sheet = workbook.add_worksheet('Sales')
+    sheet.write_row(0, 0, HEADERS, bold)
+    for position, row in enumerate(ROWS, start=1):
+        sheet.write_row(position, 0, row)
+    sheet.write(TOTAL_ROW - 1, 0, 'TOTAL')
+    for index, col in enumerate('BCD', start=1):
+        sheet.write_formula(TOTAL_ROW - 1, index, f'=SUM({col}2:{col}{TOTAL_ROW - 1})')
+    workbook.add_worksheet('Notes').write('A1', 'Prepared by planning')
+    workbook.close()
+    return output.getvalue()
+
+
+def updates_for(values):
+    """Two occurrences of SHOP A, one of SHOP B and DIP PLANT."""
+    return {
+        'DIP PLANT': [{TARGET: 0.0, 'Allocated_Daily_Target': 0.0}],
+        'SHOP A': [{TARGET: values[0], 'Allocated_Daily_Target': 1.0},
+                   {TARGET: values[1], 'Allocated_Daily_Target': 2.0}],
+        'SHOP B': [{TARGET: values[2], 'Allocated_Daily_Target': 3.0}],
+    }
+
+
+def patch(file_bytes, values=(1000.0, 2000.0, 3000.0)):
+    totals = {TARGET: sum(values), 'Allocated_Daily_Target': 6.0}
+    output, error = patch_workbook(file_bytes, OUTLET, updates_for(values), totals)
+    assert error is None
+    return output.getvalue()
+
+
+def parts(file_bytes):
+    with zipfile.ZipFile(BytesIO(file_bytes)) as package:
+        return {name: package.read(name) for name in package.namelist()}
+
+
+def replace_part(file_bytes, name, replace):
+    output = BytesIO()
+    with zipfile.ZipFile(BytesIO(file_bytes)) as source, zipfile.ZipFile(output, 'w') as target:
+        for info in source.infolist():
+            data = source.read(info.filename)
+            target.writestr(info, replace(data) if info.filename == name else data)
+    return output.getvalue()
+
+
+# openpyxl writes inline strings, xlsxwriter shared strings
+@pytest.mark.parametrize('build', [openpyxl_workbook, xlsxwriter_workbook])
+def test_patch_fills_rows_in_sheet_order_and_keeps_total_formulas(build):
+    patched = openpyxl.load_workbook(BytesIO(patch(build())))['Sales']
+
+    assert [patched.cell(row, 4).value for row in range(2, 6)] == [0, 1000, 3000, 2000]
+    assert patched.cell(1, 5).value == 'Allocated_Daily_Target'
+    assert [patched.cell(row, 5).value for row in range(2, 6)] == [0, 1, 3, 2]
+    # SUM formulas stay; the appended column gets a plain total
+    assert patched.cell(TOTAL_ROW, 4).value == f'=SUM(D2:D{TOTAL_ROW - 1})'
+    assert patched.cell(TOTAL_ROW, 2).value == f'=SUM(B2:B{TOTAL_ROW - 1})'
+    assert patched.cell(TOTAL_ROW, 5).value == 6
+    assert patched.cell(1, 1).font.bold
+
+
+def test_other_parts_pass_through_unchanged():
+    original = openpyxl_workbook()
+    before, after = parts(original), parts(patch(original))
+
+    assert after.keys() == before.keys()
+    changed = {name for name in before if before[name] != after[name]}
+    # workbook.xml only changes when fullCalcOnLoad was not already set
+    assert 'xl/worksheets/sheet1.xml' in changed
+    assert changed <= {'xl/worksheets/sheet1.xml', 'xl/workbook.xml'}
+    assert b'fullCalcOnLoad="1"' in after['xl/workbook.xml']
+    total_row = re.search(rb'<row r="%d".*?</row>' % TOTAL_ROW, after['xl/worksheets/sheet1.xml']).group(0)
+    assert b'<f>SUM(D2:D5)</f><v>6000.0</v>' in total_row
+
+
+def test_repatch_overwrites_appended_columns():
+    once = patch(openpyxl_workbook())
+    twice = patch(once, values=(10.0, 20.0, 30.0))
+
+    sheet = openpyxl.load_workbook(BytesIO(twice))['Sales']
+    assert [cell.value for cell in sheet[1]] == HEADERS + ['Allocated_Daily_Target']
+    assert [sheet.cell(row, 4).value for row in range(2, 6)] == [0, 10, 30, 20]
+    assert sheet.dimensions == f'A1:E{TOTAL_ROW}'
+
+
+def test_shared_formula_in_a_patched_cell_is_refused():
+    def make_shared(sheet_xml):
+        # Shop A's target becomes the master of a shared formula
+        return re.sub(
+            rb'<c r="D3"([^>]*)><v>0</v></c>',
+            rb'<c r="D3"\1><f t="shared" ref="D3:D4" si="0">B3*2</f><v>200</v></c>',
+            sheet_xml,
+        )
+
+    file_bytes = replace_part(openpyxl_workbook(), 'xl/worksheets/sheet1.xml', make_shared)
+    assert b't="shared"' in parts(file_bytes)['xl/worksheets/sheet1.xml']
+
+    output, error = patch_workbook(file_bytes, OUTLET, updates_for((1.0, 2.0, 3.0)), {TARGET: 6.0})
+
+    assert output is None
+    assert 'D3' in error and 'shared formula' in error
+
+
+def test_unknown_outlets_are_reported():
+    output, error = patch_workbook(openpyxl_workbook(), OUTLET, {'NOWHERE': [{TARGET: 1.0}]}, {})
+
+    assert output is None
+    assert 'No outlet rows' in error
@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+from allocation_core import paginate_dataframe
+
+
+def page_values(df, column, **kwargs):
+    page_df, _, _ = paginate_dataframe(df, 1, 10, sort_col=column, **kwargs)
+    return page_df[column].tolist()
+
+
+def test_mixed_type_column_sorts_without_error():
+    df = pd.DataFrame({'Value': [5, 'n/a', 1.5, None, '12', 3]})
+
+    assert page_values(df, 'Value') == [1.5, 3, 5, '12', 'n/a', None]
+    assert page_values(df, 'Value', ascending=False) == ['12', 5, 3, 1.5, 'n/a', None]
+
+
+def test_text_column_with_numbers_sorts_as_text():
+    df = pd.DataFrame({'Outlet': ['Shop B', 101, 'Shop A', np.nan]})
+
+    assert page_values(df, 'Outlet') == [101, 'Shop A', 'Shop B', np.nan]
+
+
+def test_descending_sort_keeps_missing_values_last():
+    df = pd.DataFrame({'Target': [2.0, np.nan, 7.0, 2.0, np.nan]}, index=[10, 11, 12, 13, 14])
+
+    page_df, total_rows, total_pages = paginate_dataframe(df, 1, 3, sort_col='Target', ascending=False)
+
+    assert page_df.index.tolist() == [12, 10, 13]
+    assert (total_rows, total_pages) == (5, 2)
@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+
+from risk_simulation import fit_outlet_variability, simulate_attainment
+
+MONTHS = ['Oct 2025', 'Nov 2025', 'Dec 2025', 'Jan 2026']
+MONTH_DAYS = [31, 30, 31, 31]
+
+
+def steady_sheet(daily_rates, targets):
+    """Working DataFrame whose outlets sell the same amount every day."""
+    df = pd.DataFrame(
+        np.outer(daily_rates, MONTH_DAYS), columns=MONTHS
+    )
+    df['Allocated_Monthly_Target'] = targets
+    df['Constraint_Applied'] = ''
+    return df
+
+
+def test_fit_of_steady_outlets_has_no_variability():
+    sales = np.outer([100.0, 200.0], MONTH_DAYS)
+
+    fit = fit_outlet_variability(sales, MONTH_DAYS)
+
+    assert fit['drift'] == 0.0 and fit['market_sigma'] == 0.0
+    np.testing.assert_allclose(fit['outlet_sigma'], 0.0, atol=1e-12)
+    np.testing.assert_allclose(fit['base_rate'], [100.0, 200.0])
+
+
+def test_base_rate_skips_empty_last_month():
+    sales = np.array([[3100.0, 3000.0, 3100.0, 3100.0], [6200.0, 6000.0, 6200.0, 0.0]])
+
+    fit = fit_outlet_variability(sales, MONTH_DAYS)
+
+    # The second outlet's January is empty, so its rate comes from December
+    np.testing.assert_allclose(fit['base_rate'], [100.0, 200.0])
+
+
+def test_zero_variance_outlets_hit_or_miss_with_certainty():
+    # Run rate × 28 days = 2,800 and 5,600
+    working_df = steady_sheet([100.0, 200.0], [2_500.0, 6_000.0])
+    metadata = {'target_month': 'Feb 2026', 'target_days': 28}
+
+    risk_df, summary, error = simulate_attainment(working_df, MONTHS, metadata, simulations=1_000, seed=7)
+
+    assert error is None
+    assert risk_df['Attainment_Probability_%'].tolist() == [100.0, 0.0]
+    np.testing.assert_allclose(risk_df['Simulated_P50'], [2_800.0, 5_600.0], rtol=1e-6)
+    assert summary['outlets_below_half'] == 1
+    assert summary['company_probability'] == 0.0
+
+
+def test_same_seed_gives_same_result(sheet_factory):
+    df = sheet_factory(200, MONTHS, target_col=None)
+    working_df = df[df['OUTLET NAME'] != 'TOTAL'].copy()
+    working_df['Constraint_Applied'] = np.where(working_df['OUTLET NAME'] == 'DIP PLANT', 'Excluded', '')
+    working_df['Allocated_Monthly_Target'] = working_df['Jan 2026'] * 0.9
+    metadata = {'target_month': 'Feb 2026', 'target_days': 28}
+
+    first, first_summary, _ = simulate_attainment(working_df, MONTHS, metadata, simulations=500, seed=3)
+    second, second_summary, _ = simulate_attainment(working_df, MONTHS, metadata, simulations=500, seed=3)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert first_summary['company_p50'] == second_summary['company_p50']
+    assert len(first) == 200
@@ -0,0 +1,18 @@
+from allocation_core import SharedDatasetCache
+
+
+def test_touch_keeps_entry_recently_used_without_counting():
+    cache = SharedDatasetCache(max_bytes=10_000)
+    cache.put('a', b'x' * 3_000)
+    cache.put('b', b'x' * 3_000)
+    assert cache.get('a') is not None
+
+    assert cache.touch('b') is not None
+    assert cache.touch('missing') is None
+    cache.put('c', b'x' * 3_000)
+    cache.put('d', b'x' * 3_000)
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 0, 1)
+    # 'a' was used less recently than the touched 'b', so it went first
+    assert cache.touch('a') is None and cache.touch('b') is not None
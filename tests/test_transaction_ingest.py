@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from transaction_ingest import aggregate_transactions, infer_date_format
+
+
+@pytest.fixture
+def day_first_csv(tmp_path):
+    """30k dd/mm/yyyy rows; the first chunk only holds days 1-12 (ambiguous)."""
+    rng = np.random.default_rng(7)
+    rows = 30_000
+    dates = pd.to_datetime('2025-07-01') + pd.to_timedelta(rng.integers(0, 184, rows), unit='D')
+    order = np.argsort(dates.day > 12, kind='stable')
+    dates = dates[order]
+    frame = pd.DataFrame({
+        'Store': rng.choice(['101', ' 102 ', 'shop a', 'Shop A', '103'], rows),
+        'Sale Date': dates.strftime('%d/%m/%Y'),
+        'Net Amount': rng.integers(100, 5_000, rows).astype(float),
+    })
+    frame.loc[[5, 15_000], 'Sale Date'] = 'not a date'
+    path = tmp_path / 'transactions.csv'
+    frame.to_csv(path, index=False)
+
+    valid = frame.drop(index=[5, 15_000])
+    expected = valid['Net Amount'].sum()
+    return path, expected
+
+
+def test_infer_date_format_prefers_unambiguous_evidence():
+    assert infer_date_format(pd.Series(['01/02/2025', '13/02/2025']))[0] == '%d/%m/%Y'
+    assert infer_date_format(pd.Series(['02/13/2025', '01/02/2025']))[0] == '%m/%d/%Y'
+    assert infer_date_format(pd.Series(['2025-07-01']))[0] == '%Y-%m-%d'
+
+
+@pytest.mark.parametrize('engine, budget_mb', [('pandas', 1), ('pandas', 4096), ('duckdb', 256)])
+def test_result_does_not_depend_on_engine_or_chunk_size(day_first_csv, engine, budget_mb):
+    path, expected_total = day_first_csv
+
+    result, error = aggregate_transactions(
+        str(path), 'Store', 'Sale Date', 'Net Amount', engine=engine, memory_budget_mb=budget_mb
+    )
+
+    assert error is None
+    assert result['date_format'] == '%d/%m/%Y'
+    assert result['rows_read'] == 30_000
+    assert result['invalid_dates'] == 2
+    monthly = result['monthly']
+    month_cols = [c for c in monthly.columns if c not in ('OUTLET NAME',) and 'Target' not in c]
+    assert month_cols[0] == 'Jul 2025' and month_cols[-1] == 'Dec 2025'
+    # ' 102 ' / '102' and 'shop a' / 'Shop A' are one outlet each
+    assert len(monthly) - 1 == 4
+    assert monthly.iloc[-1][month_cols].sum() == pytest.approx(expected_total)
+
+
+def test_engines_agree_on_trading_days(day_first_csv):
+    path, _ = day_first_csv
+    results = [
+        aggregate_transactions(str(path), 'Store', 'Sale Date', 'Net Amount', engine=engine)[0]
+        for engine in ('pandas', 'duckdb')
+    ]
+    coverage = [r['coverage'].set_index('OUTLET NAME').sort_index() for r in results]
+    coverage[0].index = coverage[0].index.str.upper()
+    coverage[1].index = coverage[1].index.str.upper()
+    pd.testing.assert_frame_equal(coverage[0], coverage[1], check_dtype=False)
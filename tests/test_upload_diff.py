@@ -0,0 +1,39 @@
+from allocation_core import build_outlet_index
+from upload_diff import diff_uploads, fingerprint_upload
+
+OUTLET = 'OUTLET NAME'
+
+
+def snapshot(df, months, file_hash):
+    return fingerprint_upload(df, OUTLET, months, build_outlet_index(df, OUTLET), file_hash)
+
+
+def test_edited_outlet_and_month_reported(sheet_factory):
+    months = ['Nov 2025', 'Dec 2025', 'Jan 2026']
+    before = sheet_factory(100, months)
+    after = before.copy()
+    after.loc[5, 'Dec 2025'] += 1000
+
+    diff = diff_uploads(snapshot(before, months, 'a'), snapshot(after, months, 'b'))
+
+    assert diff['changes']['Outlet Name'].tolist() == ['Shop 4']
+    assert diff['changes']['Changed Months'].tolist() == ['Dec 2025']
+    assert diff['changed_keys'] == {'SHOP 4'}
+    assert diff['same_layout']
+
+
+def test_upload_without_overlapping_months(sheet_factory):
+    before = sheet_factory(100, ['Jul 2025', 'Aug 2025', 'Sep 2025'])
+    after = sheet_factory(100, ['Oct 2025', 'Nov 2025', 'Dec 2025'], seed=1)
+
+    diff = diff_uploads(
+        snapshot(before, ['Jul 2025', 'Aug 2025', 'Sep 2025'], 'a'),
+        snapshot(after, ['Oct 2025', 'Nov 2025', 'Dec 2025'], 'b'),
+    )
+
+    # Nothing comparable: every outlet counts as changed, no reuse of totals
+    assert diff['unchanged'] == 0
+    assert len(diff['changed_keys']) == 101
+    assert not diff['same_layout']
+    assert diff['months_added'] == ['Oct 2025', 'Nov 2025', 'Dec 2025']
+    assert diff['months_removed'] == ['Jul 2025', 'Aug 2025', 'Sep 2025']
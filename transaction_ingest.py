@@ -0,0 +1,447 @@
+"""
+Transaction-level ingestion for the target allocation app.
+
+Streams long-format POS exports (one row per outlet per day, or finer)
+through an out-of-core aggregation into the monthly per-outlet sheet that
+calculate_allocations expects, together with the number of days each
+outlet actually traded in each month.
+
+DuckDB is used when it is installed. Otherwise files are read in chunks
+with pandas (CSV) or pyarrow (Parquet). Either way, memory use follows a
+fixed budget rather than the file size.
+"""
+
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from allocation_core import normalize_outlet_keys
+
+DEFAULT_MEMORY_BUDGET_MB = 256
+
+# DuckDB's CSV reader and hash tables need a working floor; below this it
+# raises Out of Memory instead of spilling
+DUCKDB_MIN_MEMORY_MB = 256
+
+# Rough in-memory cost of one parsed transaction row (outlet string, date, amount)
+BYTES_PER_ROW_ESTIMATE = 160
+
+# Header hints used to pre-select the column mapping
+OUTLET_COLUMN_HINTS = ('OUTLET', 'STORE', 'SHOP', 'BRANCH', 'LOCATION')
+DATE_COLUMN_HINTS = ('DATE', 'DAY', 'TIME')
+AMOUNT_COLUMN_HINTS = ('AMOUNT', 'SALES', 'NET', 'REVENUE', 'VALUE', 'TOTAL')
+
+# Date formats tried when the date column holds text, in order of preference
+# for ambiguous samples (day-first before month-first). The codes are valid
+# for both pandas and DuckDB's strptime.
+DATE_FORMATS = (
+    '%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d',
+    '%d/%m/%Y', '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S',
+    '%m/%d/%Y', '%m/%d/%Y %H:%M', '%m/%d/%Y %H:%M:%S',
+    '%d-%m-%Y', '%d.%m.%Y', '%d-%b-%Y', '%d %b %Y',
+)
+
+# Rows read from the top of the file to detect the date format
+DATE_SAMPLE_ROWS = 50_000
+
+
+def detect_file_type(file_name):
+    """Return 'csv' or 'parquet' from a file name (None if unsupported)."""
+    name = str(file_name).lower()
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.parquet', '.pq')):
+        return 'parquet'
+    return None
+
+
+def read_transaction_columns(path, file_type):
+    """Return the column names of a transaction file without loading its rows."""
+    if file_type == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).schema_arrow.names
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def guess_transaction_columns(columns):
+    """
+    Pick likely outlet/date/amount columns by header name.
+
+    Returns: Dict role → column name (None when nothing matches)
+    """
+    guesses = {}
+    remaining = list(columns)
+    for role, hints in (
+        ('outlet', OUTLET_COLUMN_HINTS),
+        ('date', DATE_COLUMN_HINTS),
+        ('amount', AMOUNT_COLUMN_HINTS),
+    ):
+        match = next(
+            (col for col in remaining if any(hint in str(col).upper() for hint in hints)),
+            None
+        )
+        guesses[role] = match
+        if match is not None:
+            remaining.remove(match)
+    return guesses
+
+
+def read_date_sample(path, file_type, date_col, rows=DATE_SAMPLE_ROWS):
+    """
+    First rows of the date column.
+
+    Returns: Series of raw text values, or None when the column is already a
+    date/timestamp type (Parquet) and needs no format
+    """
+    if file_type == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        column_type = parquet_file.schema_arrow.field(date_col).type
+        if pa.types.is_timestamp(column_type) or pa.types.is_date(column_type):
+            return None
+        batch = next(parquet_file.iter_batches(batch_size=rows, columns=[date_col]), None)
+        return batch.to_pandas()[date_col] if batch is not None else pd.Series(dtype=object)
+    return pd.read_csv(path, usecols=[date_col], nrows=rows, dtype=str)[date_col]
+
+
+def infer_date_format(values):
+    """
+    Pick the DATE_FORMATS entry that parses most of the sample.
+
+    Ties (e.g. only days 1-12 in the sample) go to the earlier entry.
+
+    Returns: (date_format, error_message)
+    """
+    values = pd.Series(values).dropna().astype(str).str.strip()
+    values = values[values != '']
+    if values.empty:
+        return None, "❌ Date column is empty in the first rows of the file"
+
+    best_format, best_count = None, 0
+    for date_format in DATE_FORMATS:
+        parsed = int(pd.to_datetime(values, format=date_format, errors='coerce').notna().sum())
+        if parsed > best_count:
+            best_format, best_count = date_format, parsed
+    if best_format is None:
+        return None, f"❌ Could not recognise the date format (e.g. '{values.iloc[0]}'); choose it in Date format"
+    return best_format, None
+
+
+def rows_per_chunk_for_budget(memory_budget_mb):
+    """Chunk size that keeps a parsed chunk (plus working copies) within budget."""
+    # A quarter of the budget per raw chunk leaves room for parsing and the accumulator
+    return max(10_000, int(memory_budget_mb * 1024 * 1024 / 4 / BYTES_PER_ROW_ESTIMATE))
+
+
+def iter_transaction_chunks(path, file_type, columns, rows_per_chunk):
+    """Yield DataFrames of at most rows_per_chunk rows with only the needed columns."""
+    if file_type == 'parquet':
+        import pyarrow.parquet as pq
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=rows_per_chunk, columns=columns):
+            yield batch.to_pandas()
+    else:
+        # Outlet codes stay text so 101 and 101.0 never diverge between chunks
+        yield from pd.read_csv(path, usecols=columns, chunksize=rows_per_chunk, dtype={columns[0]: str})
+
+
+def count_set_bits(masks):
+    """Number of set bits in each 32-bit day mask (= distinct trading days)."""
+    as_bytes = np.ascontiguousarray(masks, dtype='<u4').view(np.uint8).reshape(-1, 4)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1)
+
+
+def combine_partials(codes, months, sales, masks):
+    """
+    Merge (outlet code, month) partial aggregates.
+
+    Sales are summed; day masks are OR-ed so a day seen in several chunks
+    is only counted once.
+    """
+    order = np.lexsort((months, codes))
+    codes, months, sales, masks = codes[order], months[order], sales[order], masks[order]
+    starts = np.flatnonzero(
+        np.concatenate(([True], (codes[1:] != codes[:-1]) | (months[1:] != months[:-1])))
+    )
+    return (
+        codes[starts],
+        months[starts],
+        np.add.reduceat(sales, starts),
+        np.bitwise_or.reduceat(masks, starts),
+    )
+
+
+def aggregate_with_pandas(path, file_type, outlet_col, date_col, amount_col, memory_budget_mb,
+                          date_format=None):
+    """
+    Chunked aggregation with pandas/pyarrow.
+
+    The accumulator holds one row per (outlet, month), so its size depends on
+    outlets × months and not on the number of transactions. Every chunk is
+    parsed with the same date_format (None: the column is already dates).
+
+    Returns: (keys, names, months, sales, days, rows_read, invalid_dates)
+    """
+    key_codes = {}
+    names = []
+    acc_codes = np.empty(0, dtype=np.int64)
+    acc_months = np.empty(0, dtype=np.int64)
+    acc_sales = np.empty(0, dtype=float)
+    acc_masks = np.empty(0, dtype=np.int64)
+    rows_read = 0
+    invalid_dates = 0
+
+    chunks = iter_transaction_chunks(
+        path, file_type, [outlet_col, date_col, amount_col], rows_per_chunk_for_budget(memory_budget_mb)
+    )
+    for chunk in chunks:
+        rows_read += len(chunk)
+        dates = pd.to_datetime(chunk[date_col], format=date_format, errors='coerce')
+        invalid_dates += int(dates.isna().sum())
+        keys = normalize_outlet_keys(chunk[outlet_col])
+        valid = (dates.notna() & (keys != '')).to_numpy()
+        if not valid.any():
+            continue
+
+        dates = dates[valid]
+        raw_names = chunk[outlet_col][valid].astype(str).str.strip().to_numpy()
+        chunk_codes, uniques = pd.factorize(keys[valid])
+
+        # Map chunk-local codes to global outlet codes, remembering first-seen names
+        first_positions = np.unique(chunk_codes, return_index=True)[1]
+        global_codes = np.empty(len(uniques), dtype=np.int64)
+        for local_code, (key, position) in enumerate(zip(uniques, first_positions)):
+            if key not in key_codes:
+                key_codes[key] = len(names)
+                names.append(raw_names[position])
+            global_codes[local_code] = key_codes[key]
+
+        acc_codes, acc_months, acc_sales, acc_masks = combine_partials(
+            np.concatenate((acc_codes, global_codes[chunk_codes])),
+            np.concatenate((acc_months, (dates.dt.year * 12 + dates.dt.month - 1).to_numpy(dtype=np.int64))),
+            np.concatenate((
+                acc_sales,
+                pd.to_numeric(chunk[amount_col][valid], errors='coerce').fillna(0).to_numpy(dtype=float)
+            )),
+            np.concatenate((acc_masks, np.left_shift(1, dates.dt.day.to_numpy(dtype=np.int64) - 1))),
+        )
+
+    keys = np.array(list(key_codes), dtype=object)
+    return keys[acc_codes], np.array(names, dtype=object)[acc_codes], acc_months, acc_sales, \
+        count_set_bits(acc_masks), rows_read, invalid_dates
+
+
+def aggregate_with_duckdb(path, file_type, outlet_col, date_col, amount_col, memory_budget_mb,
+                          date_format=None):
+    """
+    Aggregation inside DuckDB with a hard memory limit.
+
+    The limit is the budget, but never below DUCKDB_MIN_MEMORY_MB.
+
+    Rows are first reduced to one per outlet per day and then to months, so
+    distinct trading days need no DISTINCT aggregate. Intermediate state
+    spills to a temporary directory when the budget is exceeded. CSV columns
+    are read as text and dates parsed with date_format, exactly like the
+    pandas path; row counts come from the same single scan.
+
+    Returns: (keys, names, months, sales, days, rows_read, invalid_dates)
+    """
+    import duckdb
+
+    def identifier(name):
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def literal(value):
+        return "'" + str(value).replace("'", "''") + "'"
+
+    source = literal(path)
+    reader = f"read_parquet({source})" if file_type == 'parquet' else f"read_csv({source}, all_varchar=true)"
+    outlet = identifier(outlet_col)
+    if date_format is None:
+        sale_date = f"TRY_CAST({identifier(date_col)} AS DATE)"
+    else:
+        sale_date = f"CAST(try_strptime(trim(CAST({identifier(date_col)} AS VARCHAR)), {literal(date_format)}) AS DATE)"
+
+    spill_dir = tempfile.mkdtemp(prefix='target_ingest_')
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET memory_limit='{max(int(memory_budget_mb), DUCKDB_MIN_MEMORY_MB)}MB'")
+        con.execute(f"SET temp_directory='{spill_dir}'")
+        con.execute("SET preserve_insertion_order=false")
+        result = con.execute(f"""
+            WITH parsed AS (
+                SELECT
+                    -- Same key rule as normalize_outlet_keys: strip whitespace, upper case
+                    regexp_replace(CAST({outlet} AS VARCHAR), '^\\s+|\\s+$', '', 'g') AS outlet_name,
+                    {sale_date} AS sale_date,
+                    TRY_CAST({identifier(amount_col)} AS DOUBLE) AS amount
+                FROM {reader}
+            ),
+            daily AS MATERIALIZED (
+                SELECT
+                    upper(outlet_name) AS outlet_key,
+                    min(outlet_name) AS outlet_name,
+                    sale_date,
+                    sum(amount) AS amount,
+                    count(*) AS row_count
+                FROM parsed
+                GROUP BY outlet_key, sale_date
+            ),
+            counts AS (
+                SELECT
+                    sum(row_count) AS rows_read,
+                    coalesce(sum(row_count) FILTER (WHERE sale_date IS NULL), 0) AS invalid_dates
+                FROM daily
+            )
+            SELECT
+                outlet_key,
+                min(outlet_name) AS outlet_name,
+                year(sale_date) * 12 + month(sale_date) - 1 AS month_ordinal,
+                coalesce(sum(amount), 0) AS sales,
+                count(*) AS days,
+                any_value(counts.rows_read) AS rows_read,
+                any_value(counts.invalid_dates) AS invalid_dates
+            FROM daily, counts
+            WHERE sale_date IS NOT NULL AND outlet_key IS NOT NULL AND outlet_key <> ''
+            GROUP BY outlet_key, month_ordinal
+        """).fetchdf()
+        # Counts ride along on every row; no rows means nothing usable was read
+        rows_read = int(result['rows_read'].iloc[0]) if len(result) else 0
+        invalid_dates = int(result['invalid_dates'].iloc[0]) if len(result) else 0
+    finally:
+        con.close()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    return (
+        result['outlet_key'].to_numpy(dtype=object),
+        result['outlet_name'].to_numpy(dtype=object),
+        result['month_ordinal'].to_numpy(dtype=np.int64),
+        result['sales'].to_numpy(dtype=float),
+        result['days'].to_numpy(dtype=np.int64),
+        rows_read,
+        invalid_dates,
+    )
+
+
+def month_label(month_ordinal):
+    """year * 12 + month - 1 → 'Jul 2025'."""
+    return pd.Timestamp(year=int(month_ordinal // 12), month=int(month_ordinal % 12) + 1, day=1).strftime('%b %Y')
+
+
+def build_monthly_sheet(keys, names, months, sales, days, outlet_col='OUTLET NAME'):
+    """
+    Pivot (outlet, month) aggregates into the sheet layout used by the app.
+
+    Layout: OUTLET NAME | Jul 2025 | ... | Jan 2026 | Feb 2026 Target, with a
+    TOTAL row at the bottom. Months without sales inside the covered range
+    are filled with 0.
+
+    Returns: (monthly_df, coverage_df, outlet_days)
+    """
+    outlet_codes, unique_keys = pd.factorize(pd.Series(keys), sort=True)
+    first_month, last_month = int(months.min()), int(months.max())
+    month_count = last_month - first_month + 1
+    labels = [month_label(first_month + offset) for offset in range(month_count)]
+
+    sales_matrix = np.zeros((len(unique_keys), month_count))
+    days_matrix = np.zeros((len(unique_keys), month_count), dtype=np.int64)
+    sales_matrix[outlet_codes, months - first_month] = sales
+    days_matrix[outlet_codes, months - first_month] = days
+
+    display_names = pd.Series(names).groupby(outlet_codes).first().to_numpy()
+
+    monthly_df = pd.DataFrame(sales_matrix, columns=labels)
+    monthly_df.insert(0, outlet_col, display_names)
+    monthly_df[f"{month_label(last_month + 1)} Target"] = np.nan
+
+    total_row = {outlet_col: 'TOTAL', **dict(zip(labels, sales_matrix.sum(axis=0)))}
+    monthly_df = pd.concat([monthly_df, pd.DataFrame([total_row])], ignore_index=True)
+
+    coverage_df = pd.DataFrame(days_matrix, columns=labels)
+    coverage_df.insert(0, outlet_col, display_names)
+
+    outlet_days = pd.Series(days_matrix.sum(axis=1), dtype=float).reindex(monthly_df.index)
+
+    return monthly_df, coverage_df, outlet_days
+
+
+def aggregate_transactions(path, outlet_col, date_col, amount_col, file_type=None,
+                           memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, engine='auto',
+                           date_format='auto'):
+    """
+    Aggregate a transaction CSV/Parquet file into monthly per-outlet sales.
+
+    engine: 'duckdb', 'pandas' or 'auto' (DuckDB when installed).
+    date_format: strptime format of text dates (e.g. '%d/%m/%Y'), or 'auto'
+    to pick one of DATE_FORMATS from the first rows. The same format is
+    used for the whole file, whatever the engine or chunk size.
+
+    Returns: (result_dict, error_message)
+    - monthly: Sheet ready for classify_columns/calculate_allocations
+    - coverage: Trading days per outlet per month
+    - outlet_days: Total trading days per monthly row (NaN for TOTAL), for
+      the outlet_days argument of calculate_allocations
+    - engine, rows_read
+    - date_format: Format used (None for native date columns)
+    - invalid_dates: Rows skipped because the date did not parse
+    """
+    file_type = file_type or detect_file_type(path)
+    if file_type not in ('csv', 'parquet'):
+        return None, f"❌ Unsupported transaction file: {path}. Use CSV or Parquet."
+
+    if date_format == 'auto':
+        try:
+            sample = read_date_sample(path, file_type, date_col)
+        except Exception as e:
+            return None, f"❌ Failed to read the date column: {str(e)}"
+        if sample is None:
+            date_format = None
+        else:
+            date_format, format_error = infer_date_format(sample)
+            if format_error:
+                return None, format_error
+
+    if engine == 'auto':
+        try:
+            import duckdb  # noqa: F401
+            engine = 'duckdb'
+        except ImportError:
+            engine = 'pandas'
+
+    aggregate = aggregate_with_duckdb if engine == 'duckdb' else aggregate_with_pandas
+    try:
+        try:
+            keys, names, months, sales, days, rows_read, invalid_dates = aggregate(
+                path, file_type, outlet_col, date_col, amount_col, memory_budget_mb, date_format
+            )
+        except Exception as e:
+            # DuckDB reports its own limit as an OutOfMemoryException; the chunked
+            # pandas path needs less headroom, so retry there before giving up
+            if engine != 'duckdb' or 'out of memory' not in str(e).lower():
+                raise
+            engine = 'pandas'
+            keys, names, months, sales, days, rows_read, invalid_dates = aggregate_with_pandas(
+                path, file_type, outlet_col, date_col, amount_col, memory_budget_mb, date_format
+            )
+    except ImportError as e:
+        return None, f"❌ Missing dependency for {file_type} ingestion: {str(e)}"
+    except Exception as e:
+        return None, f"❌ Failed to aggregate transactions: {str(e)}"
+
+    if len(keys) == 0:
+        return None, "❌ No valid transactions found (check the outlet and date columns)"
+
+    monthly_df, coverage_df, outlet_days = build_monthly_sheet(keys, names, months, sales, days)
+
+    return {
+        'monthly': monthly_df,
+        'coverage': coverage_df,
+        'outlet_days': outlet_days,
+        'engine': engine,
+        'rows_read': int(rows_read),
+        'date_format': date_format,
+        'invalid_dates': int(invalid_dates),
+    }, None
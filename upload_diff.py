@@ -0,0 +1,198 @@
+"""
+Change detection between consecutive uploads of the same workbook.
+
+Each upload is fingerprinted by hashing every outlet row's month values,
+keyed on the normalized outlet name. Comparing two fingerprints tells which
+outlets were added, removed or edited (and in which months), so a
+re-upload after fixing a few cells only recomputes the historical totals of
+the outlets that changed. The allocation diff against the previous run is
+built here too.
+"""
+
+import numpy as np
+import pandas as pd
+
+from allocation_backends import finish_contributions
+from allocation_core import CONTRIBUTION_COLUMNS, normalize_outlet_keys
+
+
+def numeric_months(df, month_cols):
+    """Month columns as floats, coerced the same way the allocation does."""
+    return df[month_cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+
+
+def fingerprint_upload(df, outlet_col, month_cols, outlet_index, file_hash):
+    """
+    Snapshot of an upload for later comparison (keeps a reference to df, no copy).
+
+    Returns: Dict with file_hash, outlet_col, month_cols, keys (normalized
+    outlet key per outlet row, TOTAL and blank names dropped) and df
+    """
+    keys = outlet_index['keys']
+    keys = keys[~outlet_index['total_mask'] & (keys != '')]
+    return {
+        'file_hash': file_hash,
+        'outlet_col': outlet_col,
+        'month_cols': list(month_cols),
+        'keys': keys,
+        'df': df,
+    }
+
+
+def hash_rows(snapshot, months):
+    """
+    Content hash of each outlet row over the given month columns.
+
+    Returns: Series of uint64 indexed by outlet key (first row per key)
+    """
+    keys = snapshot['keys']
+    if months:
+        values = numeric_months(snapshot['df'].loc[keys.index], months)
+        row_hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    else:
+        row_hashes = np.zeros(len(keys), dtype=np.uint64)
+    hashes = pd.Series(row_hashes, index=keys.to_numpy())
+    return hashes[~hashes.index.duplicated()]
+
+
+def diff_uploads(previous, current):
+    """
+    Compare two upload snapshots outlet by outlet.
+
+    Months present in only one upload are reported but not compared; when
+    the uploads share no month at all, every common outlet counts as edited.
+
+    Returns: Dict with
+    - changes: DataFrame Outlet Name, Changed Months, Previous Total,
+      New Total, Change (totals over the shared months)
+    - added / removed: Outlet names only in the new / previous upload
+    - months_added / months_removed
+    - changed_keys: Keys of edited and added outlets
+    - unchanged: Number of outlets with identical month values
+    - same_layout: Same month columns and unique outlet names in both, so
+      unchanged outlets' historical totals can be reused
+    - previous_file_hash
+    """
+    months = [m for m in current['month_cols'] if m in previous['month_cols']]
+    previous_hashes = hash_rows(previous, months)
+    current_hashes = hash_rows(current, months)
+
+    common = current_hashes.index.intersection(previous_hashes.index, sort=False)
+    if months:
+        edited = common[current_hashes[common].to_numpy() != previous_hashes[common].to_numpy()]
+    else:
+        edited = common
+    added = current_hashes.index.difference(previous_hashes.index, sort=False)
+    removed = previous_hashes.index.difference(current_hashes.index, sort=False)
+
+    def rows_by_key(snapshot, keys):
+        first_rows = snapshot['keys'][~snapshot['keys'].duplicated()]
+        labels = pd.Series(first_rows.index, index=first_rows.to_numpy())[keys]
+        return snapshot['df'].loc[labels.to_numpy()]
+
+    # ========== Which Months Changed per Edited Outlet ==========
+    previous_rows = rows_by_key(previous, edited)
+    current_rows = rows_by_key(current, edited)
+    previous_values = numeric_months(previous_rows, months).to_numpy(dtype=float)
+    current_values = numeric_months(current_rows, months).to_numpy(dtype=float)
+    differs = previous_values != current_values
+    month_names = np.array(months, dtype=object)
+
+    changes = pd.DataFrame({
+        'Outlet Name': current_rows[current['outlet_col']].astype(str).to_numpy(),
+        'Changed Months': [', '.join(month_names[row]) for row in differs],
+        'Previous Total': previous_values.sum(axis=1),
+        'New Total': current_values.sum(axis=1),
+    })
+    changes['Change'] = changes['New Total'] - changes['Previous Total']
+    changes = changes.reindex(changes['Change'].abs().sort_values(ascending=False).index).reset_index(drop=True)
+
+    has_duplicates = current['keys'].duplicated().any() or previous['keys'].duplicated().any()
+
+    return {
+        'changes': changes,
+        'added': rows_by_key(current, added)[current['outlet_col']].astype(str).tolist(),
+        'removed': rows_by_key(previous, removed)[previous['outlet_col']].astype(str).tolist(),
+        'months_added': [m for m in current['month_cols'] if m not in previous['month_cols']],
+        'months_removed': [m for m in previous['month_cols'] if m not in current['month_cols']],
+        'changed_keys': set(edited) | set(added),
+        'unchanged': len(common) - len(edited),
+        'same_layout': previous['month_cols'] == current['month_cols'] and not has_duplicates,
+        'previous_file_hash': previous['file_hash'],
+    }
+
+
+def update_historical_totals(previous_totals, df, month_cols, outlet_index, recompute_keys,
+                             excluded_keys, total_hist_days):
+    """
+    Contribution columns for a re-upload, reusing unchanged outlets' totals.
+
+    Only outlets in recompute_keys (or missing from previous_totals) have
+    their month columns summed again; daily averages and contribution % are
+    then derived for all shops exactly like allocation_backends does, so
+    the result matches a full recompute to the paisa.
+
+    previous_totals: Series Historical_Total_Sales indexed by outlet key
+    (unique keys, eligible shops of the previous run)
+
+    Returns: (contributions_df, recomputed_count) - contributions_df has
+    CONTRIBUTION_COLUMNS for every outlet row (0 for excluded outlets), as
+    accepted by calculate_allocations(contributions=...)
+    """
+    outlet_keys = outlet_index['keys'][~outlet_index['total_mask']]
+    shop_keys = outlet_keys[~outlet_keys.isin(list(excluded_keys))]
+
+    total_sales = shop_keys.map(previous_totals)
+    recompute = (shop_keys.isin(list(recompute_keys)) | total_sales.isna()).to_numpy()
+
+    if recompute.any():
+        rows = df.loc[shop_keys.index[recompute]]
+        # Months × shops summed along axis 0, the same order as the numpy backend
+        sales = np.zeros((max(len(month_cols), 1), len(rows)))
+        for row, col in enumerate(month_cols):
+            sales[row] = pd.to_numeric(rows[col], errors='coerce').fillna(0).to_numpy(dtype=float)
+        total_sales = total_sales.to_numpy(dtype=float)
+        total_sales[recompute] = sales.sum(axis=0)
+    else:
+        total_sales = total_sales.to_numpy(dtype=float)
+
+    computed = finish_contributions(total_sales, total_hist_days)
+
+    contributions = pd.DataFrame(0.0, index=outlet_keys.index, columns=CONTRIBUTION_COLUMNS)
+    contributions.loc[shop_keys.index, 'Historical_Total_Sales'] = computed['total_sales']
+    contributions.loc[shop_keys.index, 'Historical_Daily_Average'] = computed['daily_average']
+    contributions.loc[shop_keys.index, 'Contribution_%'] = computed['contribution']
+
+    return contributions, int(recompute.sum())
+
+
+def allocation_changes(previous_df, current_df, outlet_col, column='Allocated_Monthly_Target'):
+    """
+    Per-outlet change in an allocation column between two runs.
+
+    Outlets are matched by normalized name; outlets in only one run count
+    as 0 in the other.
+
+    Returns: DataFrame Outlet Name, Previous Target, New Target, Change for
+    outlets whose target moved, largest moves first
+    """
+    def by_key(frame):
+        keys = normalize_outlet_keys(frame[outlet_col])
+        values = pd.DataFrame({
+            'Outlet Name': frame[outlet_col].astype(str).to_numpy(),
+            'Target': frame[column].to_numpy(dtype=float),
+        }, index=keys.to_numpy())
+        return values[~values.index.duplicated()]
+
+    previous = by_key(previous_df)
+    current = by_key(current_df)
+    joined = current.join(previous, how='outer', lsuffix='_new', rsuffix='_previous')
+
+    changes = pd.DataFrame({
+        'Outlet Name': joined['Outlet Name_new'].fillna(joined['Outlet Name_previous']),
+        'Previous Target': joined['Target_previous'].fillna(0),
+        'New Target': joined['Target_new'].fillna(0),
+    })
+    changes['Change'] = (changes['New Target'] - changes['Previous Target']).round(2)
+    changes = changes[changes['Change'].abs() >= 0.01]
+    return changes.reindex(changes['Change'].abs().sort_values(ascending=False).index).reset_index(drop=True)